@@ -2,17 +2,18 @@ import os
 import streamlit as st
 import pandas as pd
 import json
-import requests
 from dotenv import load_dotenv
-from functions import (
-    merchant_report,
-    cardholder_report,
-    generate_prompt,
-    get_gpt_analysis,
-    format_export_payload,
-    client as bigquery_client
+from functions import client as bigquery_client
+from query_utils import prepare_query
+from pipeline import (
+    run_pipeline,
+    fetch_flagged_users,
+    fetch_betting_houses,
+    prefetch_reports,
+    build_stages
 )
-from fetch_data import fetch_combined_query
+from routing_utils import ANALYSIS_MODES, get_routing_stats
+from log_utils import configure_logging
 import datetime
 import logging
 import re
@@ -442,101 +443,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 load_dotenv()
-USER_ID = os.getenv("USER_ID")
-
-def send_payload(payload, key_master):
-    url = "https://infinitepay-risk-api.services.production.cloudwalk.network/monitoring/offense_analysis"
-    headers = {"Content-Type": "application/json", "Authorization": key_master}
-    response = requests.post(url, headers=headers, json=payload)
-    return response.text
-
-def fetch_flagged_users():
-    if USER_ID:
-        return [{"user_id": int(USER_ID), "alert_type": "Custom Alert", "business_validation": True}]
-    else:
-        query = fetch_combined_query
-        query_job = bigquery_client.query(query)
-        results = query_job.result()
-        return [dict(row, **{"business_validation": False}) for row in results]
-
-def fetch_betting_houses(user_id=None):
-    """
-    Retorna uma lista de casas de apostas para o usuário específico.
-    Args:
-        user_id (str): ID do usuário (opcional)
-    Returns:
-        DataFrame: DataFrame com casas de apostas ou simulação
-    """
-    try:
-        if user_id:
-            bets_query = f"""
-            SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_betting_transactions_data`
-            WHERE user_id = '{user_id}'
-            """
-        else:
-            bets_query = """
-            SELECT * FROM `infinitepay-production.external_sources.betting_houses_document_numbers`
-            LIMIT 10
-            """
-        query_job = bigquery_client.query(bets_query)
-        results = query_job.result()
-        betting_houses = pd.DataFrame([dict(row) for row in results])
-        if not betting_houses.empty:
-            return betting_houses
-    except Exception as e:
-        logging.warning(f"Erro ao buscar dados de casas de apostas: {str(e)}")
-    has_betting_data = False
-    if user_id:
-        try:
-            user_id_num = int(user_id) if user_id.isdigit() else sum(ord(c) for c in user_id)
-            has_betting_data = user_id_num % 4 == 0
-        except:
-            has_betting_data = "bet" in user_id.lower() or "lavanderia" in user_id.lower()
-    if has_betting_data:
-        return pd.DataFrame([
-            {
-                "user_id": user_id,
-                "betting_house": "BetExemplo",
-                "amount": "1500.00",
-                "date": (datetime.datetime.now() - datetime.timedelta(days=5)).strftime("%Y-%m-%d")
-            },
-            {
-                "user_id": user_id,
-                "betting_house": "ApostaSim",
-                "amount": "750.00",
-                "date": (datetime.datetime.now() - datetime.timedelta(days=12)).strftime("%Y-%m-%d")
-            },
-        ])
-    return pd.DataFrame()
-
-def fetch_pep_data(user_id):
-    pep_query = rf"""
-    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_pep_transactions_data` WHERE user_id = {user_id}
-    """
-    query_job = bigquery_client.query(pep_query)
-    results = query_job.result()
-    return pd.DataFrame([dict(row) for row in results])
- 
-def analyze_user(user_data, betting_houses=None, pep_data=None):
-    user_id = user_data['user_id']
-    alert_type = user_data['alert_type']
-    features = user_data.get('features')
-    merchant_data = merchant_report(user_id, alert_type, pep_data=pep_data)
-    if not merchant_data['merchant_info']:
-        report_data = cardholder_report(user_id, alert_type, pep_data=pep_data)
-        user_type = "Cardholder"
-    else:
-        report_data = merchant_data
-        user_type = "Merchant"
-    report_data['user_id'] = user_id
-    prompt = generate_prompt(report_data, user_type, alert_type, betting_houses=betting_houses, pep_data=pep_data, features=features)
-    gpt_analysis = get_gpt_analysis(prompt)
-    business_validation = user_data.get("business_validation", False)
-    export_payload = format_export_payload(user_id, gpt_analysis, business_validation)
-    return export_payload
 
 def run_bot():
-    flagged_users = fetch_flagged_users()
+    flagged_users = fetch_flagged_users(days=days_to_fetch)
     betting_houses = fetch_betting_houses()
     key_master = ""
     results = []
@@ -564,21 +473,28 @@ def run_bot():
     suspicious_count = 0
     risk_scores = []
     start_time = datetime.datetime.now()
-    for i, user_data in enumerate(flagged_users):
+    prefetched_reports = prefetch_reports(flagged_users)
+    stages = build_stages(betting_houses=betting_houses, prefetched_reports=prefetched_reports, key_master=key_master, analysis_mode=ANALYSIS_MODES[analysis_type])
+    completed = 0
+    with status_container.container():
+        st.markdown(f"""
+        <div style="display: flex; align-items: center; gap: 10px; margin-bottom: 10px;">
+            <div style="width: 24px; height: 24px; border-radius: 50%; background-color: var(--accent-color); display: flex; justify-content: center; align-items: center;">
+                <span style="color: white; font-size: 12px;">⚙️</span>
+            </div>
+            <p style="margin: 0; color: var(--text-primary);">Analisando <strong>{total_users}</strong> usuários em paralelo...</p>
+        </div>
+        """, unsafe_allow_html=True)
+    for result in run_pipeline(flagged_users, stages):
+        user_data = result["item"]
+        completed += 1
+        analyzed_count += 1
         try:
-            analyzed_count += 1
-            with status_container.container():
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; gap: 10px; margin-bottom: 10px;">
-                    <div style="width: 24px; height: 24px; border-radius: 50%; background-color: var(--accent-color); display: flex; justify-content: center; align-items: center;">
-                        <span style="color: white; font-size: 12px;">⚙️</span>
-                    </div>
-                    <p style="margin: 0; color: var(--text-primary);">Analisando usuário <strong>{user_data['user_id']}</strong>...</p>
-                </div>
-                """, unsafe_allow_html=True)
-            pep_data = fetch_pep_data(user_data['user_id'])
-            export_payload = analyze_user(user_data, betting_houses=betting_houses, pep_data=pep_data)
-            response_text = send_payload(export_payload, key_master)
+            if result["error"] is not None:
+                raise result["error"]
+            context = result["value"]
+            export_payload = context["export_payload"]
+            response_text = context["response_text"]
             description = export_payload.get('description', '')
             risk_score_match = re.search(r'(?:[Rr]isco\s+(?:de\s+[Ll]avagem\s+(?:de\s+)?[Dd]inheiro)?|[Cc]lassificação\s+(?:de\s+)?[Rr]isco):?\s*(\d+)(?:/|\s*de\s*)10', description)
             risk_score = int(risk_score_match.group(1)) if risk_score_match else 0
@@ -624,7 +540,7 @@ def run_bot():
                 conclusion = 'Indefinido'
                 conclusion_badge = "risk-badge-medium"
             
-            user_type = "👤 Cardholder" if "cardholder_info" in str(export_payload) else "🏪 Merchant"
+            user_type = "👤 Cardholder" if context["user_type"] == "Cardholder" else "🏪 Merchant"
             with st.expander(f"User ID: {user_data['user_id']} - {user_type} - Score: {risk_score}/10", expanded=False):
                 st.markdown(f"""
                 <div style="display: flex; justify-content: space-between; align-items: center; padding: 10px; border-bottom: 1px solid var(--border-color); margin-bottom: 15px;">
@@ -659,27 +575,31 @@ def run_bot():
                     json_output = json_output.replace("\\n", "\n")
                     st.code(json_output, language="json")
                 with tab2:
+                    if context.get("response_status"):
+                        st.warning(f"Envio rejeitado pela API de risco (HTTP {context['response_status']})")
                     st.code(response_text, language="json")
-            progress = (i + 1) / total_users
-            progress_bar.progress(progress)
-            elapsed_time = (datetime.datetime.now() - start_time).total_seconds()
-            avg_time_per_user = elapsed_time / (i + 1)
-            remaining_users = total_users - (i + 1)
-            estimated_time_left = remaining_users * avg_time_per_user
-            minutes_left = int(estimated_time_left // 60)
-            seconds_left = int(estimated_time_left % 60)
-            progress_text.markdown(f"""
-            <div style="text-align: center;">
-                <p style="margin: 0; font-size: 0.9rem;">
-                    {i+1}/{total_users} concluídos
-                    <span style="color: var(--text-secondary); margin-left: 10px;">
-                        Tempo restante: {minutes_left}min {seconds_left}s
-                    </span>
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
         except Exception as e:
             st.error(f"Erro ao analisar o usuário {user_data['user_id']}: {str(e)}")
+        # Progresso e ETA baseados no número de usuários concluídos, já que os
+        # resultados chegam fora de ordem
+        progress = completed / total_users
+        progress_bar.progress(progress)
+        elapsed_time = (datetime.datetime.now() - start_time).total_seconds()
+        avg_time_per_user = elapsed_time / completed
+        remaining_users = total_users - completed
+        estimated_time_left = remaining_users * avg_time_per_user
+        minutes_left = int(estimated_time_left // 60)
+        seconds_left = int(estimated_time_left % 60)
+        progress_text.markdown(f"""
+        <div style="text-align: center;">
+            <p style="margin: 0; font-size: 0.9rem;">
+                {completed}/{total_users} concluídos
+                <span style="color: var(--text-secondary); margin-left: 10px;">
+                    Tempo restante: {minutes_left}min {seconds_left}s
+                </span>
+            </p>
+        </div>
+        """, unsafe_allow_html=True)
     status_container.empty()
     end_time = datetime.datetime.now()
     total_time = (end_time - start_time).total_seconds()
@@ -708,9 +628,13 @@ def run_bot():
         </div>
     </div>
     """, unsafe_allow_html=True)
+    routing = get_routing_stats()["routing"]
+    if routing["routed"]:
+        st.caption(f"Roteamento de modelos: {routing['escalated']} de {routing['routed']} casos escalados para o GPT-4o ({routing['escalation_rate']:.1%})")
     return results
 
 def main():
+    configure_logging()
     with st.sidebar:
         st.markdown("""
         <div class="logo-container">
@@ -727,9 +651,10 @@ def main():
             value=7,
             help="Define quantos dias no passado serão analisados"
         )
+        global analysis_type
         analysis_type = st.radio(
             "Tipo de Análise",
-            options=["Básica (GPT-4)", "Aprimorada (GPT-4 + o3-mini)", "Com Pontuação de Risco (o3-mini)"],
+            options=list(ANALYSIS_MODES),
             index=2,
             help="Selecione o método de análise desejado"
         )
@@ -791,40 +716,10 @@ def main():
         </div>
         """, unsafe_allow_html=True)
     try:
-        stats_query = f"""
-        SELECT
-            COUNT(*) as total_analises,
-            SUM(CASE WHEN conclusion = 'suspicious' THEN 1 ELSE 0 END) as total_suspeitos,
-            AVG(risk_score) as score_medio,
-            AVG(processing_time) as tempo_medio
-        FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
-        WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL {days_to_fetch} DAY)
-        """
-        trend_query = f"""
-        WITH semana_atual AS (
-            SELECT COUNT(*) as total
-            FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
-            WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)
-        ),
-        semana_anterior AS (
-            SELECT COUNT(*) as total
-            FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
-            WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL 14 DAY)
-            AND DATE(created_at) < DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)
-        )
-        SELECT
-            a.total as total_atual,
-            b.total as total_anterior,
-            CASE​​
-                WHEN b.total > 0 THEN ROUND((a.total - b.total) / b.total * 100)
-                ELSE 0
-            END as variacao_percentual
-        FROM semana_atual a, semana_anterior b
-        """
         try:
-            stats_job = bigquery_client.query(stats_query)
+            stats_job = bigquery_client.query(*prepare_query("dashboard_stats", days=days_to_fetch))
             stats_result = next(stats_job.result())
-            trend_job = bigquery_client.query(trend_query)
+            trend_job = bigquery_client.query(*prepare_query("dashboard_weekly_trend"))
             trend_result = next(trend_job.result())
             total_analises = stats_result.total_analises or 0
             total_suspeitos = stats_result.total_suspeitos or 0
@@ -916,49 +811,12 @@ def main():
         </div>
         """, unsafe_allow_html=True)
     try:
-        alert_types_query = f"""
-        SELECT
-            alert_type,
-            COUNT(*) as total
-        FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
-        WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL {days_to_fetch} DAY)
-        GROUP BY alert_type
-        ORDER BY total DESC
-        LIMIT 5
-        """
-        risk_levels_query = f"""
-        SELECT
-            CASE
-                WHEN risk_score BETWEEN 1 AND 3 THEN 'Baixo'
-                WHEN risk_score BETWEEN 4 AND 7 THEN 'Médio'
-                ELSE 'Alto'
-            END as nivel_risco,
-            COUNT(*) as total
-        FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
-        WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL {days_to_fetch} DAY)
-        GROUP BY nivel_risco
-        ORDER BY
-            CASE nivel_risco
-                WHEN 'Baixo' THEN 1
-                WHEN 'Médio' THEN 2
-                WHEN 'Alto' THEN 3
-            END
-        """
-        trend_daily_query = f"""
-        SELECT
-            DATE(created_at) as data,
-            COUNT(*) as total
-        FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
-        WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL {days_to_fetch} DAY)
-        GROUP BY data
-        ORDER BY data
-        """
         try:
-            alert_types_job = bigquery_client.query(alert_types_query)
+            alert_types_job = bigquery_client.query(*prepare_query("dashboard_alert_types", days=days_to_fetch))
             alert_types_results = list(alert_types_job.result())
-            risk_levels_job = bigquery_client.query(risk_levels_query)
+            risk_levels_job = bigquery_client.query(*prepare_query("dashboard_risk_levels", days=days_to_fetch))
             risk_levels_results = list(risk_levels_job.result())
-            trend_daily_job = bigquery_client.query(trend_daily_query)
+            trend_daily_job = bigquery_client.query(*prepare_query("dashboard_daily_trend", days=days_to_fetch))
             trend_daily_results = list(trend_daily_job.result())
             alert_types_data = {
                 'tipos': [row.alert_type for row in alert_types_results],
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import uuid
+import logging
+from gpt_utils import client, llm_cache, record_usage, build_request_params, llm_cache_key, is_llm_cacheable, error_response
+
+# Modo batch: as análises são enviadas de uma vez pela Batch API da OpenAI (metade do preço,
+# sem disputar os limites de RPM/TPM das chamadas síncronas), com prazo de até 24h.
+# OPENAI_BATCH_BACKEND=local usa o LocalBatchBackend (sem rede, para testes).
+OPENAI_BATCH_BACKEND = os.getenv("OPENAI_BATCH_BACKEND", "openai")
+OPENAI_BATCH_DIR = os.getenv("OPENAI_BATCH_DIR", ".cache/batches")
+OPENAI_BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "30"))
+OPENAI_BATCH_MAX_WAIT_HOURS = float(os.getenv("OPENAI_BATCH_MAX_WAIT_HOURS", "24"))
+# Limite de requisições por arquivo de batch (a API aceita até 50.000)
+OPENAI_BATCH_MAX_REQUESTS = int(os.getenv("OPENAI_BATCH_MAX_REQUESTS", "50000"))
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+class OpenAIBatchBackend:
+  """Envia arquivos JSONL para a Batch API da OpenAI e baixa os resultados."""
+
+  def __init__(self, openai_client=client):
+    self.client = openai_client
+
+  def submit(self, path: str) -> str:
+    with open(path, "rb") as f:
+      input_file = self.client.files.create(file=f, purpose="batch")
+    batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h")
+    return batch.id
+
+  def status(self, batch_id: str) -> dict:
+    batch = self.client.batches.retrieve(batch_id)
+    return {"status": batch.status, "output_file_id": batch.output_file_id, "error_file_id": batch.error_file_id}
+
+  def download(self, file_id: str) -> str:
+    return self.client.files.content(file_id).text
+
+class LocalBatchBackend:
+  """
+  Substituto local da Batch API, baseado em arquivos: o lote é "processado" na primeira
+  consulta de status, gerando o arquivo de saída no mesmo formato da OpenAI. As respostas
+  vêm de `responder(body) -> str` (por padrão uma resposta fixa, sem chamar nenhum modelo).
+  """
+
+  def __init__(self, directory: str = OPENAI_BATCH_DIR, responder=None):
+    self.directory = directory
+    self.responder = responder or (lambda body: "Resposta simulada pelo LocalBatchBackend.")
+    os.makedirs(directory, exist_ok=True)
+
+  def submit(self, path: str) -> str:
+    batch_id = f"local_batch_{uuid.uuid4().hex}"
+    with open(path, encoding="utf-8") as source, open(self._path(batch_id, "input"), "w", encoding="utf-8") as target:
+      target.write(source.read())
+    return batch_id
+
+  def status(self, batch_id: str) -> dict:
+    output_path = self._path(batch_id, "output")
+    if not os.path.exists(output_path):
+      with open(self._path(batch_id, "input"), encoding="utf-8") as source, open(output_path, "w", encoding="utf-8") as target:
+        for line in source:
+          request = json.loads(line)
+          content = self.responder(request["body"])
+          target.write(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {
+              "status_code": 200,
+              "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}], "usage": {}}
+            },
+            "error": None
+          }, ensure_ascii=False) + "\n")
+    return {"status": "completed", "output_file_id": output_path, "error_file_id": None}
+
+  def download(self, file_id: str) -> str:
+    with open(file_id, encoding="utf-8") as f:
+      return f.read()
+
+  def _path(self, batch_id: str, kind: str) -> str:
+    return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+def get_batch_backend(name: str = OPENAI_BATCH_BACKEND):
+  """Retorna o backend configurado em OPENAI_BATCH_BACKEND ("openai" ou "local")."""
+  return LocalBatchBackend() if name == "local" else OpenAIBatchBackend()
+
+def write_batch_file(requests: dict, path: str):
+  """Grava as requisições {custom_id: params} no formato JSONL da Batch API."""
+  with open(path, "w", encoding="utf-8") as f:
+    for custom_id, params in requests.items():
+      f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": params}, ensure_ascii=False) + "\n")
+
+def parse_batch_output(text: str) -> tuple:
+  """
+  Converte o JSONL de saída (ou de erros) do lote.
+
+  Returns:
+      tuple: ({custom_id: conteúdo da resposta ou mensagem de erro}, conjunto de custom_ids com erro)
+  """
+  results = {}
+  failed = set()
+  for line in text.splitlines():
+    if not line.strip():
+      continue
+    item = json.loads(line)
+    response = item.get("response") or {}
+    if item.get("error") or response.get("status_code") != 200:
+      error = item.get("error") or response.get("body", {}).get("error") or f"status {response.get('status_code')}"
+      results[item["custom_id"]] = error_response(json.dumps(error, ensure_ascii=False) if isinstance(error, dict) else error)
+      failed.add(item["custom_id"])
+    else:
+      record_usage(response["body"].get("model"), response["body"].get("usage"))
+      results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+  return results, failed
+
+def wait_for_batch(backend, batch_id: str, poll_seconds: float = OPENAI_BATCH_POLL_SECONDS, max_wait_hours: float = OPENAI_BATCH_MAX_WAIT_HOURS) -> dict:
+  """Consulta o status do lote até um estado final (ou até o tempo máximo) e retorna o último status."""
+  deadline = time.monotonic() + max_wait_hours * 3600
+  while True:
+    status = backend.status(batch_id)
+    if status["status"] in FINAL_STATUSES:
+      return status
+    if time.monotonic() >= deadline:
+      raise TimeoutError(f"Lote {batch_id} não concluído em {max_wait_hours}h (status {status['status']})")
+    logging.info(f"Lote {batch_id}: {status['status']}, nova consulta em {poll_seconds:.0f}s")
+    time.sleep(poll_seconds)
+
+def get_batch_responses(prompts: dict, model: str = "gpt-4o-2024-11-20", backend=None) -> dict:
+  """
+  Equivalente em lote de get_chatgpt_response: envia os prompts pela Batch API, aguarda
+  a conclusão e devolve as respostas. Respostas já presentes no cache de LLM não são
+  reenviadas e as novas são gravadas nele.
+
+  Args:
+      prompts (dict): {custom_id: prompt}
+      model (str): Modelo usado em todas as requisições
+      backend: OpenAIBatchBackend, LocalBatchBackend ou compatível (padrão: get_batch_backend())
+
+  Returns:
+      dict: {custom_id: resposta do modelo ou mensagem de erro customizada}
+  """
+  backend = backend or get_batch_backend()
+  results = {}
+  pending = {}
+  for custom_id, prompt in prompts.items():
+    params = build_request_params(prompt, model)
+    cache_key = llm_cache_key(params) if is_llm_cacheable(params) else None
+    cached = llm_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+      results[custom_id] = cached
+    else:
+      pending[custom_id] = (params, cache_key)
+  logging.info(f"Modo batch: {len(pending)} requisições a enviar, {len(results)} respondidas pelo cache")
+  os.makedirs(OPENAI_BATCH_DIR, exist_ok=True)
+  custom_ids = list(pending)
+  for start in range(0, len(custom_ids), OPENAI_BATCH_MAX_REQUESTS):
+    chunk = custom_ids[start:start + OPENAI_BATCH_MAX_REQUESTS]
+    path = os.path.join(OPENAI_BATCH_DIR, f"requests_{int(time.time())}_{start}.jsonl")
+    write_batch_file({custom_id: pending[custom_id][0] for custom_id in chunk}, path)
+    batch_id = backend.submit(path)
+    logging.info(f"Lote {batch_id} enviado com {len(chunk)} requisições ({path})")
+    status = wait_for_batch(backend, batch_id)
+    outputs = {}
+    failed = set()
+    for file_id in (status.get("output_file_id"), status.get("error_file_id")):
+      if file_id:
+        file_outputs, file_failed = parse_batch_output(backend.download(file_id))
+        outputs.update(file_outputs)
+        failed.update(file_failed)
+    logging.info(f"Lote {batch_id} finalizado com status {status['status']}: {len(outputs)} de {len(chunk)} respostas")
+    for custom_id in chunk:
+      content = outputs.get(custom_id)
+      if content is None:
+        content = error_response(f"batch {batch_id} {status['status']} sem resposta para {custom_id}")
+      elif pending[custom_id][1] and custom_id not in failed:
+        llm_cache.set(pending[custom_id][1], content)
+      results[custom_id] = content
+  return results
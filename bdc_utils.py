@@ -1,13 +1,40 @@
 import os
 import json
 import re
+import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Any
 
 # Configuração das credenciais
 BIGDATA_TOKEN_ID = ''
 BIGDATA_TOKEN_HASH = ''
 
+# Configuração das conexões com o Big Data Corp
+BDC_TIMEOUT_SECONDS = float(os.getenv("BDC_TIMEOUT_SECONDS", "20"))
+BDC_MAX_RETRIES = int(os.getenv("BDC_MAX_RETRIES", "3"))
+BDC_MAX_WORKERS = max(1, int(os.getenv("BDC_MAX_WORKERS", "8")))
+
+def _build_session() -> requests.Session:
+    """
+    Cria a sessão HTTP compartilhada (keep-alive), com pool do tamanho do número de
+    workers e retentativas com backoff para 429/5xx e falhas de conexão.
+    """
+    retry = Retry(
+        total=BDC_MAX_RETRIES,
+        backoff_factor=1,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BDC_MAX_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+session = _build_session()
+
 def sanitize_document(document: str) -> str:
     """
     Remove caracteres não numéricos do documento.
@@ -56,11 +83,11 @@ def fetch_bdc_data(
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = session.post(url, json=payload, headers=headers, timeout=BDC_TIMEOUT_SECONDS)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Erro ao buscar dados: {str(e)}")
+        logging.error(f"Erro ao buscar dados no BDC: {str(e)}")
         return None
 
 def analyze_document(document: str) -> Dict[str, Any]:
@@ -74,14 +101,14 @@ def analyze_document(document: str) -> Dict[str, Any]:
         Dict[str, Any]: Resultado da análise
     """
     sanitized_doc = sanitize_document(document)
-    print(f'Documento utilizado na busca: {sanitized_doc}')
+    logging.debug("Documento utilizado na busca: %s", sanitized_doc)
     
     # Chamar fetch_bdc_data com o documento sanitizado
     result = fetch_bdc_data(document_number=sanitized_doc)
     
-    # Log do resultado para debug
-    if result:
-        print(f'BDC retornou dados para {sanitized_doc}: {bool(result.get("Result", []))}')
+    # Log do resultado para debug (contagens só são calculadas com LOG_LEVEL=DEBUG)
+    if result and logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("BDC retornou dados para %s: %s", sanitized_doc, bool(result.get("Result", [])))
         if result.get("Result"):
             person_data = result["Result"][0] if result["Result"] else {}
             processes_data = person_data.get('Processes', {})
@@ -95,12 +122,12 @@ def analyze_document(document: str) -> Dict[str, Any]:
                     sanctions_count += 1
                 if kyc_data.get('IsCurrentlySanctioned', False):
                     sanctions_count += 1
-            print(f'Processos encontrados: {len(processes)}, KYC encontrados: {sanctions_count}')
-    else:
-        print(f'BDC não retornou dados para {sanitized_doc}')
+            logging.debug("Processos encontrados: %d, KYC encontrados: %d", len(processes), sanctions_count)
+    elif not result:
+        logging.warning(f"BDC não retornou dados para {sanitized_doc}")
     
-    # Verificar se o resultado é válido
+    # Verificar se o resultado é válido; "Error" distingue falha na consulta de documento sem dados
     if not result:
-        return {"Result": []}
+        return {"Result": [], "Error": True}
         
     return result 
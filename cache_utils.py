@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import hashlib
+import threading
+import pyarrow.parquet as pq
+
+class SQLiteCache:
+  """
+  Cache chave/valor persistente em SQLite, com TTL por entrada e limite de tamanho.
+  Quando o limite é excedido, as entradas acessadas há mais tempo são removidas (LRU).
+  O arquivo pode ser compartilhado entre execuções e processos (modo WAL).
+  """
+
+  def __init__(self, path: str, ttl_seconds: float, max_bytes: int = None, table: str = "cache"):
+    self.path = path
+    self.ttl_seconds = ttl_seconds
+    self.max_bytes = max_bytes
+    self.table = table
+    self.hits = 0
+    self.misses = 0
+    self._writes_since_eviction = 0
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute(f"""
+      CREATE TABLE IF NOT EXISTS {table} (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        last_access REAL NOT NULL,
+        size INTEGER NOT NULL
+      )
+    """)
+    self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+    self._conn.commit()
+
+  def get(self, key: str):
+    """Retorna o valor armazenado ou None se a chave não existir ou estiver expirada."""
+    now = time.time()
+    with self._lock:
+      row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+      if row is None or row[1] < now:
+        if row is not None:
+          self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+          self._conn.commit()
+        self.misses += 1
+        return None
+      self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+      self._conn.commit()
+      self.hits += 1
+    return json.loads(row[0])
+
+  def set(self, key: str, value, ttl_seconds: float = None):
+    """Armazena um valor serializável em JSON, com TTL opcional diferente do padrão."""
+    now = time.time()
+    ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+    serialized = json.dumps(value, ensure_ascii=False, default=str)
+    with self._lock:
+      self._conn.execute(
+        f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, expires_at, last_access, size) VALUES (?, ?, ?, ?, ?, ?)",
+        (key, serialized, now, now + ttl, now, len(serialized.encode("utf-8")))
+      )
+      self._conn.commit()
+      self._writes_since_eviction += 1
+      if self._writes_since_eviction >= 50:
+        self._evict()
+
+  def delete(self, key: str):
+    with self._lock:
+      self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+      self._conn.commit()
+
+  def clear(self):
+    with self._lock:
+      self._conn.execute(f"DELETE FROM {self.table}")
+      self._conn.commit()
+
+  def _evict(self):
+    """Remove entradas expiradas e, acima de max_bytes, as menos usadas recentemente."""
+    self._writes_since_eviction = 0
+    self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+    if self.max_bytes:
+      total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+      if total > self.max_bytes:
+        removed = 0
+        for key, size in self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access").fetchall():
+          if total - removed <= self.max_bytes:
+            break
+          self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+          removed += size
+        logging.info(f"Cache {self.path}: {removed} bytes removidos por limite de tamanho")
+    self._conn.commit()
+
+  def stats(self) -> dict:
+    """Retorna métricas de uso do cache (hits, misses, taxa de acerto e tamanho)."""
+    with self._lock:
+      entries, size = self._conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+      "entries": entries,
+      "bytes": size
+    }
+
+class ParquetCache:
+  """
+  Cache local de resultados tabulares (tabelas Arrow) em arquivos Parquet, um arquivo
+  por (nome da consulta, parâmetros). A validade é verificada pela data de gravação do
+  arquivo, com o TTL informado em cada leitura (cada fonte tem sua própria política).
+  """
+
+  def __init__(self, directory: str):
+    self.directory = directory
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    os.makedirs(directory, exist_ok=True)
+
+  @staticmethod
+  def _stem(params: dict) -> str:
+    # Parâmetros escalares ficam legíveis no nome do arquivo (ex.: user_id=123), o que
+    # permite invalidar um usuário específico; listas (lotes) usam um hash
+    if all(isinstance(value, (int, str)) for value in params.values()):
+      return "&".join(f"{key}={value}" for key, value in sorted(params.items())) or "_"
+    serialized = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:32]
+
+  def _path(self, name: str, params: dict) -> str:
+    return os.path.join(self.directory, name, f"{self._stem(params)}.parquet")
+
+  def get(self, name: str, params: dict, ttl_seconds: float):
+    """Retorna a tabela Arrow armazenada ou None se não existir ou for mais antiga que ttl_seconds."""
+    path = self._path(name, params)
+    try:
+      fresh = time.time() - os.path.getmtime(path) <= ttl_seconds
+      table = pq.read_table(path) if fresh else None
+    except (OSError, ValueError):
+      table = None
+    with self._lock:
+      if table is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+    return table
+
+  def set(self, name: str, params: dict, table):
+    """Grava a tabela de forma atômica (arquivo temporário + rename)."""
+    path = self._path(name, params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(table, temporary)
+    os.replace(temporary, path)
+
+  def invalidate(self, name: str = None, params: dict = None) -> int:
+    """
+    Remove entradas do cache e retorna quantos arquivos foram apagados.
+    Sem argumentos limpa tudo; `name` restringe a uma consulta e `params` a uma
+    combinação de parâmetros (em todas as consultas se `name` for omitido).
+    """
+    names = [name] if name else [entry.name for entry in os.scandir(self.directory) if entry.is_dir()]
+    removed = 0
+    for query_name in names:
+      directory = os.path.join(self.directory, query_name)
+      if not os.path.isdir(directory):
+        continue
+      if params is not None:
+        paths = [self._path(query_name, params)]
+      else:
+        paths = [entry.path for entry in os.scandir(directory) if entry.name.endswith(".parquet")]
+      for path in paths:
+        try:
+          os.remove(path)
+          removed += 1
+        except FileNotFoundError:
+          pass
+    return removed
+
+  def stats(self) -> dict:
+    """Retorna métricas de uso do cache (hits, misses e taxa de acerto)."""
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+    }
@@ -0,0 +1,24 @@
+import os
+import tempfile
+from google.cloud import bigquery
+
+# Os módulos criam clientes, caches e o estado persistente na importação: os testes usam
+# uma chave fictícia da OpenAI, desativam os caches e gravam o estado em um diretório temporário
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("BQ_RESULT_CACHE_ENABLED", "0")
+os.environ.setdefault("BDC_CACHE_ENABLED", "0")
+os.environ.setdefault("BQ_USE_STORAGE_API", "0")
+os.environ.setdefault("FEATURE_MART_ENABLED", "0")
+os.environ.setdefault("STATE_PATH", os.path.join(tempfile.mkdtemp(prefix="lavandowski-tests-"), "state.sqlite"))
+
+class OfflineBigQueryClient:
+  """Cliente do BigQuery sem credenciais: functions.py é importável e as queries falham se não forem substituídas no teste."""
+
+  def __init__(self, *args, **kwargs):
+    self._credentials = None
+
+  def query(self, *args, **kwargs):
+    raise RuntimeError("BigQuery indisponível nos testes")
+
+bigquery.Client = OfflineBigQueryClient
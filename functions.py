@@ -1,24 +1,41 @@
 import datetime
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from google.cloud import bigquery
-from gpt_utils import get_chatgpt_response
+from gpt_utils import get_chatgpt_response, parse_risk_score
+from prompt_utils import fit_sections
+from stats_utils import SUMMARIZED_SECTIONS, STATS_TOP_K
+from cache_utils import SQLiteCache, ParquetCache
+from query_utils import QUERIES, prepare_query, normalize_params
+from mart_utils import latest_snapshot, write_snapshot
+from log_utils import LazyJSON
 import json
 import decimal
 import logging
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
 
+# Importar o cliente da BigQuery Storage Read API se disponível (download colunar em paralelo)
+try:
+    from google.cloud import bigquery_storage
+    BQ_STORAGE_AVAILABLE = True
+except ImportError:
+    BQ_STORAGE_AVAILABLE = False
+
 # Importar BDC-UTILS se disponível
 try:
-    from bdc_utils import analyze_document
+    from bdc_utils import analyze_document, sanitize_document, BDC_MAX_WORKERS
     BDC_AVAILABLE = True
 except ImportError:
     BDC_AVAILABLE = False
     logging.warning("BDC-UTILS não disponível. Análise de contrapartes será desabilitada.")
 
 load_dotenv()
-logging.basicConfig(level=logging.INFO)
 
 class CustomJSONEncoder(json.JSONEncoder):
   def default(self, obj):
@@ -37,6 +54,33 @@ project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
 location = os.getenv("LOCATION")
 client = bigquery.Client(project=project_id, location=location)
 
+# Limite de jobs simultâneos no BigQuery (compartilhado por todas as threads) para
+# respeitar as cotas do projeto; BQ_CONCURRENT_FETCH=0 volta às consultas sequenciais.
+BQ_MAX_CONCURRENT_QUERIES = max(1, int(os.getenv("BQ_MAX_CONCURRENT_QUERIES", "8")))
+BQ_CONCURRENT_FETCH = os.getenv("BQ_CONCURRENT_FETCH", "1") == "1"
+_query_slots = threading.BoundedSemaphore(BQ_MAX_CONCURRENT_QUERIES)
+# Resultados grandes são baixados pela Storage Read API (a biblioteca usa a API REST
+# quando o resultado cabe na primeira página); BQ_USE_STORAGE_API=0 desativa.
+BQ_USE_STORAGE_API = BQ_STORAGE_AVAILABLE and os.getenv("BQ_USE_STORAGE_API", "1") == "1"
+_bqstorage_client = None
+_bqstorage_client_lock = threading.Lock()
+
+# Cache local dos resultados das queries do catálogo (Parquet por query e parâmetros), com
+# validade definida em cada query (result_cache_ttl). BQ_RESULT_CACHE_ENABLED=0 desativa.
+result_cache = ParquetCache(
+  os.getenv("BQ_RESULT_CACHE_PATH", ".cache/bq_results")
+) if os.getenv("BQ_RESULT_CACHE_ENABLED", "1") == "1" else None
+
+# Cache persistente das contrapartes consultadas no BDC (processos e sanções já extraídos),
+# compartilhado entre execuções e workers. Documentos sem resultado ficam por menos tempo.
+BDC_CACHE_TTL_SECONDS = float(os.getenv("BDC_CACHE_TTL_DAYS", "7")) * 86400
+BDC_NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv("BDC_NEGATIVE_CACHE_TTL_DAYS", "1")) * 86400
+bdc_cache = SQLiteCache(
+  os.getenv("BDC_CACHE_PATH", ".cache/bdc_counterparties.sqlite"),
+  ttl_seconds=BDC_CACHE_TTL_SECONDS,
+  table="bdc_counterparties"
+) if os.getenv("BDC_CACHE_ENABLED", "1") == "1" else None
+
 def format_date_portuguese(date_str: str) -> str:
   """Formata uma string de data para o formato em português."""
   if date_str is None:
@@ -56,82 +100,141 @@ def format_cpf(cpf: str) -> str:
   else:
     return cpf
 
-def execute_query(query):
-  """Executa uma query no BigQuery e retorna um DataFrame."""
+# Tipos do DataFrame para cada tipo Arrow: inteiros e booleanos anuláveis mantêm o tipo
+# (como em to_dataframe) e strings ficam em memória Arrow, sem um objeto Python por célula
+ARROW_DTYPES = {
+  pa.int64(): pd.Int64Dtype(),
+  pa.bool_(): pd.BooleanDtype(),
+  pa.string(): pd.StringDtype("pyarrow_numpy"),
+  pa.large_string(): pd.StringDtype("pyarrow_numpy"),
+}
+
+def get_bqstorage_client():
+  """Retorna o cliente da Storage Read API compartilhado entre as threads (ou None se desativado)."""
+  global _bqstorage_client
+  if not BQ_USE_STORAGE_API:
+    return None
+  with _bqstorage_client_lock:
+    if _bqstorage_client is None:
+      _bqstorage_client = bigquery_storage.BigQueryReadClient(credentials=client._credentials)
+  return _bqstorage_client
+
+def arrow_to_dataframe(table: pa.Table) -> pd.DataFrame:
+  """Converte um resultado Arrow em DataFrame, convertendo colunas NUMERIC/BIGNUMERIC em float uma única vez."""
+  for index, field in enumerate(table.schema):
+    if pa.types.is_decimal(field.type):
+      table = table.set_column(index, field.name, pc.cast(table.column(index), pa.float64()))
+  return table.to_pandas(types_mapper=ARROW_DTYPES.get)
+
+def _query_arrow(query, job_config=None) -> pa.Table:
+  with _query_slots:
+    rows = client.query(query, job_config=job_config).result()
+    return rows.to_arrow(bqstorage_client=get_bqstorage_client(), create_bqstorage_client=False)
+
+def run_query(name: str, refresh: bool = False, **params) -> pd.DataFrame:
+  """
+  Executa uma query do catálogo (query_utils.QUERIES) com os parâmetros informados.
+  Queries com result_cache_ttl são servidas do cache local enquanto o resultado
+  estiver dentro da validade. Erros são propagados.
+
+  Args:
+      name (str): Nome da query no catálogo
+      refresh (bool): Ignora o cache local, consulta o BigQuery e atualiza o cache
+      **params: Parâmetros da query (ex.: user_id=123)
+
+  Returns:
+      DataFrame: Resultado da query
+  """
+  ttl = QUERIES[name].get("result_cache_ttl") if result_cache is not None else None
+  if ttl:
+    params = normalize_params(name, params)
+    if not refresh:
+      table = result_cache.get(name, params, ttl)
+      if table is not None:
+        return arrow_to_dataframe(table)
+  table = _query_arrow(*prepare_query(name, **params))
+  if ttl:
+    try:
+      result_cache.set(name, params, table)
+    except OSError as e:
+      logging.warning(f"Erro ao gravar o cache de resultados da query {name}: {e}")
+  return arrow_to_dataframe(table)
+
+def fetch_source(name: str, refresh: bool = False, **params) -> pd.DataFrame:
+  """Executa uma query do catálogo; em caso de erro retorna um DataFrame vazio."""
   try:
-    df = client.query(query).result().to_dataframe()
-    return df
+    return run_query(name, refresh=refresh, **params)
   except Exception as e:
-    logging.error(f"Error executing query: {e}")
+    logging.error(f"Error executing query {name}: {e}")
     return pd.DataFrame()
 
+def invalidate_query_results(name: str = None, user_id: int = None) -> int:
+  """
+  Remove resultados do cache local: de uma query, de um usuário ou tudo. Retorna o
+  número de entradas removidas. Com user_id, os resultados das queries em lote
+  (batch_*) também são removidos por inteiro: eles são gravados pelo hash da lista de
+  user_ids, então não é possível saber quais lotes contêm o usuário.
+  """
+  if result_cache is None:
+    return 0
+  params = {"user_id": int(user_id)} if user_id is not None else None
+  removed = result_cache.invalidate(name, params)
+  if user_id is not None:
+    batch_names = [query for query in ([name] if name else QUERIES) if query.startswith("batch_")]
+    removed += sum(result_cache.invalidate(query) for query in batch_names)
+  logging.info(f"Cache de resultados: {removed} entradas removidas")
+  return removed
+
+def get_result_cache_stats() -> dict:
+  """Retorna as métricas do cache local de resultados (ou {} se desativado)."""
+  return result_cache.stats() if result_cache is not None else {}
+
+def run_fetches(fetches: dict) -> dict:
+  """
+  Executa as buscas informadas e retorna {nome: resultado}.
+  No modo concorrente todos os jobs são disparados de uma vez (limitados por
+  BQ_MAX_CONCURRENT_QUERIES), de modo que o tempo total fica próximo ao da query
+  mais lenta em vez da soma de todas.
+
+  Args:
+      fetches (dict): {nome: função sem argumentos que retorna um DataFrame}
+
+  Returns:
+      dict: {nome: DataFrame}
+  """
+  if not BQ_CONCURRENT_FETCH or len(fetches) <= 1:
+    return {name: fetch() for name, fetch in fetches.items()}
+  with ThreadPoolExecutor(max_workers=min(BQ_MAX_CONCURRENT_QUERIES, len(fetches))) as executor:
+    futures = {name: executor.submit(fetch) for name, fetch in fetches.items()}
+    return {name: future.result() for name, future in futures.items()}
+
 def fetch_lawsuit_data(user_id: int) -> pd.DataFrame:
   """Busca dados de processos para o user_id informado."""
-  query = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_lawsuits_data`
-  WHERE user_id = {user_id}
-  """
-  return execute_query(query)
+  return fetch_source("lawsuit_data", user_id=user_id)
 
 def fetch_business_data(user_id: int) -> pd.DataFrame:
   """Busca dados de relacionamento empresarial para o user_id informado."""
-  query = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_business_relationships_data`
-  WHERE user_id = {user_id}
-  """
-  return execute_query(query)
+  return fetch_source("business_data", user_id=user_id)
 
 def fetch_sanctions_history(user_id: int) -> pd.DataFrame:
   """Busca dados de sanções para o user_id informado."""
-  query = f"""
-  SELECT * FROM infinitepay-production.metrics_amlft.sanctions_history
-  WHERE user_id = {user_id}
-  """
-  return execute_query(query)
+  return fetch_source("sanctions_history", user_id=user_id)
 
 def fetch_denied_transactions(user_id: int) -> pd.DataFrame:
   """Busca transações negadas para o user_id (merchant_id)."""
-  query = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_risk_transactions_data`
-  WHERE merchant_id = {user_id} ORDER BY card_number
-  """
-  return execute_query(query)
+  return fetch_source("denied_transactions", user_id=user_id)
 
 def fetch_denied_pix_transactions(user_id: int) -> pd.DataFrame:
   """Busca transações PIX negadas para o user_id."""
-  query = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_risk_pix_transfers_data`
-  WHERE debitor_user_id = '{user_id}' ORDER BY str_pix_transfer_id DESC
-  """
-  return execute_query(query)
+  return fetch_source("denied_pix_transactions", user_id=user_id)
 
 def fetch_prison_transactions(user_id: int) -> pd.DataFrame:
   """Busca transações no presídio para o user_id informado."""
-  query = f"""
-  SELECT * EXCEPT(user_id) FROM infinitepay-production.metrics_amlft.prison_transactions
-  WHERE user_id = {user_id}
-  """
-  return execute_query(query)
+  return fetch_source("prison_transactions", user_id=user_id)
 
 def fetch_bets_pix_transfers(user_id: int) -> pd.DataFrame:
   """Busca transações de apostas via PIX para o user_id informado."""
-  query = f"""
-    SELECT
-  transfer_type,
-  pix_status,
-  user_id,
-  user_name,
-  gateway,
-  gateway_document_number,
-  gateway_pix_key,
-  gateway_name,
-  SUM(transfer_amount) total_amount,
-  COUNT(pix_transfer_id) count_transactions
-FROM `infinitepay-production.metrics_amlft.bets_pix_transfers`
-WHERE user_id = {user_id}
-GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
-  """
-  return execute_query(query)
+  return fetch_source("bets_pix_transfers", user_id=user_id)
 
 def convert_decimals(data):
   """Converte recursivamente objetos Decimal em float."""
@@ -142,15 +245,255 @@ def convert_decimals(data):
   else:
     return data
 
-def analyze_counterparties(cash_in_list: list, cash_out_list: list, user_id: int) -> dict:
+def extract_processes_and_sanctions(bdc_result):
+  """Extrai especificamente processos judiciais e sanções do resultado BDC"""
+  analysis = {
+    "document": None,
+    "name": None,
+    "processes": [],
+    "sanctions": [],
+    "has_processes": False,
+    "has_sanctions": False,
+    "risk_level": "BAIXO"
+  }
+  
+  if not bdc_result or 'Result' not in bdc_result:
+    logging.debug("BDC result inválido ou sem campo 'Result' (campos: %s)", LazyJSON(list(bdc_result or {})))
+    return analysis
+  
+  results = bdc_result.get('Result', [])
+  if not results:
+    logging.debug("Campo 'Result' vazio no BDC (campos: %s)", LazyJSON(list(bdc_result)))
+    return analysis
+  
+  person_data = results[0] if results else {}
+  logging.debug("Dados da pessoa encontrados: %s", LazyJSON(list(person_data.keys())))
+  
+  logging.debug("Dados completos recebidos do BDC: %s", LazyJSON(person_data, indent=2))
+  
+  # Extrair dados básicos - CORRIGIDO: BasicData ao invés de basic_data
+  basic_data = person_data.get('BasicData', {})
+  if basic_data:
+    analysis["document"] = basic_data.get('TaxIdNumber', '')
+    analysis["name"] = basic_data.get('Name', '')
+    logging.debug("Dados básicos extraídos: %s - %s", analysis['name'], analysis['document'])
+  
+  # Extrair processos judiciais - CORRIGIDO: Processes ao invés de processes
+  processes_data = person_data.get('Processes', {})
+  logging.debug("Processes data completa: %s", LazyJSON(processes_data, indent=2))
+  
+  processes = processes_data.get('Lawsuits', []) if processes_data else []
+  logging.debug("Lista de Lawsuits: %s", LazyJSON(processes, indent=2))
+  logging.debug("Processos encontrados para %s: %d", analysis.get('name', 'NOME_NAO_ENCONTRADO'), len(processes))
+  
+  if processes:
+    analysis["has_processes"] = True
+    # IMPORTANTE: Contar quantos processos realmente vamos adicionar
+    processes_to_add = processes[:10]  # Limitar a 10 processos mais relevantes
+    logging.debug("Processos que serão adicionados para %s: %d de %d", analysis.get('name', 'NOME_NAO_ENCONTRADO'), len(processes_to_add), len(processes))
+    
+    for i, process in enumerate(processes_to_add):
+      process_info = {
+        "process_number": process.get('Number', ''),
+        "court": process.get('CourtName', ''),
+        "subject": process.get('MainSubject', ''),
+        "type": process.get('Type', ''),
+        "court_level": process.get('CourtLevel', ''),
+        "court_type": process.get('CourtType', ''),
+        "district": process.get('CourtDistrict', '')
+      }
+      analysis["processes"].append(process_info)
+      logging.debug("Processo %d/%d adicionado para %s: %s - %s", i + 1, len(processes_to_add), analysis.get('name', 'NOME_NAO_ENCONTRADO'), process_info['process_number'], process_info['subject'])
+    
+  else:
+    logging.debug("Nenhum processo encontrado para %s", analysis.get('name', 'NOME_NAO_ENCONTRADO'))
+  
+  # Extrair sanções (KYC) - CORRIGIDO: KycData ao invés de kyc
+  kyc_data = person_data.get('KycData', {})
+  logging.debug("KycData completa: %s", LazyJSON(kyc_data, indent=2))
+  
+  sanctions = []
+  
+  # Verificar PEP History
+  pep_history = kyc_data.get('PEPHistory', []) if kyc_data else []
+  logging.debug("PEPHistory: %s", LazyJSON(pep_history, indent=2))
+  if pep_history:
+    for pep in pep_history:
+      sanctions.append({
+        "type": "PEP",
+        "description": pep.get('Description', ''),
+        "source": "PEP Database"
+      })
+      logging.debug("PEP adicionado: %s", pep)
+  
+  # Verificar Sanctions History
+  sanctions_history = kyc_data.get('SanctionsHistory', []) if kyc_data else []
+  logging.debug("SanctionsHistory: %s", LazyJSON(sanctions_history, indent=2))
+  if sanctions_history:
+    for sanction in sanctions_history:
+      # FILTRO CRÍTICO: Só aceitar sanções com MatchRate = 100
+      match_rate = sanction.get('MatchRate', 0)
+      logging.debug("Sanção encontrada: %s - MatchRate: %s", sanction.get('Type', ''), match_rate)
+      
+      if match_rate == 100:
+        sanctions.append({
+          "type": sanction.get('Type', ''),
+          "standardized_type": sanction.get('StandardizedSanctionType', ''),
+          "source": sanction.get('Source', ''),
+          "description": sanction.get('Details', {}).get('WarrantDescription', '') if sanction.get('Details') else '',
+          "match_rate": match_rate
+        })
+        logging.debug("Sanção válida adicionada (MatchRate=100): %s", sanction)
+      else:
+        logging.debug("Sanção rejeitada (MatchRate=%s): %s - %s", match_rate, sanction.get('Type', ''), sanction.get('Source', ''))
+        logging.debug("Detalhes da sanção rejeitada: Nome original='%s', Nome sanção='%s'", sanction.get('Details', {}).get('OriginalName', ''), sanction.get('Details', {}).get('SanctionName', ''))
+  
+  # Verificar flags de sanções atuais
+  if kyc_data:
+    is_currently_pep = kyc_data.get('IsCurrentlyPEP', False)
+    is_currently_sanctioned = kyc_data.get('IsCurrentlySanctioned', False)
+    logging.debug("IsCurrentlyPEP: %s, IsCurrentlySanctioned: %s", is_currently_pep, is_currently_sanctioned)
+    
+    if is_currently_pep:
+      sanctions.append({
+        "type": "Current PEP",
+        "description": "Currently a Politically Exposed Person",
+        "source": "PEP Database"
+      })
+      logging.debug("Current PEP flag adicionado")
+    
+    if is_currently_sanctioned:
+      sanctions.append({
+        "type": "Current Sanction",
+        "description": "Currently under sanctions",
+        "source": "Sanctions Database"
+      })
+      logging.debug("Current Sanction flag adicionado")
+  
+  logging.debug("Lista final de sanções (%d): %s", len(sanctions), LazyJSON(sanctions, indent=2))
+  
+  if sanctions:
+    analysis["has_sanctions"] = True
+    analysis["sanctions"] = sanctions
+    for sanction in sanctions:
+      logging.debug("Sanção adicionada: %s - %s", sanction['type'], sanction['source'])
+  
+  # Determinar nível de risco
+  if analysis["has_sanctions"]:
+    analysis["risk_level"] = "ALTO"
+  elif analysis["has_processes"] and len(analysis["processes"]) > 3:
+    analysis["risk_level"] = "MÉDIO"
+  elif analysis["has_processes"]:
+    analysis["risk_level"] = "BAIXO-MÉDIO"
+  
+  logging.debug("Análise final de %s: %d processos, %d sanções, risco=%s", analysis["document"], len(analysis["processes"]), len(analysis["sanctions"]), analysis["risk_level"])
+  return analysis
+
+def lookup_counterparty(document: str) -> dict:
+  """
+  Retorna processos e sanções da contraparte, consultando o BDC apenas quando o documento
+  não está no cache persistente. Resultados vazios também são cacheados (TTL menor);
+  falhas de consulta não são cacheadas.
+  """
+  cache_key = sanitize_document(document)
+  if bdc_cache is not None:
+    cached = bdc_cache.get(cache_key)
+    if cached is not None:
+      logging.debug("Contraparte %s encontrada no cache BDC", cache_key)
+      return cached
+  bdc_result = analyze_document(document)
+  analysis = extract_processes_and_sanctions(bdc_result)
+  if bdc_cache is not None and not bdc_result.get("Error"):
+    ttl = BDC_CACHE_TTL_SECONDS if bdc_result.get("Result") else BDC_NEGATIVE_CACHE_TTL_SECONDS
+    bdc_cache.set(cache_key, analysis, ttl_seconds=ttl)
+  return analysis
+
+# Campos de documento da contraparte, em ordem de preferência
+COUNTERPARTY_DOCUMENT_FIELDS = [
+  'party_document_number',  # Campo correto para PIX concentration
+  'gateway_document_number', 'document_number', 'cpf', 'cnpj',
+  'counterparty_document', 'payer_document', 'receiver_document',
+  'origin_document', 'destination_document'
+]
+# Quantidade de contrapartes (por direção) analisadas no BDC
+COUNTERPARTY_TOP_N = int(os.getenv("COUNTERPARTY_TOP_N", "3"))
+
+def select_top_counterparties(transactions: pd.DataFrame, top_n: int = COUNTERPARTY_TOP_N) -> pd.DataFrame:
+  """
+  Seleciona as `top_n` transações de maior pix_amount e resolve o documento da
+  contraparte (primeiro campo preenchido de COUNTERPARTY_DOCUMENT_FIELDS) na coluna
+  `document`, sem ordenar nem converter o DataFrame inteiro.
+  """
+  if transactions is None or transactions.empty or 'pix_amount' not in transactions.columns:
+    return pd.DataFrame(columns=['pix_amount', 'document'])
+  transactions = transactions.reset_index(drop=True)
+  amounts = pd.to_numeric(transactions['pix_amount'], errors='coerce').fillna(0.0)
+  top = transactions.loc[amounts.nlargest(top_n).index].copy()
+  top['pix_amount'] = amounts.loc[top.index].astype(float)
+  fields = [field for field in COUNTERPARTY_DOCUMENT_FIELDS if field in top.columns]
+  if fields:
+    documents = top[fields].astype('string').apply(lambda column: column.str.strip()).replace('', pd.NA)
+    top['document'] = documents.bfill(axis=1).iloc[:, 0]
+  else:
+    top['document'] = pd.NA
+  return top
+
+def _pix_counterparty_documents(pix_concentration: pd.DataFrame) -> list:
+  """Documentos das contrapartes que analyze_counterparties consultará para um usuário."""
+  if pix_concentration is None or pix_concentration.empty:
+    return []
+  documents = []
+  for transaction_type in ('Cash In', 'Cash Out'):
+    top = select_top_counterparties(pix_concentration[pix_concentration['transaction_type'] == transaction_type])
+    documents.extend(top['document'].dropna().tolist())
+  return documents
+
+def resolve_counterparties(documents: list) -> dict:
+  """
+  Consulta no BDC (via cache) os documentos informados, sem repetição e em paralelo
+  com até BDC_MAX_WORKERS requisições simultâneas.
+
+  Args:
+      documents (list): Documentos das contrapartes (podem se repetir entre usuários)
+
+  Returns:
+      dict: {documento sanitizado: análise de processos e sanções}; documentos cuja
+            consulta falhou ficam de fora
   """
-  Analisa as contrapartes (top 3 cash in e top 3 cash out) usando BDC-UTILS.
+  unique = {}
+  for document in documents:
+    unique.setdefault(sanitize_document(document), document)
+  if not unique:
+    return {}
+  resolved = {}
+  with ThreadPoolExecutor(max_workers=min(BDC_MAX_WORKERS, len(unique)), thread_name_prefix="bdc") as executor:
+    futures = {key: executor.submit(lookup_counterparty, document) for key, document in unique.items()}
+    for key, future in futures.items():
+      try:
+        resolved[key] = future.result()
+      except Exception as e:
+        logging.error(f"Erro ao consultar contraparte {key} no BDC: {str(e)}")
+  logging.info(f"Contrapartes resolvidas no BDC: {len(resolved)} de {len(unique)} documentos únicos")
+  return resolved
+
+def _resolved_analysis(resolved: dict, document: str) -> dict:
+  analysis = resolved.get(sanitize_document(document))
+  if analysis is None:
+    raise LookupError(f"consulta ao BDC sem resultado para {document}")
+  # Cópia, pois a mesma contraparte pode aparecer em Cash In e Cash Out
+  return dict(analysis)
+
+def analyze_counterparties(cash_in: pd.DataFrame, cash_out: pd.DataFrame, user_id: int, resolved: dict = None) -> dict:
+  """
+  Analisa as contrapartes (top COUNTERPARTY_TOP_N cash in e cash out) usando BDC-UTILS.
   Foca especificamente em processos judiciais e sanções.
   
   Args:
-      cash_in_list (list): Lista de transações cash in
-      cash_out_list (list): Lista de transações cash out
+      cash_in (DataFrame): Transações PIX cash in
+      cash_out (DataFrame): Transações PIX cash out
       user_id (int): ID do usuário para logging
+      resolved (dict): Contrapartes já consultadas em lote (resolve_counterparties);
+                       as que faltarem são consultadas aqui, em paralelo
       
   Returns:
       dict: Resultado da análise das contrapartes com foco em processos e sanções
@@ -170,549 +513,360 @@ def analyze_counterparties(cash_in_list: list, cash_out_list: list, user_id: int
   if not BDC_AVAILABLE:
     logging.warning(f"BDC-UTILS não disponível para análise do usuário {user_id}")
     return counterparty_analysis
-  
-  def extract_document_from_transaction(transaction):
-    """Extrai documento da transação, tentando vários campos possíveis"""
-    possible_fields = [
-      'party_document_number',  # Campo correto para PIX concentration
-      'gateway_document_number', 'document_number', 'cpf', 'cnpj', 
-      'counterparty_document', 'payer_document', 'receiver_document',
-      'origin_document', 'destination_document'
-    ]
-    
-    for field in possible_fields:
-      if field in transaction and transaction[field]:
-        return str(transaction[field]).strip()
-    return None
-  
-  def extract_processes_and_sanctions(bdc_result):
-    """Extrai especificamente processos judiciais e sanções do resultado BDC"""
-    analysis = {
-      "document": None,
-      "name": None,
-      "processes": [],
-      "sanctions": [],
-      "has_processes": False,
-      "has_sanctions": False,
-      "risk_level": "BAIXO"
-    }
-    
-    if not bdc_result or 'Result' not in bdc_result:
-      logging.warning(f"BDC result inválido ou sem campo 'Result': {bdc_result}")
-      return analysis
-    
-    results = bdc_result.get('Result', [])
-    if not results:
-      logging.warning(f"Campo 'Result' vazio no BDC: {bdc_result}")
-      return analysis
-    
-    person_data = results[0] if results else {}
-    logging.info(f"Dados da pessoa encontrados: {list(person_data.keys())}")
-    
-    # DEBUG: Log completo dos dados recebidos
-    logging.info(f"DEBUG - Dados completos recebidos do BDC: {json.dumps(person_data, indent=2, default=str)}")
-    
-    # Extrair dados básicos - CORRIGIDO: BasicData ao invés de basic_data
-    basic_data = person_data.get('BasicData', {})
-    if basic_data:
-      analysis["document"] = basic_data.get('TaxIdNumber', '')
-      analysis["name"] = basic_data.get('Name', '')
-      logging.info(f"Dados básicos extraídos: {analysis['name']} - {analysis['document']}")
-    
-    # Extrair processos judiciais - CORRIGIDO: Processes ao invés de processes
-    processes_data = person_data.get('Processes', {})
-    logging.info(f"DEBUG - Processes data completa: {json.dumps(processes_data, indent=2, default=str)}")
-    
-    processes = processes_data.get('Lawsuits', []) if processes_data else []
-    logging.info(f"DEBUG - Lista de Lawsuits: {json.dumps(processes, indent=2, default=str)}")
-    logging.info(f"Processos encontrados: {len(processes)}")
-    logging.info(f"DEBUG - CONTAGEM EXATA DE PROCESSOS PARA {analysis.get('name', 'NOME_NAO_ENCONTRADO')}: {len(processes)} processos")
-    
-    if processes:
-      analysis["has_processes"] = True
-      # IMPORTANTE: Contar quantos processos realmente vamos adicionar
-      processes_to_add = processes[:10]  # Limitar a 10 processos mais relevantes
-      logging.info(f"DEBUG - PROCESSOS QUE SERÃO ADICIONADOS PARA {analysis.get('name', 'NOME_NAO_ENCONTRADO')}: {len(processes_to_add)} de {len(processes)} total")
-      
-      for i, process in enumerate(processes_to_add):
-        process_info = {
-          "process_number": process.get('Number', ''),
-          "court": process.get('CourtName', ''),
-          "subject": process.get('MainSubject', ''),
-          "type": process.get('Type', ''),
-          "court_level": process.get('CourtLevel', ''),
-          "court_type": process.get('CourtType', ''),
-          "district": process.get('CourtDistrict', '')
-        }
-        analysis["processes"].append(process_info)
-        logging.info(f"Processo {i+1}/{len(processes_to_add)} adicionado para {analysis.get('name', 'NOME_NAO_ENCONTRADO')}: {process_info['process_number']} - {process_info['subject']}")
-      
-      logging.info(f"DEBUG - TOTAL FINAL DE PROCESSOS ADICIONADOS PARA {analysis.get('name', 'NOME_NAO_ENCONTRADO')}: {len(analysis['processes'])}")
-    else:
-      logging.info(f"DEBUG - NENHUM PROCESSO ENCONTRADO PARA {analysis.get('name', 'NOME_NAO_ENCONTRADO')}")
-    
-    # Extrair sanções (KYC) - CORRIGIDO: KycData ao invés de kyc
-    kyc_data = person_data.get('KycData', {})
-    logging.info(f"DEBUG - KycData completa: {json.dumps(kyc_data, indent=2, default=str)}")
-    
-    sanctions = []
-    
-    # Verificar PEP History
-    pep_history = kyc_data.get('PEPHistory', []) if kyc_data else []
-    logging.info(f"DEBUG - PEPHistory: {json.dumps(pep_history, indent=2, default=str)}")
-    if pep_history:
-      for pep in pep_history:
-        sanctions.append({
-          "type": "PEP",
-          "description": pep.get('Description', ''),
-          "source": "PEP Database"
-        })
-        logging.info(f"DEBUG - PEP adicionado: {pep}")
-    
-    # Verificar Sanctions History
-    sanctions_history = kyc_data.get('SanctionsHistory', []) if kyc_data else []
-    logging.info(f"DEBUG - SanctionsHistory: {json.dumps(sanctions_history, indent=2, default=str)}")
-    if sanctions_history:
-      for sanction in sanctions_history:
-        # FILTRO CRÍTICO: Só aceitar sanções com MatchRate = 100
-        match_rate = sanction.get('MatchRate', 0)
-        logging.info(f"DEBUG - Sanção encontrada: {sanction.get('Type', '')} - MatchRate: {match_rate}")
-        
-        if match_rate == 100:
-          sanctions.append({
-            "type": sanction.get('Type', ''),
-            "standardized_type": sanction.get('StandardizedSanctionType', ''),
-            "source": sanction.get('Source', ''),
-            "description": sanction.get('Details', {}).get('WarrantDescription', '') if sanction.get('Details') else '',
-            "match_rate": match_rate
-          })
-          logging.info(f"DEBUG - Sanção VÁLIDA adicionada (MatchRate=100): {sanction}")
-        else:
-          logging.warning(f"DEBUG - Sanção REJEITADA (MatchRate={match_rate}): {sanction.get('Type', '')} - {sanction.get('Source', '')}")
-          logging.warning(f"DEBUG - Detalhes da sanção rejeitada: Nome original='{sanction.get('Details', {}).get('OriginalName', '')}', Nome sanção='{sanction.get('Details', {}).get('SanctionName', '')}'")
-    
-    # Verificar flags de sanções atuais
-    if kyc_data:
-      is_currently_pep = kyc_data.get('IsCurrentlyPEP', False)
-      is_currently_sanctioned = kyc_data.get('IsCurrentlySanctioned', False)
-      logging.info(f"DEBUG - IsCurrentlyPEP: {is_currently_pep}, IsCurrentlySanctioned: {is_currently_sanctioned}")
-      
-      if is_currently_pep:
-        sanctions.append({
-          "type": "Current PEP",
-          "description": "Currently a Politically Exposed Person",
-          "source": "PEP Database"
-        })
-        logging.info(f"DEBUG - Current PEP flag adicionado")
-      
-      if is_currently_sanctioned:
-        sanctions.append({
-          "type": "Current Sanction",
-          "description": "Currently under sanctions",
-          "source": "Sanctions Database"
-        })
-        logging.info(f"DEBUG - Current Sanction flag adicionado")
-    
-    logging.info(f"DEBUG - Total de sanções coletadas: {len(sanctions)}")
-    logging.info(f"DEBUG - Lista final de sanções: {json.dumps(sanctions, indent=2, default=str)}")
-    
-    if sanctions:
-      analysis["has_sanctions"] = True
-      analysis["sanctions"] = sanctions
-      for sanction in sanctions:
-        logging.info(f"Sanção adicionada: {sanction['type']} - {sanction['source']}")
-    
-    # Determinar nível de risco
-    if analysis["has_sanctions"]:
-      analysis["risk_level"] = "ALTO"
-    elif analysis["has_processes"] and len(analysis["processes"]) > 3:
-      analysis["risk_level"] = "MÉDIO"
-    elif analysis["has_processes"]:
-      analysis["risk_level"] = "BAIXO-MÉDIO"
-    
-    logging.info(f"Análise final: processos={analysis['has_processes']}, sanções={analysis['has_sanctions']}, risco={analysis['risk_level']}")
-    return analysis
-  
-  # Analisar top 3 cash in
-  top_cash_in = sorted(cash_in_list, key=lambda x: float(x.get('pix_amount', 0)), reverse=True)[:3]
-  logging.info(f"Analisando {len(top_cash_in)} contrapartes Cash In para usuário {user_id}")
-  
-  for i, transaction in enumerate(top_cash_in):
-    document = extract_document_from_transaction(transaction)
-    logging.info(f"Cash In {i+1}: Documento extraído: {document}, Valor: {transaction.get('pix_amount', 0)}")
-    
-    if document:
-      try:
-        logging.info(f"Consultando BDC para documento: {document}")
-        bdc_result = analyze_document(document)
-        logging.info(f"Resultado BDC recebido para {document}: {bool(bdc_result)}")
-        
-        analysis = extract_processes_and_sanctions(bdc_result)
-        logging.info(f"Análise processada para {document}: processos={analysis['has_processes']}, sanções={analysis['has_sanctions']}")
-        logging.info(f"DEBUG - ANÁLISE COMPLETA PARA CONTRAPARTE {analysis.get('name', 'NOME_NAO_ENCONTRADO')} (DOC: {document}): {len(analysis.get('processes', []))} processos, {len(analysis.get('sanctions', []))} sanções, risco={analysis.get('risk_level', 'N/A')}")
-        
-        analysis["transaction_amount"] = transaction.get('pix_amount', 0)
-        analysis["transaction_date"] = transaction.get('created_at', '')  # Manter created_at se existir
-        analysis["transaction_type"] = "CASH_IN"
-        analysis["party_name"] = transaction.get('party', '')  # Adicionar nome da contraparte
-        counterparty_analysis["top_cash_in_analysis"].append(analysis)
-        
-        # Atualizar sumário
-        counterparty_analysis["summary"]["total_counterparties_analyzed"] += 1
-        if analysis["has_processes"]:
-          counterparty_analysis["summary"]["counterparties_with_processes"] += 1
-        if analysis["has_sanctions"]:
-          counterparty_analysis["summary"]["counterparties_with_sanctions"] += 1
-        if analysis["risk_level"] in ["ALTO", "MÉDIO"]:
-          counterparty_analysis["summary"]["high_risk_counterparties"] += 1
-          
-      except Exception as e:
-        logging.error(f"Erro ao analisar contraparte cash in {document}: {str(e)}")
-    else:
-      logging.warning(f"Documento não encontrado para transação Cash In {i+1}: {transaction}")
-  
-  # Analisar top 3 cash out
-  top_cash_out = sorted(cash_out_list, key=lambda x: float(x.get('pix_amount', 0)), reverse=True)[:3]
-  logging.info(f"Analisando {len(top_cash_out)} contrapartes Cash Out para usuário {user_id}")
-  
-  for i, transaction in enumerate(top_cash_out):
-    document = extract_document_from_transaction(transaction)
-    logging.info(f"Cash Out {i+1}: Documento extraído: {document}, Valor: {transaction.get('pix_amount', 0)}")
-    
-    if document:
+
+  directions = [
+    ("CASH_IN", "Cash In", "top_cash_in_analysis", select_top_counterparties(cash_in)),
+    ("CASH_OUT", "Cash Out", "top_cash_out_analysis", select_top_counterparties(cash_out)),
+  ]
+  resolved = dict(resolved or {})
+  documents = [document for *_, top in directions for document in top['document'].dropna()]
+  resolved.update(resolve_counterparties([document for document in documents if sanitize_document(document) not in resolved]))
+
+  summary = counterparty_analysis["summary"]
+  for transaction_type, label, result_key, top in directions:
+    logging.info(f"Analisando {len(top)} contrapartes {label} para usuário {user_id}")
+    for i, transaction in enumerate(top.to_dict(orient='records')):
+      document = transaction['document']
+      if pd.isna(document):
+        logging.debug("Documento não encontrado para transação %s %d do usuário %s", label, i + 1, user_id)
+        continue
+      logging.debug("%s %d: documento %s, valor %s", label, i + 1, document, transaction['pix_amount'])
       try:
-        logging.info(f"Consultando BDC para documento: {document}")
-        bdc_result = analyze_document(document)
-        logging.info(f"Resultado BDC recebido para {document}: {bool(bdc_result)}")
-        
-        analysis = extract_processes_and_sanctions(bdc_result)
-        logging.info(f"Análise processada para {document}: processos={analysis['has_processes']}, sanções={analysis['has_sanctions']}")
-        logging.info(f"DEBUG - ANÁLISE COMPLETA PARA CONTRAPARTE {analysis.get('name', 'NOME_NAO_ENCONTRADO')} (DOC: {document}): {len(analysis.get('processes', []))} processos, {len(analysis.get('sanctions', []))} sanções, risco={analysis.get('risk_level', 'N/A')}")
-        
-        analysis["transaction_amount"] = transaction.get('pix_amount', 0)
-        analysis["transaction_date"] = transaction.get('created_at', '')  # Manter created_at se existir
-        analysis["transaction_type"] = "CASH_OUT"
-        analysis["party_name"] = transaction.get('party', '')  # Adicionar nome da contraparte
-        counterparty_analysis["top_cash_out_analysis"].append(analysis)
-        
-        # Atualizar sumário
-        counterparty_analysis["summary"]["total_counterparties_analyzed"] += 1
-        if analysis["has_processes"]:
-          counterparty_analysis["summary"]["counterparties_with_processes"] += 1
-        if analysis["has_sanctions"]:
-          counterparty_analysis["summary"]["counterparties_with_sanctions"] += 1
-        if analysis["risk_level"] in ["ALTO", "MÉDIO"]:
-          counterparty_analysis["summary"]["high_risk_counterparties"] += 1
-          
+        analysis = _resolved_analysis(resolved, document)
+        logging.debug("Contraparte %s (doc %s): %d processos, %d sanções, risco=%s", analysis.get('name', 'NOME_NAO_ENCONTRADO'), document, len(analysis.get('processes', [])), len(analysis.get('sanctions', [])), analysis.get('risk_level', 'N/A'))
       except Exception as e:
-        logging.error(f"Erro ao analisar contraparte cash out {document}: {str(e)}")
-    else:
-      logging.warning(f"Documento não encontrado para transação Cash Out {i+1}: {transaction}")
+        logging.error(f"Erro ao analisar contraparte {label.lower()} {document}: {str(e)}")
+        continue
+
+      analysis["transaction_amount"] = transaction['pix_amount']
+      analysis["transaction_date"] = transaction.get('created_at', '')  # Manter created_at se existir
+      analysis["transaction_type"] = transaction_type
+      analysis["party_name"] = transaction.get('party', '')  # Adicionar nome da contraparte
+      counterparty_analysis[result_key].append(analysis)
+
+      # Atualizar sumário
+      summary["total_counterparties_analyzed"] += 1
+      if analysis["has_processes"]:
+        summary["counterparties_with_processes"] += 1
+      if analysis["has_sanctions"]:
+        summary["counterparties_with_sanctions"] += 1
+      if analysis["risk_level"] in ["ALTO", "MÉDIO"]:
+        summary["high_risk_counterparties"] += 1
   
-  logging.info(f"Análise de contrapartes concluída para usuário {user_id}: {counterparty_analysis['summary']}")
+  logging.info(f"Análise de contrapartes concluída para usuário {user_id}: {summary}")
   return counterparty_analysis
 
-def merchant_report(user_id: int, alert_type: str, pep_data=None) -> dict:
-  """Gera um relatório para merchant."""
-  query_merchants = f"""
-  SELECT * FROM metrics_amlft.merchant_report WHERE user_id = {user_id} LIMIT 1
-  """
-  query_issuing_concentration = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_issuing_payments_data`
-  WHERE user_id = {user_id}
-  """
-  query_pix_concentration = f"""
-  SELECT * FROM metrics_amlft.pix_concentration WHERE user_id = {user_id}
-  """
-  query_transaction_concentration = f"""
-  SELECT * EXCEPT(merchant_id) FROM `infinitepay-production.metrics_amlft.cardholder_concentration`
-  WHERE merchant_id = {user_id} ORDER BY total_approved_by_ch DESC
-  """
-  query_offense_history = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis_data`
-  WHERE user_id = {user_id} ORDER BY id DESC
-  """
-  products_online_store = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_online_store_data`
-  WHERE user_id = {user_id}
-  """
-  contacts_query = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_phonecast_data`
-  WHERE user_id = {user_id}
-  """
-  devices_query = f"""
-  SELECT * EXCEPT(user_id) FROM metrics_amlft.user_device WHERE user_id = {user_id}
-  """
-  merchant_info = execute_query(query_merchants)
-  issuing_concentration = execute_query(query_issuing_concentration)
-  pix_concentration = execute_query(query_pix_concentration)
-  transaction_concentration = execute_query(query_transaction_concentration)
-  offense_history = execute_query(query_offense_history)
-  products_online = execute_query(products_online_store)
-  contacts = execute_query(contacts_query)
-  devices = execute_query(devices_query)
-  cash_in = pd.DataFrame()
-  cash_out = pd.DataFrame()
-  total_cash_in_pix = 0.0
-  total_cash_out_pix = 0.0
-  total_cash_in_pix_atypical_hours = 0.0
-  total_cash_out_pix_atypical_hours = 0.0
-  if not pix_concentration.empty:
+def _split_pix_concentration(pix_concentration: pd.DataFrame) -> dict:
+  """Separa a concentração PIX em Cash In/Cash Out e calcula os totais."""
+  pix = {
+    "cash_in": pd.DataFrame(),
+    "cash_out": pd.DataFrame(),
+    "total_cash_in_pix": 0.0,
+    "total_cash_out_pix": 0.0,
+    "total_cash_in_pix_atypical_hours": 0.0,
+    "total_cash_out_pix_atypical_hours": 0.0
+  }
+  if pix_concentration is not None and not pix_concentration.empty:
     cash_in = pix_concentration[pix_concentration['transaction_type'] == 'Cash In'].round(2)
     cash_out = pix_concentration[pix_concentration['transaction_type'] == 'Cash Out'].round(2)
-    total_cash_in_pix = cash_in['pix_amount'].sum()
-    total_cash_out_pix = cash_out['pix_amount'].sum()
-    total_cash_in_pix_atypical_hours = cash_in['pix_amount_atypical_hours'].sum()
-    total_cash_out_pix_atypical_hours = cash_out['pix_amount_atypical_hours'].sum()
-  merchant_info_dict = merchant_info.to_dict(orient='records')[0] if not merchant_info.empty else {}
-  issuing_concentration_list = issuing_concentration.to_dict(orient='records') if not issuing_concentration.empty else []
-  transaction_concentration_list = transaction_concentration.to_dict(orient='records') if not transaction_concentration.empty else []
-  cash_in_list = cash_in.to_dict(orient='records') if not cash_in.empty else []
-  cash_out_list = cash_out.to_dict(orient='records') if not cash_out.empty else []
-  offense_history_list = offense_history.to_dict(orient='records') if not offense_history.empty else []
-  products_online_list = products_online.to_dict(orient='records') if not products_online.empty else []
-  contacts_list = contacts.to_dict(orient='records') if not contacts.empty else []
-  devices_list = devices.to_dict(orient='records') if not devices.empty else []
-  merchant_info_dict = convert_decimals(merchant_info_dict)
-  issuing_concentration_list = convert_decimals(issuing_concentration_list)
-  transaction_concentration_list = convert_decimals(transaction_concentration_list)
-  cash_in_list = convert_decimals(cash_in_list)
-  cash_out_list = convert_decimals(cash_out_list)
-  offense_history_list = convert_decimals(offense_history_list)
-  products_online_list = convert_decimals(products_online_list)
-  contacts_list = convert_decimals(contacts_list)
-  devices_list = convert_decimals(devices_list)
-  lawsuit_data = fetch_lawsuit_data(user_id)
-  lawsuit_data = lawsuit_data.to_dict(orient='records') if not lawsuit_data.empty else []
-  denied_transactions_df = fetch_denied_transactions(user_id)
-  denied_transactions_list = denied_transactions_df.to_dict(orient='records') if not denied_transactions_df.empty else []
-  business_data = fetch_business_data(user_id)
-  business_data_list = business_data.to_dict(orient='records') if not business_data.empty else []
-  prison_transactions_df = fetch_prison_transactions(user_id)
-  prison_transactions_list = prison_transactions_df.to_dict(orient='records') if not prison_transactions_df.empty else []
-  prison_transactions_list = convert_decimals(prison_transactions_list)
-  sanctions_history_df = fetch_sanctions_history(user_id)
-  sanctions_history_list = sanctions_history_df.to_dict(orient='records') if not sanctions_history_df.empty else []
-  sanctions_history_list = convert_decimals(sanctions_history_list)
-  denied_pix_transactions_df = fetch_denied_pix_transactions(user_id)
-  denied_pix_transactions_list = denied_pix_transactions_df.to_dict(orient='records') if not denied_pix_transactions_df.empty else []
-  denied_pix_transactions_list = convert_decimals(denied_pix_transactions_list)
-  bets_pix_transfers_df = fetch_bets_pix_transfers(user_id)
-  bets_pix_transfers_list = bets_pix_transfers_df.to_dict(orient='records') if not bets_pix_transfers_df.empty else []
-  bets_pix_transfers_list = convert_decimals(bets_pix_transfers_list)
-  counterparty_analysis = analyze_counterparties(cash_in_list, cash_out_list, user_id)
+    pix["cash_in"] = cash_in
+    pix["cash_out"] = cash_out
+    pix["total_cash_in_pix"] = cash_in['pix_amount'].sum()
+    pix["total_cash_out_pix"] = cash_out['pix_amount'].sum()
+    pix["total_cash_in_pix_atypical_hours"] = cash_in['pix_amount_atypical_hours'].sum()
+    pix["total_cash_out_pix_atypical_hours"] = cash_out['pix_amount_atypical_hours'].sum()
+  return pix
+
+def _build_merchant_report(user_id: int, frames: dict, resolved_counterparties: dict = None) -> dict:
+  """
+  Monta o relatório de merchant a partir dos DataFrames de cada fonte. As seções
+  tabulares ficam como DataFrames e só são serializadas na renderização do prompt.
+  """
+  frame = lambda name: frames.get(name, pd.DataFrame())
+  pix = _split_pix_concentration(frame("pix_concentration"))
+  merchant_info = frame("merchant_info")
+  merchant_info_dict = convert_decimals(merchant_info.to_dict(orient='records')[0] if not merchant_info.empty else {})
+  counterparty_analysis = analyze_counterparties(pix["cash_in"], pix["cash_out"], user_id, resolved=resolved_counterparties)
   report = {
     "merchant_info": merchant_info_dict,
-    "total_cash_in_pix": total_cash_in_pix,
-    "total_cash_out_pix": total_cash_out_pix,
-    "total_cash_in_pix_atypical_hours": total_cash_in_pix_atypical_hours,
-    "total_cash_out_pix_atypical_hours": total_cash_out_pix_atypical_hours,
-    "issuing_concentration": issuing_concentration_list,
-    "transaction_concentration": transaction_concentration_list,
-    "pix_cash_in": cash_in_list,
-    "pix_cash_out": cash_out_list,
-    "offense_history": offense_history_list,
-    "products_online": products_online_list,
-    "contacts": contacts_list,
-    "devices": devices_list,
-    "lawsuit_data": lawsuit_data,
-    "denied_transactions": denied_transactions_list,
-    "business_data": business_data_list,
-    "prison_transactions": prison_transactions_list,
-    "sanctions_history": sanctions_history_list,
-    "denied_pix_transactions": denied_pix_transactions_list,
-    "bets_pix_transfers": bets_pix_transfers_list,
+    "total_cash_in_pix": pix["total_cash_in_pix"],
+    "total_cash_out_pix": pix["total_cash_out_pix"],
+    "total_cash_in_pix_atypical_hours": pix["total_cash_in_pix_atypical_hours"],
+    "total_cash_out_pix_atypical_hours": pix["total_cash_out_pix_atypical_hours"],
+    "issuing_concentration": frame("issuing_concentration"),
+    "transaction_concentration": frame("transaction_concentration"),
+    "pix_cash_in": pix["cash_in"],
+    "pix_cash_out": pix["cash_out"],
+    "offense_history": frame("offense_history"),
+    "products_online": frame("products_online"),
+    "contacts": frame("contacts"),
+    "devices": frame("devices"),
+    "lawsuit_data": frame("lawsuit_data"),
+    "denied_transactions": frame("denied_transactions"),
+    "business_data": frame("business_data"),
+    "prison_transactions": frame("prison_transactions"),
+    "sanctions_history": frame("sanctions_history"),
+    "denied_pix_transactions": frame("denied_pix_transactions"),
+    "bets_pix_transfers": frame("bets_pix_transfers"),
+    "counterparty_analysis": counterparty_analysis
+  }
+  return report
+
+def _build_cardholder_report(user_id: int, frames: dict, resolved_counterparties: dict = None) -> dict:
+  """Monta o relatório de cardholder a partir dos DataFrames de cada fonte."""
+  frame = lambda name: frames.get(name, pd.DataFrame())
+  pix = _split_pix_concentration(frame("pix_concentration"))
+  cardholder_info = frame("cardholder_info")
+  cardholder_info_dict = convert_decimals(cardholder_info.to_dict(orient='records')[0] if not cardholder_info.empty else {})
+  counterparty_analysis = analyze_counterparties(pix["cash_in"], pix["cash_out"], user_id, resolved=resolved_counterparties)
+  report = {
+    "cardholder_info": cardholder_info_dict,
+    "total_cash_in_pix": pix["total_cash_in_pix"],
+    "total_cash_out_pix": pix["total_cash_out_pix"],
+    "total_cash_in_pix_atypical_hours": pix["total_cash_in_pix_atypical_hours"],
+    "total_cash_out_pix_atypical_hours": pix["total_cash_out_pix_atypical_hours"],
+    "issuing_concentration": frame("issuing_concentration"),
+    "pix_cash_in": pix["cash_in"],
+    "pix_cash_out": pix["cash_out"],
+    "offense_history": frame("offense_history"),
+    "contacts": frame("contacts"),
+    "devices": frame("devices"),
+    "lawsuit_data": frame("lawsuit_data"),
+    "business_data": frame("business_data"),
+    "prison_transactions": frame("prison_transactions"),
+    "sanctions_history": frame("sanctions_history"),
+    "denied_pix_transactions": frame("denied_pix_transactions"),
+    "bets_pix_transfers": frame("bets_pix_transfers"),
     "counterparty_analysis": counterparty_analysis
   }
   return report
 
+def merchant_report(user_id: int, alert_type: str, pep_data=None) -> dict:
+  """Gera um relatório para merchant."""
+  frames = run_fetches({
+    "merchant_info": partial(fetch_source, "merchant_info", user_id=user_id),
+    "issuing_concentration": partial(fetch_source, "merchant_issuing_concentration", user_id=user_id),
+    "pix_concentration": partial(fetch_source, "pix_concentration", user_id=user_id),
+    "transaction_concentration": partial(fetch_source, "transaction_concentration", user_id=user_id),
+    "offense_history": partial(fetch_source, "offense_history", user_id=user_id),
+    "products_online": partial(fetch_source, "products_online", user_id=user_id),
+    "contacts": partial(fetch_source, "contacts", user_id=user_id),
+    "devices": partial(fetch_source, "devices", user_id=user_id),
+    "lawsuit_data": partial(fetch_lawsuit_data, user_id),
+    "denied_transactions": partial(fetch_denied_transactions, user_id),
+    "business_data": partial(fetch_business_data, user_id),
+    "prison_transactions": partial(fetch_prison_transactions, user_id),
+    "sanctions_history": partial(fetch_sanctions_history, user_id),
+    "denied_pix_transactions": partial(fetch_denied_pix_transactions, user_id),
+    "bets_pix_transfers": partial(fetch_bets_pix_transfers, user_id)
+  })
+  return _build_merchant_report(user_id, frames)
+
 def cardholder_report(user_id: int, alert_type: str, pep_data=None) -> dict:
   """Gera um relatório para cardholders."""
-  query_cardholders = f"""
-  SELECT * FROM metrics_amlft.cardholder_report WHERE user_id = {user_id} LIMIT 1
-  """
-  query_issuing_concentration = f"""
-  SELECT * EXCEPT(user_id) FROM metrics_amlft.issuing_concentration WHERE user_id = {user_id}
+  frames = run_fetches({
+    "cardholder_info": partial(fetch_source, "cardholder_info", user_id=user_id),
+    "issuing_concentration": partial(fetch_source, "cardholder_issuing_concentration", user_id=user_id),
+    "pix_concentration": partial(fetch_source, "pix_concentration", user_id=user_id),
+    "offense_history": partial(fetch_source, "offense_history", user_id=user_id),
+    "contacts": partial(fetch_source, "contacts", user_id=user_id),
+    "devices": partial(fetch_source, "devices", user_id=user_id),
+    "lawsuit_data": partial(fetch_lawsuit_data, user_id),
+    "business_data": partial(fetch_business_data, user_id),
+    "prison_transactions": partial(fetch_prison_transactions, user_id),
+    "sanctions_history": partial(fetch_sanctions_history, user_id),
+    "denied_pix_transactions": partial(fetch_denied_pix_transactions, user_id),
+    "bets_pix_transfers": partial(fetch_bets_pix_transfers, user_id)
+  })
+  return _build_cardholder_report(user_id, frames)
+
+# Queries em lote: uma query do catálogo (batch_<fonte>, com @user_ids) por tabela para
+# todos os usuários do lote. "key" é a coluna usada para particionar o resultado por
+# usuário, "drop_key" remove essa coluna depois do particionamento (equivalente ao
+# SELECT * EXCEPT das queries individuais) e "first_only" reproduz o LIMIT 1 por usuário.
+BATCH_SOURCES = {
+  "merchant_info": {"key": "user_id", "first_only": True},
+  "cardholder_info": {"key": "user_id", "first_only": True},
+  "merchant_issuing_concentration": {"key": "user_id"},
+  "cardholder_issuing_concentration": {"key": "user_id", "drop_key": True},
+  "pix_concentration": {"key": "user_id"},
+  "transaction_concentration": {"key": "merchant_id", "drop_key": True},
+  "offense_history": {"key": "user_id"},
+  "products_online": {"key": "user_id"},
+  "contacts": {"key": "user_id"},
+  "devices": {"key": "user_id", "drop_key": True},
+  "lawsuit_data": {"key": "user_id"},
+  "business_data": {"key": "user_id"},
+  "sanctions_history": {"key": "user_id"},
+  "denied_transactions": {"key": "merchant_id"},
+  "denied_pix_transactions": {"key": "debitor_user_id"},
+  "prison_transactions": {"key": "user_id", "drop_key": True},
+  "bets_pix_transfers": {"key": "user_id"}
+}
+
+SHARED_BATCH_SOURCES = [
+  "pix_concentration", "offense_history", "contacts", "devices", "lawsuit_data", "business_data",
+  "prison_transactions", "sanctions_history", "denied_pix_transactions", "bets_pix_transfers"
+]
+MERCHANT_BATCH_SOURCES = [
+  "merchant_info", "merchant_issuing_concentration", "transaction_concentration",
+  "products_online", "denied_transactions"
+]
+CARDHOLDER_BATCH_SOURCES = ["cardholder_info", "cardholder_issuing_concentration"]
+
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "500"))
+
+def fetch_batch_table(source: str, user_ids: list) -> pd.DataFrame:
+  """Executa a query em lote de uma fonte (em blocos de REPORT_BATCH_SIZE) e retorna o resultado bruto. Erros são propagados."""
+  frames = [
+    run_query(f"batch_{source}", user_ids=user_ids[start:start + REPORT_BATCH_SIZE])
+    for start in range(0, len(user_ids), REPORT_BATCH_SIZE)
+  ]
+  frames = [frame for frame in frames if not frame.empty]
+  if not frames:
+    return pd.DataFrame()
+  return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+def partition_batch_source(source: str, df: pd.DataFrame, user_ids=None) -> dict:
+  """Separa o resultado em lote de uma fonte em {user_id: DataFrame} (apenas dos user_ids informados, se houver)."""
+  spec = BATCH_SOURCES[source]
+  key = spec["key"]
+  partitions = {}
+  if df.empty:
+    return partitions
+  wanted = set(user_ids) if user_ids is not None else None
+  for key_value, group in df.groupby(key, sort=False):
+    uid = int(key_value)
+    if wanted is not None and uid not in wanted:
+      continue
+    if spec.get("first_only"):
+      group = group.head(1)
+    if spec.get("drop_key"):
+      group = group.drop(columns=[key])
+    partitions[uid] = group.reset_index(drop=True)
+  return partitions
+
+def fetch_batch_source(source: str, user_ids: list) -> dict:
   """
-  query_pix_concentration = f"""
-  SELECT * FROM metrics_amlft.pix_concentration WHERE user_id = {user_id}
+  Executa a query em lote de uma fonte e retorna {user_id: DataFrame}. Erros são
+  propagados: uma fonte vazia por falha seria lida como "nenhum registro" para todos
+  os usuários (e, em merchant_info, todos os merchants virariam cardholders), então
+  quem chama (pipeline.prefetch_reports) volta às consultas individuais.
   """
-  query_offense_history = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis_data`
-  WHERE user_id = {user_id} ORDER BY id DESC
+  partitions = partition_batch_source(source, fetch_batch_table(source, user_ids))
+  logging.info(f"Fonte {source}: {len(partitions)} de {len(user_ids)} usuários com dados")
+  return partitions
+
+def load_batch_sources(snapshot, names: list, user_ids: list) -> dict:
+  """Lê as fontes de um snapshot do feature mart e retorna {fonte: {user_id: DataFrame}}."""
+  sources = {}
+  for name in names:
+    table = snapshot.read(name)
+    sources[name] = partition_batch_source(name, arrow_to_dataframe(table), user_ids) if table is not None else {}
+  return sources
+
+def materialize_feature_mart(flagged_users: list) -> str:
   """
-  contacts_query = f"""
-  SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_phonecast_data` WHERE user_id = {user_id}
+  Materializa o feature mart: executa as queries em lote de todas as fontes dos
+  relatórios para os usuários sinalizados e grava um snapshot local em Parquet
+  (um arquivo por fonte, ordenado por usuário). Pensado para rodar uma vez por noite;
+  a análise lê o snapshot em vez de consultar cada fonte no BigQuery.
+
+  Args:
+      flagged_users (list): Lista retornada por fetch_flagged_users
+
+  Returns:
+      str: Diretório do snapshot gravado
   """
-  devices_query = f"""
-  SELECT * EXCEPT(user_id) FROM metrics_amlft.user_device WHERE user_id = {user_id}
+  user_ids = list(dict.fromkeys(int(user["user_id"]) for user in flagged_users))
+  tables = run_fetches({name: partial(fetch_batch_table, name, user_ids) for name in SHARED_BATCH_SOURCES + MERCHANT_BATCH_SOURCES})
+  merchant_info = tables["merchant_info"]
+  merchant_ids = set(int(uid) for uid in merchant_info["user_id"]) if not merchant_info.empty else set()
+  cardholder_ids = [uid for uid in user_ids if uid not in merchant_ids]
+  if cardholder_ids:
+    tables.update(run_fetches({name: partial(fetch_batch_table, name, cardholder_ids) for name in CARDHOLDER_BATCH_SOURCES}))
+  else:
+    tables.update({name: pd.DataFrame() for name in CARDHOLDER_BATCH_SOURCES})
+  return write_snapshot(
+    tables,
+    user_ids,
+    [uid for uid in user_ids if uid in merchant_ids],
+    {name: spec["key"] for name, spec in BATCH_SOURCES.items()}
+  )
+
+def batch_reports(flagged_users: list, pep_data=None) -> dict:
   """
-  cardholder_info = execute_query(query_cardholders)
-  issuing_concentration = execute_query(query_issuing_concentration)
-  pix_concentration = execute_query(query_pix_concentration)
-  offense_history = execute_query(query_offense_history)
-  contacts = execute_query(contacts_query)
-  devices = execute_query(devices_query)
-  cash_in = pd.DataFrame()
-  cash_out = pd.DataFrame()
-  total_cash_in_pix = 0.0
-  total_cash_out_pix = 0.0
-  total_cash_in_pix_atypical_hours = 0.0
-  total_cash_out_pix_atypical_hours = 0.0
-  if not pix_concentration.empty:
-    cash_in = pix_concentration[pix_concentration['transaction_type'] == 'Cash In'].round(2)
-    cash_out = pix_concentration[pix_concentration['transaction_type'] == 'Cash Out'].round(2)
-    total_cash_in_pix = cash_in['pix_amount'].sum()
-    total_cash_out_pix = cash_out['pix_amount'].sum()
-    total_cash_in_pix_atypical_hours = cash_in['pix_amount_atypical_hours'].sum()
-    total_cash_out_pix_atypical_hours = cash_out['pix_amount_atypical_hours'].sum()
-  cardholder_info_dict = cardholder_info.to_dict(orient='records')[0] if not cardholder_info.empty else {}
-  issuing_concentration_list = issuing_concentration.to_dict(orient='records') if not issuing_concentration.empty else []
-  cash_in_list = cash_in.to_dict(orient='records') if not cash_in.empty else []
-  cash_out_list = cash_out.to_dict(orient='records') if not cash_out.empty else []
-  offense_history_list = offense_history.to_dict(orient='records') if not offense_history.empty else []
-  contacts_list = contacts.to_dict(orient='records') if not contacts.empty else []
-  devices_list = devices.to_dict(orient='records') if not devices.empty else []
-  cardholder_info_dict = convert_decimals(cardholder_info_dict)
-  issuing_concentration_list = convert_decimals(issuing_concentration_list)
-  cash_in_list = convert_decimals(cash_in_list)
-  cash_out_list = convert_decimals(cash_out_list)
-  offense_history_list = convert_decimals(offense_history_list)
-  contacts_list = convert_decimals(contacts_list)
-  devices_list = convert_decimals(devices_list)
-  lawsuit_data = fetch_lawsuit_data(user_id)
-  lawsuit_data = lawsuit_data.to_dict(orient='records') if not lawsuit_data.empty else []
-  business_data = fetch_business_data(user_id)
-  business_data_list = business_data.to_dict(orient='records') if not business_data.empty else []
-  prison_transactions_df = fetch_prison_transactions(user_id)
-  prison_transactions_list = prison_transactions_df.to_dict(orient='records') if not prison_transactions_df.empty else []
-  prison_transactions_list = convert_decimals(prison_transactions_list)
-  sanctions_history_df = fetch_sanctions_history(user_id)
-  sanctions_history_list = sanctions_history_df.to_dict(orient='records') if not sanctions_history_df.empty else []
-  sanctions_history_list = convert_decimals(sanctions_history_list)
-  denied_pix_transactions_df = fetch_denied_pix_transactions(user_id)
-  denied_pix_transactions_list = denied_pix_transactions_df.to_dict(orient='records') if not denied_pix_transactions_df.empty else []
-  denied_pix_transactions_list = convert_decimals(denied_pix_transactions_list)
-  bets_pix_transfers_df = fetch_bets_pix_transfers(user_id)
-  bets_pix_transfers_list = bets_pix_transfers_df.to_dict(orient='records') if not bets_pix_transfers_df.empty else []
-  bets_pix_transfers_list = convert_decimals(bets_pix_transfers_list)
-  counterparty_analysis = analyze_counterparties(cash_in_list, cash_out_list, user_id)
-  report = {
-    "cardholder_info": cardholder_info_dict,
-    "total_cash_in_pix": total_cash_in_pix,
-    "total_cash_out_pix": total_cash_out_pix,
-    "total_cash_in_pix_atypical_hours": total_cash_in_pix_atypical_hours,
-    "total_cash_out_pix_atypical_hours": total_cash_out_pix_atypical_hours,
-    "issuing_concentration": issuing_concentration_list,
-    "pix_cash_in": cash_in_list,
-    "pix_cash_out": cash_out_list,
-    "offense_history": offense_history_list,
-    "contacts": contacts_list,
-    "devices": devices_list,
-    "lawsuit_data": lawsuit_data,
-    "business_data": business_data_list,
-    "prison_transactions": prison_transactions_list,
-    "sanctions_history": sanctions_history_list,
-    "denied_pix_transactions": denied_pix_transactions_list,
-    "bets_pix_transfers": bets_pix_transfers_list,
-    "counterparty_analysis": counterparty_analysis
-  }
-  return report
+  Gera os relatórios de todos os usuários sinalizados com uma query por fonte,
+  em vez de uma query por fonte e por usuário. Usuários presentes no snapshot
+  mais recente do feature mart são lidos dele, sem consultar o BigQuery.
 
-def generate_prompt(report_data: dict, user_type: str, alert_type: str, betting_houses: pd.DataFrame = None, pep_data: pd.DataFrame = None, features: str = None) -> str:
-  """Gera o prompt para o GPT com base no relatório."""
-  import json
-  user_info_key = f"{user_type.lower()}_info"
-  user_info_json = json.dumps(report_data[user_info_key], ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  issuing_concentration_json = json.dumps(report_data.get('issuing_concentration', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  pix_cash_in_json = json.dumps(report_data.get('pix_cash_in', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  pix_cash_out_json = json.dumps(report_data.get('pix_cash_out', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  offense_history_json = json.dumps(report_data.get('offense_history', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  contacts_json = json.dumps(report_data.get('contacts', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  devices_json = json.dumps(report_data.get('devices', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  lawsuit_data_json = json.dumps(report_data.get('lawsuit_data', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  denied_transactions_json = json.dumps(report_data.get('denied_transactions', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  business_data_json = json.dumps(report_data.get('business_data', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  prison_transactions_json = json.dumps(report_data.get('prison_transactions', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  sanctions_history_json = json.dumps(report_data.get('sanctions_history', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  denied_pix_transactions_json = json.dumps(report_data.get('denied_pix_transactions', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  bets_pix_transfers_json = json.dumps(report_data.get('bets_pix_transfers', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  counterparty_analysis_json = json.dumps(report_data.get('counterparty_analysis', {}), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-  prompt = f"""
-Por favor, analise o caso abaixo.
+  Args:
+      flagged_users (list): Lista retornada por fetch_flagged_users
+      pep_data: Mantido por compatibilidade com merchant_report/cardholder_report
+
+  Returns:
+      dict: {user_id: (user_type, report)} com os mesmos relatórios de
+            merchant_report/cardholder_report
+  """
+  user_ids = list(dict.fromkeys(int(user["user_id"]) for user in flagged_users))
+  if not user_ids:
+    return {}
+  snapshot = latest_snapshot()
+  mart_ids = [uid for uid in user_ids if uid in snapshot.user_ids] if snapshot else []
+  live_ids = [uid for uid in user_ids if uid not in set(mart_ids)]
+  names = SHARED_BATCH_SOURCES + MERCHANT_BATCH_SOURCES
+  sources = {name: {} for name in names + CARDHOLDER_BATCH_SOURCES}
+  if mart_ids:
+    mart_cardholder_ids = [uid for uid in mart_ids if uid not in snapshot.merchant_ids]
+    for name, partitions in load_batch_sources(snapshot, names, mart_ids).items():
+      sources[name].update(partitions)
+    for name, partitions in load_batch_sources(snapshot, CARDHOLDER_BATCH_SOURCES, mart_cardholder_ids).items():
+      sources[name].update(partitions)
+    logging.info(f"Feature mart {snapshot.directory}: {len(mart_ids)} de {len(user_ids)} usuários lidos do snapshot")
+  if live_ids:
+    for name, partitions in run_fetches({name: partial(fetch_batch_source, name, live_ids) for name in names}).items():
+      sources[name].update(partitions)
+    live_cardholder_ids = [uid for uid in live_ids if uid not in sources["merchant_info"]]
+    if live_cardholder_ids:
+      for name, partitions in run_fetches({name: partial(fetch_batch_source, name, live_cardholder_ids) for name in CARDHOLDER_BATCH_SOURCES}).items():
+        sources[name].update(partitions)
+  merchant_ids = [uid for uid in user_ids if uid in sources["merchant_info"]]
+  cardholder_ids = [uid for uid in user_ids if uid not in sources["merchant_info"]]
+  frames_for = lambda uid, names: {name: sources[name].get(uid, pd.DataFrame()) for name in names}
+  # Contrapartes de todos os usuários consultadas de uma vez, sem repetição
+  resolved_counterparties = {}
+  if BDC_AVAILABLE:
+    resolved_counterparties = resolve_counterparties([
+      document for frame in sources["pix_concentration"].values() for document in _pix_counterparty_documents(frame)
+    ])
+  reports = {}
+  for uid in merchant_ids:
+    frames = frames_for(uid, SHARED_BATCH_SOURCES + MERCHANT_BATCH_SOURCES)
+    frames["issuing_concentration"] = frames.pop("merchant_issuing_concentration")
+    reports[uid] = ("Merchant", _build_merchant_report(uid, frames, resolved_counterparties))
+  for uid in cardholder_ids:
+    frames = frames_for(uid, SHARED_BATCH_SOURCES + CARDHOLDER_BATCH_SOURCES)
+    frames["issuing_concentration"] = frames.pop("cardholder_issuing_concentration")
+    reports[uid] = ("Cardholder", _build_cardholder_report(uid, frames, resolved_counterparties))
+  logging.info(f"Relatórios em lote gerados: {len(merchant_ids)} merchants, {len(cardholder_ids)} cardholders")
+  return reports
+
+# Instruções fixas do prompt. Vêm antes dos dados do usuário e não dependem dele, de modo
+# que o início da requisição (SYSTEM_PROMPT + estas instruções) é idêntico byte a byte entre
+# chamadas e aproveita o cache de prompt da OpenAI; os dados do caso ficam sempre no final.
+PROMPT_STATIC_INSTRUCTIONS = f"""
+Por favor, analise o caso descrito na seção "Dados do Caso", ao final desta mensagem.
 
 Considere os seguintes níveis de risco:
 1 - Baixo;
 2 - Médio (possível ligação com PEPs);
 3 - Alto (PEP, indivíduos ou empresas com histórico em listas de sanções, etc.)
 
-Tipo de Alerta: {alert_type}
-
-Informação do {user_type}:
-{user_info_json}
-"""
-  if user_type == 'Merchant':
-    transaction_concentration_json = json.dumps(report_data.get('transaction_concentration', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-    products_online_json = json.dumps(report_data.get('products_online', []), ensure_ascii=False, indent=2, cls=CustomJSONEncoder)
-    prompt += f"""
-Total de Transações PIX:
-- Cash In: R${report_data['total_cash_in_pix']:,.2f}
-- Cash Out: R${report_data['total_cash_out_pix']:,.2f}
-
-Transações em Horários Atípicos:
-- Cash In PIX: R${report_data['total_cash_in_pix_atypical_hours']:,.2f}
-- Cash Out PIX: R${report_data['total_cash_out_pix_atypical_hours']:,.2f}
-
-Concentração de Transações por Portador de Cartão:
-{transaction_concentration_json}
-
-Concentração de Issuing:
-{issuing_concentration_json}
-
-Transações Negadas:
-{denied_transactions_json}
-
-Histórico Profissional:
-{business_data_json}
-
-Transações Confirmadamente Executadas Dentro do Presídio (Atenção especial às colunas status e transaction_type. Transações negadas ou com errors também devem ser consideradas):
-{prison_transactions_json}
-
-Contatos:
-{contacts_json}
-
-Dispositivos Utilizados:
-{devices_json}
-
-Produtos na Loja InfinitePay:
-{products_online_json}
-
-Sanções Judiciais (Dê detalhes sobre o caso durante a análise. Pensão alimentícia ou casos de família podem ser desconsiderados):
-{sanctions_history_json}
-
-Transação PIX Negadas e motivo (coluna risk_check):
-{denied_pix_transactions_json}
-
-Concentrações PIX:
-Cash In:
-{pix_cash_in_json}
-Cash Out:
-{pix_cash_out_json}
-
-Informações sobre processos judiciais:
-{lawsuit_data_json}
-
-Histórico de Offenses:
-{offense_history_json}
-
-Transações de Apostas via PIX:
-{bets_pix_transfers_json}
-
-Análise de Contrapartes (Top 3 Cash In e Cash Out):
+Instruções para a seção "Análise de Contrapartes" (Top {COUNTERPARTY_TOP_N} Cash In e Cash Out):
 ATENÇÃO ESPECIAL: Esta seção contém análise das principais contrapartes do cliente no Big Data Corp, verificando processos judiciais e sanções.
 FOQUE ESPECIFICAMENTE EM:
 - Contrapartes com PROCESSOS JUDICIAIS (campo "has_processes": true)
-- Contrapartes com SANÇÕES (campo "has_sanctions": true) 
+- Contrapartes com SANÇÕES (campo "has_sanctions": true)
 - Nível de risco das contrapartes (campo "risk_level")
 - Detalhes dos processos: número, tribunal, assunto, status
 - Detalhes das sanções: tipo, fonte, descrição
@@ -725,87 +879,36 @@ INSTRUÇÕES PARA ANÁLISE:
 4. Detalhe os tipos de processos e sanções encontrados
 5. Avalie o impacto no risco geral do cliente
 
-{counterparty_analysis_json}
-"""
-  else:
-    prompt += f"""
-Total de Transações PIX:
-- Cash In: R${report_data['total_cash_in_pix']:,.2f}
-- Cash Out: R${report_data['total_cash_out_pix']:,.2f}
-
-Transações em Horários Atípicos:
-- Cash In PIX: R${report_data['total_cash_in_pix_atypical_hours']:,.2f}
-- Cash Out PIX: R${report_data['total_cash_out_pix_atypical_hours']:,.2f}
-
-Concentração de Issuing:
-{issuing_concentration_json}
-
-Análise Adicional para Concentração de Issuing:
-- Verifique se há repetição de merchant_name ou padrões de valores anômalos em total_amount.
-- Utilize os campos total_amount e percentage_of_total para identificar picos ou discrepâncias.
-- Considere analisar se os códigos MCC (message__card_acceptor_mcc) indicam setores de risco elevado.
-
-Contatos (Atenção para contatos com status 'blocked'):
-{contacts_json}
-
-Dispositivos Utilizados (atenção para número elevado de dispositivos):
-{devices_json}
-
-Sanções Judiciais (Dê detalhes sobre o caso durante a análise. Pensão alimentícia ou casos de família podem ser desconsiderados):
-{sanctions_history_json}
-
-Transação PIX Negadas e motivo (coluna risk_check):
-{denied_pix_transactions_json}
-
-Concentrações PIX:
-Cash In:
-{pix_cash_in_json}
-Cash Out:
-{pix_cash_out_json}
-
-Histórico Profissional:
-{business_data_json}
-
-Informações sobre processos judiciais:
-{lawsuit_data_json}
-
-Transações Confirmadamente Executadas Dentro do Presídio (Atenção especial às colunas status e transaction_type. Transações negadas ou com errors também devem ser consideradas):
-{prison_transactions_json}
-
-Histórico de Offenses:
-{offense_history_json}
-
-Transações de Apostas via PIX:
-{bets_pix_transfers_json}
+Importante - Ao final da sua análise, você DEVE incluir uma classificação de risco de lavagem de dinheiro em uma escala de 1 a 10, seguindo estas diretrizes:
 
-Análise de Contrapartes (Top 3 Cash In e Cash Out):
-ATENÇÃO ESPECIAL: Esta seção contém análise das principais contrapartes do cliente no Big Data Corp, verificando processos judiciais e sanções.
-FOQUE ESPECIFICAMENTE EM:
-- Contrapartes com PROCESSOS JUDICIAIS (campo "has_processes": true)
-- Contrapartes com SANÇÕES (campo "has_sanctions": true) 
-- Nível de risco das contrapartes (campo "risk_level")
-- Detalhes dos processos: número, tribunal, assunto, status
-- Detalhes das sanções: tipo, fonte, descrição
-- Valores transacionados com contrapartes de alto risco
+- 1 a 5: Baixo risco (Normal - não exige ação adicional)
+- 6: Médio risco (Normal com aviso de monitoramento)
+- 7 a 8: Médio-Alto risco (requer verificação)
+- 9: Alto risco (requer Business Validation urgente - BV)
+- 10: Risco extremo (requer descredenciamento e reporte ao COAF)
 
-INSTRUÇÕES PARA ANÁLISE:
-1. Identifique quantas contrapartes têm processos judiciais
-2. Identifique quantas contrapartes têm sanções
-3. Calcule o valor total transacionado com contrapartes de risco ALTO ou MÉDIO
-4. Detalhe os tipos de processos e sanções encontrados
-5. Avalie o impacto no risco geral do cliente
+Fatores para considerar na classificação de risco:
+- Volume e frequência de transações
+- Presença em listas restritivas ou processos
+- Conexões com PEPs
+- Transações em horários atípicos
+- Transações com países de alto risco
+- Compatibilidade entre perfil declarado e comportamento transacional
 
-{counterparty_analysis_json}
+Formato: "Risco de Lavagem de Dinheiro: X/10" (onde X é o número de 1 a 10)
 """
-  if alert_type == 'betting_houses_alert [BR]' and betting_houses is not None:
-    prompt += f"""
+
+# Instruções fixas de cada tipo de alerta, inseridas logo após PROMPT_STATIC_INSTRUCTIONS.
+# Dados variáveis citados por elas (casas de apostas, PEPs, features do modelo de AI) vão
+# para a seção "Dados do Caso".
+ALERT_INSTRUCTIONS = {
+  'betting_houses_alert [BR]': """
 A primeira frase da sua análise deve ser: "Cliente está transacionando com casas de apostas."
 
-Atenção especial para transações com as casas de apostas abaixo:
-{betting_houses.to_json(orient='records', force_ascii=False, indent=2)}
+Atenção especial para transações com as casas de apostas listadas na seção "Casas de Apostas" dos Dados do Caso.
 
 Para CADA transação em Cash In e Cash Out, você DEVE:
-1. Verificar se o nome da parte ou o CNPJ corresponde a alguma das casas de apostas listadas acima.
+1. Verificar se o nome da parte ou o CNPJ corresponde a alguma das casas de apostas listadas.
 2. Se houver correspondência, calcular:
  a) A soma total de valores transacionados com essa casa de apostas específica.
  b) A porcentagem que essa soma representa do valor TOTAL de Cash In ou Cash Out (conforme aplicável).
@@ -816,9 +919,8 @@ Na sua análise, descreva:
 - Discuta quaisquer padrões ou anomalias observados nessas transações.
 
 Lembre-se: Esta verificação deve ser feita para TODAS as transações, independentemente do tipo de alerta.
-"""
-  elif alert_type == 'Goverment_Corporate_Cards_Alert':
-    prompt += f"""
+""",
+  'Goverment_Corporate_Cards_Alert': """
 A primeira frase da sua análise deve ser: "Cliente está transacionando com cartões corporativos governamentais."
 
 Atenção especial para transações com BINs de cartões de crédito que começam com os seguintes prefixos:
@@ -839,9 +941,8 @@ Na sua análise, descreva:
 
 Lembre-se: Esta verificação deve ser feita para TODAS as transações de cartões de crédito relacionadas a este alerta.
 Se não houver correspondências com os BINs listados, informe explicitamente na sua análise.
-"""
-  elif alert_type == 'ch_alert [BR]':
-    prompt += f"""
+""",
+  'ch_alert [BR]': """
 A primeira frase da sua análise deve ser: "Cliente com possíveis anomalias em PIX."
 
 Atenção especial para Transações PIX:
@@ -859,9 +960,8 @@ Lembre-se: Esta verificação deve ser feita para TODAS as transações PIX rela
 Se não houver anomalias detectadas, informe explicitamente na sua análise.
 
 Além disso, você deve verificar se o usuário pode ser estrangeiro, quando nome não soar Brasileiro, ou a data de criação do CPF for muito recente.
-"""
-  elif alert_type == 'pix_merchant_alert [BR]':
-    prompt += f"""
+""",
+  'pix_merchant_alert [BR]': """
 A primeira frase da sua análise deve ser: "Cliente Merchant com possíveis anomalias em PIX Cash In."
 Atenção especial para Transações PIX Cash-In e Cash-Out:
 
@@ -877,9 +977,8 @@ Na sua análise, descreva:
 
 Lembre-se: Esta verificação deve ser feita para TODAS as transações PIX relacionadas a este alerta.
 Se não houver anomalias ou valores atípicos detectados, informe explicitamente na sua análise.
-"""
-  elif alert_type == 'international_cards_alert [BR]':
-    prompt += f"""
+""",
+  'international_cards_alert [BR]': """
 A primeira frase da sua análise deve ser: "Cliente está transacionando com cartões internacionais."
 Atenção especial para Transações com Issuer Não Brasileiro:
 
@@ -896,9 +995,8 @@ Na sua análise, descreva:
 
 Lembre-se: Esta verificação deve ser feita para TODAS as transações relacionadas a este alerta.
 Se não houver correspondências com emissores não brasileiros, informe explicitamente na sua análise.
-"""
-  elif alert_type == 'bank_slips_alert [BR]':
-    prompt += f"""
+""",
+  'bank_slips_alert [BR]': """
 A primeira frase da sua análise deve ser: "Cliente com possíveis anomalias envolvendo boletos bancários."
 
 Atenção especial para Transações com Método de Captura 'bank_slip':
@@ -916,9 +1014,8 @@ Na sua análise, descreva:
 
 Lembre-se: Esta verificação deve ser feita para TODAS as transações relacionadas a este alerta.
 Se não houver transações com método de captura 'bank_slip', informe explicitamente na sua análise.
-"""
-  elif alert_type == 'gafi_alert [US]':
-    prompt += f"""
+""",
+  'gafi_alert [US]': """
 A primeira frase da sua análise deve ser: "Cliente está transacionando com países proibidos do GAFI."
 
 Atenção especial para Transações cujo issuer seja emitido em algum dos países abaixo:
@@ -941,13 +1038,11 @@ Na sua análise, descreva:
 
 Lembre-se: Esta verificação deve ser feita para TODAS as transações relacionadas a este alerta.
 Se não houver correspondências com emissores não brasileiros, informe explicitamente na sua análise.
-"""
-  elif alert_type == 'Pep_Pix Alert' and pep_data is not None:
-    prompt += f"""
+""",
+  'Pep_Pix Alert': """
 A primeira frase da sua análise deve ser: "Cliente transacionando com Pessoas Politicamente Expostas (PEP)."
 
-Atenção especial para as transações identificadas abaixo:
-{pep_data.to_json(orient='records', force_ascii=False, indent=2)}
+Atenção especial para as transações listadas na seção "Transações com PEPs" dos Dados do Caso.
 
 Você DEVE:
 1. Para cada PEP na lista, informar:
@@ -965,17 +1060,14 @@ Na sua análise, descreva:
 - Recomendações sobre a necessidade de investigação adicional com base nos achados.
 
 Lembre-se: Esta verificação deve ser feita para TODAS as transações de Cash In e Cash Out relacionadas a este alerta.
-"""
-  elif alert_type == 'AI Alert' and features:
-    prompt += f"""
-Atenção especial às anomalias identificadas pelo modelo de AI:
-{features}
+""",
+  'AI Alert': """
+Atenção especial às anomalias identificadas pelo modelo de AI, listadas na seção "Anomalias Identificadas pelo Modelo de AI" dos Dados do Caso.
 
-Por favor, descreva os padrões ou comportamentos anômalos identificados com base nas características acima.
+Por favor, descreva os padrões ou comportamentos anômalos identificados com base nessas características.
 Você também deve analisar os demais dados disponíveis, como transações, contatos, dispositivos, issuing, produtos, para confirmar ou ajustar a suspeita de fraude.
-"""
-  elif alert_type == 'Issuing Transactions Alert':
-    prompt += f"""
+""",
+  'Issuing Transactions Alert': """
 A primeira frase da sua análise deve ser: "Cliente está transacionando altos valores via Issuing."
 
 Atenção especial para a tabela de Issuing e as seguintes informações:
@@ -987,26 +1079,215 @@ Na sua análise, descreva:
 - merchant_name com total_amount e percentage_of_total elevados.
 - Se mcc e mcc_description fazem parte de negócios de alto risco.
 - Se o país em card_acceptor_country_code é considerado um país de alto risco.
+""",
+}
+
+def _alert_instructions(alert_type: str, rendered: dict, features: str = None) -> str:
+  """Instruções fixas do alerta (vazio se o alerta não tem instruções ou faltam os dados citados)."""
+  if alert_type == 'betting_houses_alert [BR]' and 'betting_houses' not in rendered:
+    return ""
+  if alert_type == 'Pep_Pix Alert' and 'pep_data' not in rendered:
+    return ""
+  if alert_type == 'AI Alert' and not features:
+    return ""
+  return ALERT_INSTRUCTIONS.get(alert_type, "")
+
+def generate_prompt(report_data: dict, user_type: str, alert_type: str, betting_houses: pd.DataFrame = None, pep_data: pd.DataFrame = None, features: str = None) -> str:
+  """
+  Gera o prompt para o GPT com base no relatório. As seções tabulares são renderizadas
+  como TSV e, se o prompt exceder PROMPT_TOKEN_BUDGET, as de menor prioridade são
+  reduzidas ao top-N por valor mais um resumo agregado (ver prompt_utils.fit_sections).
+  """
+  user_info_key = f"{user_type.lower()}_info"
+  section_names = [
+    'issuing_concentration', 'pix_cash_in', 'pix_cash_out', 'offense_history', 'contacts',
+    'devices', 'lawsuit_data', 'denied_transactions', 'business_data', 'prison_transactions',
+    'sanctions_history', 'denied_pix_transactions', 'bets_pix_transfers'
+  ]
+  if user_type == 'Merchant':
+    section_names += ['transaction_concentration', 'products_online']
+  sections = {name: report_data.get(name, []) for name in section_names}
+  row_limits = {}
+  statistical_summary = report_data.get('statistical_summary')
+  if statistical_summary:
+    # As seções resumidas vão apenas com os maiores registros; os totais vêm do resumo
+    sections['statistical_summary'] = statistical_summary
+    row_limits = {name: STATS_TOP_K for name in SUMMARIZED_SECTIONS}
+  sections['user_info'] = report_data[user_info_key]
+  sections['counterparty_analysis'] = report_data.get('counterparty_analysis', {})
+  if alert_type == 'betting_houses_alert [BR]' and betting_houses is not None:
+    sections['betting_houses'] = betting_houses
+  elif alert_type == 'Pep_Pix Alert' and pep_data is not None:
+    sections['pep_data'] = pep_data
+  render_prompt = partial(_render_prompt, report_data, user_type, alert_type, features=features)
+  return fit_sections(sections, render_prompt, alert_type=alert_type, row_limits=row_limits)
+
+def _render_prompt(report_data: dict, user_type: str, alert_type: str, rendered: dict, features: str = None) -> str:
+  """
+  Monta o texto do prompt a partir das seções já renderizadas: primeiro as instruções
+  fixas (comuns a todos os casos e, em seguida, as do tipo de alerta) e por último os
+  dados do caso.
+  """
+  user_info_json = rendered['user_info']
+  issuing_concentration_json = rendered['issuing_concentration']
+  pix_cash_in_json = rendered['pix_cash_in']
+  pix_cash_out_json = rendered['pix_cash_out']
+  offense_history_json = rendered['offense_history']
+  contacts_json = rendered['contacts']
+  devices_json = rendered['devices']
+  lawsuit_data_json = rendered['lawsuit_data']
+  denied_transactions_json = rendered['denied_transactions']
+  business_data_json = rendered['business_data']
+  prison_transactions_json = rendered['prison_transactions']
+  sanctions_history_json = rendered['sanctions_history']
+  denied_pix_transactions_json = rendered['denied_pix_transactions']
+  bets_pix_transfers_json = rendered['bets_pix_transfers']
+  counterparty_analysis_json = rendered['counterparty_analysis']
+  prompt = PROMPT_STATIC_INSTRUCTIONS + _alert_instructions(alert_type, rendered, features)
+  prompt += f"""
+Dados do Caso:
+
+Tipo de Alerta: {alert_type}
+
+Informação do {user_type}:
+{user_info_json}
 """
-  prompt += """
+  if 'statistical_summary' in rendered:
+    prompt += f"""
+Resumo Estatístico (pré-calculado sobre TODOS os registros; use estes totais, índices HHI, participações top-K, razões de horários atípicos e valores redondos e repetições de sobrenomes em vez de recalculá-los. As tabelas de PIX, concentração e transações negadas abaixo trazem apenas os {STATS_TOP_K} maiores registros):
+{rendered['statistical_summary']}
+"""
+  if alert_type == 'betting_houses_alert [BR]' and 'betting_houses' in rendered:
+    prompt += f"""
+Casas de Apostas:
+{rendered['betting_houses']}
+"""
+  elif alert_type == 'Pep_Pix Alert' and 'pep_data' in rendered:
+    prompt += f"""
+Transações com PEPs:
+{rendered['pep_data']}
+"""
+  elif alert_type == 'AI Alert' and features:
+    prompt += f"""
+Anomalias Identificadas pelo Modelo de AI:
+{features}
+"""
+  if user_type == 'Merchant':
+    transaction_concentration_json = rendered['transaction_concentration']
+    products_online_json = rendered['products_online']
+    prompt += f"""
+Total de Transações PIX:
+- Cash In: R${report_data['total_cash_in_pix']:,.2f}
+- Cash Out: R${report_data['total_cash_out_pix']:,.2f}
 
-Importante - Ao final da sua análise, você DEVE incluir uma classificação de risco de lavagem de dinheiro em uma escala de 1 a 10, seguindo estas diretrizes:
+Transações em Horários Atípicos:
+- Cash In PIX: R${report_data['total_cash_in_pix_atypical_hours']:,.2f}
+- Cash Out PIX: R${report_data['total_cash_out_pix_atypical_hours']:,.2f}
 
-- 1 a 5: Baixo risco (Normal - não exige ação adicional)
-- 6: Médio risco (Normal com aviso de monitoramento)
-- 7 a 8: Médio-Alto risco (requer verificação)
-- 9: Alto risco (requer Business Validation urgente - BV)
-- 10: Risco extremo (requer descredenciamento e reporte ao COAF)
+Concentração de Transações por Portador de Cartão:
+{transaction_concentration_json}
 
-Fatores para considerar na classificação de risco:
-- Volume e frequência de transações
-- Presença em listas restritivas ou processos
-- Conexões com PEPs
-- Transações em horários atípicos
-- Transações com países de alto risco
-- Compatibilidade entre perfil declarado e comportamento transacional
+Concentração de Issuing:
+{issuing_concentration_json}
 
-Formato: "Risco de Lavagem de Dinheiro: X/10" (onde X é o número de 1 a 10)
+Transações Negadas:
+{denied_transactions_json}
+
+Histórico Profissional:
+{business_data_json}
+
+Transações Confirmadamente Executadas Dentro do Presídio (Atenção especial às colunas status e transaction_type. Transações negadas ou com errors também devem ser consideradas):
+{prison_transactions_json}
+
+Contatos:
+{contacts_json}
+
+Dispositivos Utilizados:
+{devices_json}
+
+Produtos na Loja InfinitePay:
+{products_online_json}
+
+Sanções Judiciais (Dê detalhes sobre o caso durante a análise. Pensão alimentícia ou casos de família podem ser desconsiderados):
+{sanctions_history_json}
+
+Transação PIX Negadas e motivo (coluna risk_check):
+{denied_pix_transactions_json}
+
+Concentrações PIX:
+Cash In:
+{pix_cash_in_json}
+Cash Out:
+{pix_cash_out_json}
+
+Informações sobre processos judiciais:
+{lawsuit_data_json}
+
+Histórico de Offenses:
+{offense_history_json}
+
+Transações de Apostas via PIX:
+{bets_pix_transfers_json}
+
+Análise de Contrapartes (Top {COUNTERPARTY_TOP_N} Cash In e Cash Out):
+{counterparty_analysis_json}
+"""
+  else:
+    prompt += f"""
+Total de Transações PIX:
+- Cash In: R${report_data['total_cash_in_pix']:,.2f}
+- Cash Out: R${report_data['total_cash_out_pix']:,.2f}
+
+Transações em Horários Atípicos:
+- Cash In PIX: R${report_data['total_cash_in_pix_atypical_hours']:,.2f}
+- Cash Out PIX: R${report_data['total_cash_out_pix_atypical_hours']:,.2f}
+
+Concentração de Issuing:
+{issuing_concentration_json}
+
+Análise Adicional para Concentração de Issuing:
+- Verifique se há repetição de merchant_name ou padrões de valores anômalos em total_amount.
+- Utilize os campos total_amount e percentage_of_total para identificar picos ou discrepâncias.
+- Considere analisar se os códigos MCC (message__card_acceptor_mcc) indicam setores de risco elevado.
+
+Contatos (Atenção para contatos com status 'blocked'):
+{contacts_json}
+
+Dispositivos Utilizados (atenção para número elevado de dispositivos):
+{devices_json}
+
+Sanções Judiciais (Dê detalhes sobre o caso durante a análise. Pensão alimentícia ou casos de família podem ser desconsiderados):
+{sanctions_history_json}
+
+Transação PIX Negadas e motivo (coluna risk_check):
+{denied_pix_transactions_json}
+
+Concentrações PIX:
+Cash In:
+{pix_cash_in_json}
+Cash Out:
+{pix_cash_out_json}
+
+Histórico Profissional:
+{business_data_json}
+
+Informações sobre processos judiciais:
+{lawsuit_data_json}
+
+Transações Confirmadamente Executadas Dentro do Presídio (Atenção especial às colunas status e transaction_type. Transações negadas ou com errors também devem ser consideradas):
+{prison_transactions_json}
+
+Histórico de Offenses:
+{offense_history_json}
+
+Transações de Apostas via PIX:
+{bets_pix_transfers_json}
+
+Análise de Contrapartes (Top {COUNTERPARTY_TOP_N} Cash In e Cash Out):
+{counterparty_analysis_json}
+"""
+  prompt += """
+Lembre-se: termine a análise com a classificação no formato "Risco de Lavagem de Dinheiro: X/10".
 """
   return prompt
 
@@ -1050,16 +1331,7 @@ def format_export_payload(user_id, description, business_validation):
     conclusion = ""
     priority = "high"
   else:
-    risk_score = 0
-    # Regex mais robusto que aceita variações na formatação
-    risk_score_match = re.search(r'(?:[Rr]isco\s+(?:de\s+[Ll]avagem\s+(?:de\s+)?[Dd]inheiro)?|[Cc]lassificação\s+(?:de\s+)?[Rr]isco):?\s*(\d+)(?:/|\s*de\s*)10', clean_description)
-    if risk_score_match:
-      risk_score = int(risk_score_match.group(1))
-    else:
-      # Tenta encontrar padrões alternativos como "Score: X/10"
-      alt_match = re.search(r'[Ss]core:?\s*(\d+)(?:/|\s*de\s*)10', clean_description)
-      if alt_match:
-        risk_score = int(alt_match.group(1))
+    risk_score = parse_risk_score(clean_description) or 0
     
     # Nova lógica de classificação baseada no score
     if risk_score <= 5:
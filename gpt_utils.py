@@ -1,6 +1,24 @@
 import os
+import re
+import json
+import time
+import random
+import hashlib
+import asyncio
+import logging
+import threading
+from collections import deque
+from functools import lru_cache
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, RateLimitError
+from cache_utils import SQLiteCache
+
+# Importar tiktoken se disponível (contagem exata de tokens)
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
 
 
 
@@ -13,6 +31,48 @@ load_dotenv()
 
 # Inicializa o cliente OpenAI
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Cliente assíncrono usado pelo agendador; as retentativas ficam a cargo do agendador
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+
+
+# Orçamentos de requisições (RPM) e tokens (TPM) por minuto de cada modelo
+MODEL_RATE_LIMITS = {
+  "gpt-4o-2024-11-20": {
+      "rpm": int(os.getenv("GPT4O_RPM", "500")),
+      "tpm": int(os.getenv("GPT4O_TPM", "450000")),
+  },
+  "o3-mini-2025-01-31": {
+      "rpm": int(os.getenv("O3_MINI_RPM", "500")),
+      "tpm": int(os.getenv("O3_MINI_TPM", "200000")),
+  },
+  "gpt-4o-mini-2024-07-18": {
+      "rpm": int(os.getenv("GPT4O_MINI_RPM", "500")),
+      "tpm": int(os.getenv("GPT4O_MINI_TPM", "200000")),
+  },
+}
+DEFAULT_RATE_LIMIT = {"rpm": 500, "tpm": 200000}
+# Tokens reservados para a resposta ao estimar o custo de cada requisição
+OUTPUT_TOKENS_ESTIMATE = int(os.getenv("OPENAI_OUTPUT_TOKENS_ESTIMATE", "1500"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "2"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+
+
+
+
+# Cache persistente de respostas, indexado pelo hash da requisição (modelo, prompts e parâmetros).
+# Apenas chamadas determinísticas são cacheadas: gpt-4o com temperature 0.0 e o3-mini
+# somente se LLM_CACHE_O3_MINI=1.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_O3_MINI = os.getenv("LLM_CACHE_O3_MINI", "0") == "1"
+llm_cache = SQLiteCache(
+  os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite"),
+  ttl_seconds=float(os.getenv("LLM_CACHE_TTL_DAYS", "7")) * 86400,
+  max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+  table="llm_responses"
+) if LLM_CACHE_ENABLED else None
 
 
 
@@ -242,54 +302,448 @@ SYSTEM_PROMPT = (
 
 
 
-def get_chatgpt_response(prompt, model="gpt-4o-2024-11-20"):
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+  # O tiktoken baixa o vocabulário no primeiro uso; sem rede, cai na estimativa por caracteres
+  if not TIKTOKEN_AVAILABLE:
+      return None
+  try:
+      try:
+          return tiktoken.encoding_for_model(model)
+      except KeyError:
+          return tiktoken.get_encoding("o200k_base")
+  except Exception as e:
+      logging.warning(f"Tokenizer indisponível para {model}, usando estimativa: {str(e)}")
+      return None
+
+
+
+
+def count_tokens(text, model="gpt-4o-2024-11-20"):
+  """
+  Conta (ou estima, sem tiktoken) o número de tokens de um texto.
+   Args:
+      text (str): Texto a ser contado.
+      model (str): Modelo cujo tokenizer deve ser usado.
+   Returns:
+      int: Número de tokens.
+  """
+  encoding = _get_encoding(model)
+  if encoding is not None:
+      return len(encoding.encode(text))
+  return len(text) // 4 + 1
+
+
+
+
+@lru_cache(maxsize=None)
+def _system_prompt_tokens(model):
+  return count_tokens(SYSTEM_PROMPT, model)
+
+
+
+
+class RateLimitScheduler:
+  """
+  Agendador de requisições por modelo com janela deslizante de 60 segundos.
+  Libera uma requisição sempre que ela cabe nos orçamentos de RPM e TPM do modelo,
+  de modo que o número de requisições em paralelo é limitado apenas pelo orçamento.
+  """
+
+  def __init__(self, limits, default_limit=DEFAULT_RATE_LIMIT):
+      self.limits = limits
+      self.default_limit = default_limit
+      self._events = {}
+      self._tokens = {}
+      self._blocked_until = {}
+      self._lock = asyncio.Lock()
+
+  def _limit(self, model):
+      return self.limits.get(model, self.default_limit)
+
+  async def acquire(self, model, tokens):
+      """Aguarda até haver orçamento para uma requisição de `tokens` tokens."""
+      limit = self._limit(model)
+      # Uma requisição maior que o TPM inteiro ainda precisa poder ser enviada
+      tokens = min(tokens, limit["tpm"])
+      while True:
+          async with self._lock:
+              now = time.monotonic()
+              events = self._events.setdefault(model, deque())
+              while events and now - events[0][0] >= 60:
+                  self._tokens[model] -= events.popleft()[1]
+              used_tokens = self._tokens.setdefault(model, 0)
+              wait = self._blocked_until.get(model, 0) - now
+              if wait <= 0:
+                  if len(events) < limit["rpm"] and used_tokens + tokens <= limit["tpm"]:
+                      events.append((now, tokens))
+                      self._tokens[model] += tokens
+                      return
+                  wait = 60 - (now - events[0][0]) if events else 0.1
+          await asyncio.sleep(max(wait, 0.05))
+
+  def penalize(self, model, delay):
+      """Suspende novas requisições do modelo por `delay` segundos (após um 429)."""
+      self._blocked_until[model] = max(self._blocked_until.get(model, 0), time.monotonic() + delay)
+
+
+
+
+_scheduler = RateLimitScheduler(MODEL_RATE_LIMITS)
+_scheduler_loop = None
+_scheduler_loop_lock = threading.Lock()
+
+
+
+
+def _get_scheduler_loop():
+  """Retorna o event loop dedicado ao agendador, iniciando-o na primeira chamada."""
+  global _scheduler_loop
+  with _scheduler_loop_lock:
+      if _scheduler_loop is None:
+          _scheduler_loop = asyncio.new_event_loop()
+          threading.Thread(target=_scheduler_loop.run_forever, name="openai-scheduler", daemon=True).start()
+  return _scheduler_loop
+
+
+
+
+def build_request_params(prompt, model, response_format=None):
+  """Parâmetros de chat.completions para o prompt (usados nas chamadas síncronas e no modo batch)."""
+  # Configura os parâmetros básicos
+  params = {
+      "model": model,
+      "messages": [
+          {"role": "system", "content": SYSTEM_PROMPT},
+          {"role": "user", "content": prompt},
+      ]
+  }
+  if response_format is not None:
+      params["response_format"] = response_format
+  # Define parâmetros específicos conforme o modelo
+  if model in ("gpt-4o-2024-11-20", "gpt-4o-mini-2024-07-18"):
+      params["temperature"] = 0.0
+  elif model == "o3-mini-2025-01-31":
+      params["reasoning_effort"] = "high"
+  return params
+
+
+
+
+def llm_cache_key(params):
+  """Hash do conteúdo da requisição (modelo, system prompt, prompt e parâmetros de amostragem)."""
+  return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+
+
+def is_llm_cacheable(params):
+  """Indica se a resposta pode ir para o cache de LLM (requisições determinísticas, temperature 0)."""
+  if llm_cache is None:
+      return False
+  if params.get("model") == "o3-mini-2025-01-31":
+      return LLM_CACHE_O3_MINI
+  return params.get("temperature") == 0.0
+
+
+
+
+def get_llm_cache_stats():
+  """Retorna as métricas do cache de respostas (hits, misses, hit_rate, entries, bytes)."""
+  return llm_cache.stats() if llm_cache is not None else {}
+
+
+
+
+# Tokens consumidos por modelo. cached_tokens (usage.prompt_tokens_details) é a parte do
+# prompt servida pelo cache de prompt da OpenAI, que só se aplica a prefixos idênticos:
+# SYSTEM_PROMPT e as instruções fixas vêm antes dos dados do caso (ver functions._render_prompt).
+_usage_lock = threading.Lock()
+_usage_stats = {}
+
+
+def usage_counts(usage):
+  """
+  Contagens de tokens de uma resposta (objeto usage da API ou dict equivalente da Batch API):
+  prompt_tokens (inclui o SYSTEM_PROMPT), cached_tokens, completion_tokens e reasoning_tokens
+  (parte de completion_tokens usada no raciocínio dos modelos o-series).
+  """
+  if not usage:
+      return {}
+  if not isinstance(usage, dict):
+      usage = usage.model_dump()
+  prompt_details = usage.get("prompt_tokens_details") or {}
+  completion_details = usage.get("completion_tokens_details") or {}
+  return {
+      "prompt_tokens": usage.get("prompt_tokens") or 0,
+      "cached_tokens": prompt_details.get("cached_tokens") or 0,
+      "completion_tokens": usage.get("completion_tokens") or 0,
+      "reasoning_tokens": completion_details.get("reasoning_tokens") or 0
+  }
+
+
+def record_usage(model, usage, usage_totals=None):
+  """
+  Acumula o uso de tokens de uma resposta nas métricas por modelo e, se informado, no
+  dict usage_totals do chamador (mesmas chaves de usage_counts).
+  """
+  counts = usage_counts(usage)
+  if not counts:
+      return
+  with _usage_lock:
+      stats = _usage_stats.setdefault(model, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "reasoning_tokens": 0})
+      stats["requests"] += 1
+      for name, value in counts.items():
+          stats[name] += value
+  if usage_totals is not None:
+      for name, value in counts.items():
+          usage_totals[name] = usage_totals.get(name, 0) + value
+
+
+def get_usage_stats():
+  """Retorna, por modelo, requests, prompt_tokens, cached_tokens, completion_tokens, reasoning_tokens e cached_rate."""
+  with _usage_lock:
+      return {
+          model: dict(stats, cached_rate=stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0)
+          for model, stats in _usage_stats.items()
+      }
+
+
+
+
+# Início das mensagens de erro customizadas retornadas no lugar da resposta do modelo
+ERROR_PREFIXES = ("An error occurred", "Opa! Não consigo tankar")
+
+
+def is_error_response(content):
+  """Indica se o conteúdo é uma mensagem de erro de error_response, e não uma resposta do modelo."""
+  return content.startswith(ERROR_PREFIXES)
+
+
+def error_response(error):
+  error_message = str(error)
+  if 'context_length_exceeded' in error_message.lower():
+      return "Opa! Não consigo tankar este caso, pois há muitas transações. Chame um analista humano - ou reptiliano - para resolver"
+  else:
+      return f"An error occurred: {error_message}"
+
+
+
+
+def _retry_delay(error, attempt):
+  """Backoff exponencial com jitter, respeitando o retry-after enviado pela API."""
+  delay = min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * (2 ** attempt))
+  delay = random.uniform(delay / 2, delay)
+  headers = getattr(getattr(error, "response", None), "headers", None) or {}
+  try:
+      if headers.get("retry-after-ms"):
+          delay = max(delay, float(headers["retry-after-ms"]) / 1000)
+      elif headers.get("retry-after"):
+          delay = max(delay, float(headers["retry-after"]))
+  except ValueError:
+      pass
+  return delay
+
+
+def parse_risk_score(description):
+  """Extrai o score de risco ("Risco de Lavagem de Dinheiro: X/10" ou variações) da análise, ou None."""
+  # Regex mais robusto que aceita variações na formatação
+  risk_score_match = re.search(r'(?:[Rr]isco\s+(?:de\s+[Ll]avagem\s+(?:de\s+)?[Dd]inheiro)?|[Cc]lassificação\s+(?:de\s+)?[Rr]isco):?\s*(\d+)(?:/|\s*de\s*)10', description)
+  if risk_score_match:
+      return int(risk_score_match.group(1))
+  # Tenta encontrar padrões alternativos como "Score: X/10"
+  alt_match = re.search(r'[Ss]core:?\s*(\d+)(?:/|\s*de\s*)10', description)
+  if alt_match:
+      return int(alt_match.group(1))
+  return None
+
+
+
+
+
+async def get_chatgpt_response_async(prompt, model="gpt-4o-2024-11-20", response_format=None, usage_totals=None):
+  """
+  Versão assíncrona de get_chatgpt_response, controlada pelo agendador de RPM/TPM.
+  Em respostas 429 aguarda com backoff e jitter e tenta novamente.
+   Args:
+      prompt (str): O prompt ou contexto a ser analisado.
+      model (str): O modelo GPT a ser utilizado (padrão: "gpt-4o-2024-11-20").
+      response_format (dict): Formato de resposta da API (ex.: json_schema), opcional.
+      usage_totals (dict): Se informado, acumula o uso de tokens da resposta (ver record_usage).
+   Returns:
+      str: Resposta do modelo ou uma mensagem de erro customizada.
+  """
+  params = build_request_params(prompt, model, response_format)
+  cache_key = llm_cache_key(params) if is_llm_cacheable(params) else None
+  if cache_key:
+      cached = await asyncio.to_thread(llm_cache.get, cache_key)
+      if cached is not None:
+          return cached
+  estimated_tokens = _system_prompt_tokens(model) + count_tokens(prompt, model) + OUTPUT_TOKENS_ESTIMATE
+  for attempt in range(OPENAI_MAX_RETRIES + 1):
+      await _scheduler.acquire(model, estimated_tokens)
+      try:
+          response = await async_client.chat.completions.create(**params)
+          record_usage(model, response.usage, usage_totals)
+          content = response.choices[0].message.content.strip()
+          if cache_key:
+              await asyncio.to_thread(llm_cache.set, cache_key, content)
+          return content
+      except RateLimitError as e:
+          if attempt == OPENAI_MAX_RETRIES or 'insufficient_quota' in str(e):
+              return error_response(e)
+          delay = _retry_delay(e, attempt)
+          logging.warning(f"Rate limit no modelo {model} (tentativa {attempt + 1}/{OPENAI_MAX_RETRIES}), aguardando {delay:.1f}s")
+          _scheduler.penalize(model, delay)
+          await asyncio.sleep(delay)
+      except Exception as e:
+          return error_response(e)
+
+
+
+
+def get_chatgpt_response(prompt, model="gpt-4o-2024-11-20", response_format=None, usage_totals=None):
   """
   Envia um prompt para o modelo GPT especificado e retorna a resposta.
+  A requisição passa pelo agendador compartilhado, então pode ser chamada de várias
+  threads ao mesmo tempo sem estourar os limites de RPM/TPM do modelo.
    Args:
       prompt (str): O prompt ou contexto a ser analisado.
       model (str): O modelo GPT a ser utilizado (padrão: "gpt-4o-2024-11-20").
+      response_format (dict): Formato de resposta da API (ex.: json_schema), opcional.
+      usage_totals (dict): Se informado, acumula o uso de tokens da resposta (ver record_usage).
    Returns:
       str: Resposta do modelo ou uma mensagem de erro customizada.
   """
-  try:
-      # Configura os parâmetros básicos
-      params = {
-          "model": model,
-          "messages": [
-              {"role": "system", "content": SYSTEM_PROMPT},
-              {"role": "user", "content": prompt},
-          ]
+  future = asyncio.run_coroutine_threadsafe(get_chatgpt_response_async(prompt, model, response_format, usage_totals), _get_scheduler_loop())
+  return future.result()
+
+
+
+
+# Modo de chamada única: a análise, o score de risco, as alíneas e a decisão final vêm em
+# uma só resposta do gpt-4o (structured outputs com JSON schema). As passadas do o3-mini
+# (score e decisão) só são feitas quando o campo correspondente não passa na validação.
+# LLM_STRUCTURED_OUTPUT=0 volta ao fluxo de três chamadas.
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+
+ANALYSIS_RESPONSE_FORMAT = {
+  "type": "json_schema",
+  "json_schema": {
+      "name": "aml_analysis",
+      "strict": True,
+      "schema": {
+          "type": "object",
+          "properties": {
+              "analysis": {
+                  "type": "string",
+                  "description": "Análise completa do caso, terminando com a linha 'Risco de Lavagem de Dinheiro: X/10'."
+              },
+              "risk_score": {
+                  "type": "integer",
+                  "description": "Classificação de risco de lavagem de dinheiro, de 1 a 10."
+              },
+              "alineas": {
+                  "type": "array",
+                  "items": {"type": "string"},
+                  "description": "Alíneas da Carta Circular 4001 do BACEN claramente identificadas no caso (ex.: 'II - a'). Lista vazia se nenhuma se aplica."
+              },
+              "decision": {
+                  "type": "string",
+                  "description": "Decisão final sobre o caso em exatamente duas linhas, com o score de risco, as principais alíneas e, se necessário, o pedido de comprovante de endereço e de renda."
+              }
+          },
+          "required": ["analysis", "risk_score", "alineas", "decision"],
+          "additionalProperties": False
       }
-      # Define parâmetros específicos conforme o modelo
-      if model == "gpt-4o-2024-11-20":
-          params["temperature"] = 0.0
-      elif model == "o3-mini-2025-01-31":
-          params["reasoning_effort"] = "high"
-        
-      response = client.chat.completions.create(**params)
-      return response.choices[0].message.content.strip()
-  except Exception as e:
-      error_message = str(e)
-      if 'context_length_exceeded' in error_message.lower():
-          return "Opa! Não consigo tankar este caso, pois há muitas transações. Chame um analista humano - ou reptiliano - para resolver"
-      else:
-          return f"An error occurred: {error_message}"
+  }
+}
+
+
+
+
+def _validate_structured_analysis(content):
+  """
+  Interpreta a resposta estruturada. Campos ausentes ou inválidos voltam como None
+  (a resposta inteira é None se não for um JSON válido ou se a análise estiver vazia).
+  """
+  try:
+      data = json.loads(content)
+  except (TypeError, ValueError):
+      return None
+  if not isinstance(data, dict) or not isinstance(data.get("analysis"), str) or not data["analysis"].strip():
+      return None
+  risk_score = data.get("risk_score")
+  if isinstance(risk_score, bool) or not isinstance(risk_score, int) or not 1 <= risk_score <= 10:
+      risk_score = None
+  alineas = data.get("alineas")
+  if not isinstance(alineas, list) or not all(isinstance(alinea, str) for alinea in alineas):
+      alineas = []
+  decision = data.get("decision")
+  if not isinstance(decision, str) or not decision.strip():
+      decision = None
+  return {
+      "analysis": data["analysis"].strip(),
+      "risk_score": risk_score,
+      "alineas": [alinea.strip() for alinea in alineas if alinea.strip()],
+      "decision": decision.strip() if decision else None
+  }
+
+
+
+
+def get_structured_analysis(prompt, model="gpt-4o-2024-11-20", usage_totals=None):
+  """
+  Análise em chamada única com structured outputs.
+   Args:
+      prompt (str): Os dados do caso para análise.
+      model (str): Modelo com suporte a JSON schema (padrão: "gpt-4o-2024-11-20").
+      usage_totals (dict): Se informado, acumula o uso de tokens da resposta.
+   Returns:
+      dict | str: analysis, risk_score, alineas e decision (campos inválidos como None);
+            None se a resposta não passar na validação do schema; ou a mensagem de erro
+            customizada (str) se a chamada à API falhar.
+  """
+  content = get_chatgpt_response(prompt, model=model, response_format=ANALYSIS_RESPONSE_FORMAT, usage_totals=usage_totals)
+  if is_error_response(content):
+      return content
+  result = _validate_structured_analysis(content)
+  if result is None:
+      logging.warning(f"Resposta estruturada inválida, usando o fluxo de três chamadas: {content[:200]}")
+  return result
 
 
 
 
-def get_analysis_and_decision(prompt):
+def get_analysis_and_decision(prompt, usage_totals=None):
   """
-  Realiza a análise completa do caso utilizando o GPT‑4 e, a partir dessa análise,
-  solicita ao modelo o3-mini-2025-01-31 que gere, em exatamente duas linhas, a decisão final.
+  Realiza a análise completa do caso e a decisão final em exatamente duas linhas.
+  Com LLM_STRUCTURED_OUTPUT, tudo vem de uma única chamada ao GPT‑4 com JSON schema;
+  o o3-mini-2025-01-31 só é chamado para o score e/ou a decisão quando esses campos
+  não passam na validação (ou sempre, com LLM_STRUCTURED_OUTPUT=0). O fluxo de três
+  chamadas só substitui a chamada estruturada quando a resposta não passa na validação do
+  schema; erros da API são retornados diretamente.
   Todo o resultado é retornado em uma única string para manter o mesmo retorno do prompt original.
    Args:
       prompt (str): Os dados do caso para análise.
+      usage_totals (dict): Se informado, acumula o uso de tokens de todas as chamadas.
    Returns:
       str: Uma string contendo a análise completa seguida da decisão final.
   """
-  # Realiza a análise completa com o GPT‑4
-  analysis = get_chatgpt_response(prompt, model="gpt-4o-2024-11-20")
+  structured = get_structured_analysis(prompt, usage_totals=usage_totals) if LLM_STRUCTURED_OUTPUT else None
+  if isinstance(structured, str):
+      return structured
+  if structured is not None:
+      analysis = structured["analysis"]
+      if structured["risk_score"] is not None and "Risco de Lavagem de Dinheiro:" not in analysis:
+          analysis += f"\n\nRisco de Lavagem de Dinheiro: {structured['risk_score']}/10"
+      if structured["alineas"]:
+          analysis += "\n\nAlíneas da Carta Circular 4001 identificadas: " + "; ".join(structured["alineas"])
+  else:
+      # Realiza a análise completa com o GPT‑4
+      analysis = get_chatgpt_response(prompt, model="gpt-4o-2024-11-20", usage_totals=usage_totals)
+      if is_error_response(analysis):
+          return analysis
    # Verifica se o score de risco já está presente na análise
   if "Risco de Lavagem de Dinheiro:" not in analysis:
       # Se não estiver, solicita ao GPT para adicionar um score de risco
@@ -300,10 +754,12 @@ def get_analysis_and_decision(prompt):
           f"{analysis}\n\n"
           "Responda apenas com: Risco de Lavagem de Dinheiro: [número]/10"
       )
-      score_response = get_chatgpt_response(score_prompt, model="o3-mini-2025-01-31")
+      score_response = get_chatgpt_response(score_prompt, model="o3-mini-2025-01-31", usage_totals=usage_totals)
     
       # Adiciona o score à análise
       analysis += f"\n\n{score_response}"
+  if structured is not None and structured["decision"] is not None:
+      return analysis + "\n\nDecisão Final:\n" + structured["decision"]
    # Cria o prompt para o o3-mini, solicitando a decisão final em exatamente duas linhas
   decision_prompt = (
       "A partir da análise detalhada a seguir, por favor, em exatamente duas linhas, apresente a decisão final sobre o caso. "
@@ -311,9 +767,9 @@ def get_analysis_and_decision(prompt):
       "Caso haja necessidade de solicitar documentos (comprovante de endereço e de renda), inclua o pedido de forma concisa:\n\n"
       f"{analysis}"
   )
-  decision = get_chatgpt_response(decision_prompt, model="o3-mini-2025-01-31")
+  decision = get_chatgpt_response(decision_prompt, model="o3-mini-2025-01-31", usage_totals=usage_totals)
    # Junta a análise e a decisão final em uma única string
-  result = analysis + "\n\nDecisão Final do 03mini:\n" + decision
+  result = analysis + "\n\nDecisão Final:\n" + decision
   return result
 
 
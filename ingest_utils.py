@@ -0,0 +1,156 @@
+import os
+import glob
+import datetime
+import logging
+import pandas as pd
+from functions import run_query
+from state_utils import StateStore
+
+# Janela padrão de alertas (em dias) quando não há marca d'água nem intervalo informado
+ALERT_WINDOW_DAYS = int(os.getenv("ALERT_WINDOW_DAYS", "2"))
+# Usuários com análise de money_laundering nos últimos ALERT_EXCLUSION_DAYS dias são excluídos
+ALERT_EXCLUSION_DAYS = int(os.getenv("ALERT_EXCLUSION_DAYS", "30"))
+
+# Ingestão incremental dos alertas: apenas alertas posteriores à marca d'água (último
+# alerta processado) são buscados. Sem marca d'água a primeira execução busca os
+# últimos ALERTS_INITIAL_LOOKBACK_DAYS dias.
+ALERTS_INITIAL_LOOKBACK_DAYS = int(os.getenv("ALERTS_INITIAL_LOOKBACK_DAYS", str(ALERT_WINDOW_DAYS)))
+ALERTS_WATERMARK_KEY = "alerts_watermark"
+
+# High-value users (excluídos da análise): total aprovado histórico >= HIGH_VALUE_TOTAL_AMOUNT
+# ou nos últimos HIGH_VALUE_WINDOW_DAYS dias >= HIGH_VALUE_WINDOW_AMOUNT. Os totais ficam em
+# Parquet local e são atualizados com as somas diárias dos dias completos ainda não sincronizados.
+HIGH_VALUE_TOTAL_AMOUNT = float(os.getenv("HIGH_VALUE_TOTAL_AMOUNT", "1000000"))
+HIGH_VALUE_WINDOW_AMOUNT = float(os.getenv("HIGH_VALUE_WINDOW_AMOUNT", "300000"))
+HIGH_VALUE_WINDOW_DAYS = int(os.getenv("HIGH_VALUE_WINDOW_DAYS", "90"))
+HIGH_VALUE_PATH = os.getenv("HIGH_VALUE_PATH", ".cache/high_value")
+HIGH_VALUE_SYNCED_KEY = "high_value_synced_until"
+
+state = StateStore()
+
+def _totals_path() -> str:
+  return os.path.join(HIGH_VALUE_PATH, "totals.parquet")
+
+def _daily_path(day: datetime.date) -> str:
+  return os.path.join(HIGH_VALUE_PATH, "daily", f"{day.isoformat()}.parquet")
+
+def _write_parquet(df: pd.DataFrame, path: str):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  temporary = f"{path}.tmp"
+  df.to_parquet(temporary, index=False)
+  os.replace(temporary, path)
+
+def _write_daily(daily: pd.DataFrame):
+  for day, group in daily.groupby("day", sort=True):
+    _write_parquet(group[["user_id", "amount"]].reset_index(drop=True), _daily_path(pd.Timestamp(day).date()))
+
+def sync_high_value_totals(today: datetime.date = None) -> datetime.date:
+  """
+  Atualiza os totais locais até o fim do dia anterior a `today`. Na primeira vez (ou se os
+  arquivos locais sumirem) faz a carga completa; depois consulta apenas os dias novos.
+
+  Returns:
+      datetime.date: Dia (exclusivo) até o qual os totais estão sincronizados
+  """
+  today = today or datetime.date.today()
+  synced_until = state.get(HIGH_VALUE_SYNCED_KEY)
+  synced_until = datetime.date.fromisoformat(synced_until) if synced_until else None
+  if synced_until is None or not os.path.exists(_totals_path()):
+    window_start = today - datetime.timedelta(days=HIGH_VALUE_WINDOW_DAYS)
+    logging.info(f"High-value users: carga completa até {today.isoformat()}")
+    totals = run_query("high_value_totals", end_date=today)
+    _write_daily(run_query("high_value_daily", start_date=window_start, end_date=today))
+    _write_parquet(totals[["user_id", "amount"]], _totals_path())
+  elif synced_until < today:
+    logging.info(f"High-value users: somando os dias de {synced_until.isoformat()} a {(today - datetime.timedelta(days=1)).isoformat()}")
+    daily = run_query("high_value_daily", start_date=synced_until, end_date=today)
+    _write_daily(daily)
+    totals = pd.concat([pd.read_parquet(_totals_path()), daily[["user_id", "amount"]]], ignore_index=True)
+    _write_parquet(totals.groupby("user_id", as_index=False)["amount"].sum(), _totals_path())
+  else:
+    return synced_until
+  state.set(HIGH_VALUE_SYNCED_KEY, today.isoformat())
+  _prune_daily(today)
+  return today
+
+def _prune_daily(today: datetime.date):
+  oldest = (today - datetime.timedelta(days=HIGH_VALUE_WINDOW_DAYS)).isoformat()
+  for path in glob.glob(os.path.join(HIGH_VALUE_PATH, "daily", "*.parquet")):
+    if os.path.basename(path)[:-len(".parquet")] < oldest:
+      os.remove(path)
+
+def high_value_users(today: datetime.date = None) -> set:
+  """Retorna o conjunto de high-value users a partir dos totais locais (sincronizando antes)."""
+  today = today or datetime.date.today()
+  sync_high_value_totals(today)
+  totals = pd.read_parquet(_totals_path())
+  users = set(totals.loc[totals["amount"] >= HIGH_VALUE_TOTAL_AMOUNT, "user_id"].astype(int))
+  oldest = (today - datetime.timedelta(days=HIGH_VALUE_WINDOW_DAYS)).isoformat()
+  paths = [
+    path for path in glob.glob(os.path.join(HIGH_VALUE_PATH, "daily", "*.parquet"))
+    if os.path.basename(path)[:-len(".parquet")] >= oldest
+  ]
+  if paths:
+    window = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    window = window.groupby("user_id")["amount"].sum()
+    users.update(int(uid) for uid in window[window >= HIGH_VALUE_WINDOW_AMOUNT].index)
+  return users
+
+def get_alerts_watermark() -> datetime.datetime:
+  """Retorna a marca d'água atual (ou o início da janela inicial, se ainda não houver)."""
+  watermark = state.get(ALERTS_WATERMARK_KEY)
+  if watermark:
+    return datetime.datetime.fromisoformat(watermark)
+  return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=ALERTS_INITIAL_LOOKBACK_DAYS)
+
+def fetch_new_alerts() -> list:
+  """
+  Busca os alertas criados depois da marca d'água (ver fetch_alerts), em ordem de
+  criação (alert_created_at), a mesma usada por commit_alerts_watermark.
+  """
+  alerts = fetch_alerts(get_alerts_watermark())
+  return sorted(alerts, key=lambda alert: pd.Timestamp(alert["alert_created_at"]))
+
+def fetch_window_alerts(days: int = ALERT_WINDOW_DAYS) -> list:
+  """Busca os alertas dos últimos `days` dias (ver fetch_alerts)."""
+  return fetch_alerts(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=int(days)))
+
+def fetch_alerts(since: datetime.datetime) -> list:
+  """
+  Busca os alertas criados depois de `since`, sem os usuários com análise recente de
+  money_laundering e sem os high-value users (calculados localmente, fora da query).
+
+  Returns:
+      list: Alertas no formato de fetch_flagged_users, com alert_created_at, na ordem
+            da query (alert_date decrescente, a mesma exibida pelo app)
+  """
+  alerts = run_query("alerts_since", since=since, exclusion_days=ALERT_EXCLUSION_DAYS)
+  if alerts.empty:
+    logging.info(f"Nenhum alerta desde {since.isoformat()}")
+    return []
+  excluded = high_value_users()
+  kept = alerts[~alerts["user_id"].astype(int).isin(excluded)]
+  logging.info(f"Alertas desde {since.isoformat()}: {len(alerts)} ({len(alerts) - len(kept)} de high-value users excluídos)")
+  records = kept.astype(object).where(kept.notna(), None).to_dict(orient="records")
+  return [dict(record, business_validation=False) for record in records]
+
+def commit_alerts_watermark(alerts: list, failed: list = ()):
+  """
+  Avança a marca d'água após a execução. Se algum alerta falhou, a marca para logo
+  antes do primeiro alerta com falha, para que ele seja buscado de novo na próxima execução.
+
+  Args:
+      alerts (list): Alertas retornados por fetch_new_alerts
+      failed (list): Alertas cuja análise falhou
+  """
+  timestamps = [alert["alert_created_at"] for alert in alerts if alert.get("alert_created_at") is not None]
+  if not timestamps:
+    return
+  failed_timestamps = [alert["alert_created_at"] for alert in failed if alert.get("alert_created_at") is not None]
+  if failed_timestamps:
+    watermark = pd.Timestamp(min(failed_timestamps)).to_pydatetime() - datetime.timedelta(microseconds=1)
+  else:
+    watermark = pd.Timestamp(max(timestamps)).to_pydatetime()
+  if watermark > get_alerts_watermark():
+    state.set(ALERTS_WATERMARK_KEY, watermark.isoformat())
+    logging.info(f"Marca d'água dos alertas atualizada para {watermark.isoformat()}")
@@ -0,0 +1,159 @@
+"""
+Runner headless do Lavandowski (sem Streamlit), para agendamento via cron/Airflow.
+
+Uso:
+    python -m lavandowski run [--user-id ID] [--simulate] [--output arquivo.jsonl] [--days N] [--refresh-cache] [--incremental] [--batch] [--analysis-mode basic|enhanced|risk_score|routed]
+    python -m lavandowski materialize [--days N] [--user-id ID]
+    python -m lavandowski invalidate-cache [--query NOME] [--user-id ID]
+
+Cada usuário analisado gera uma linha JSON na saída.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from dotenv import load_dotenv
+from functions import CustomJSONEncoder, invalidate_query_results, get_result_cache_stats, materialize_feature_mart
+from gpt_utils import get_llm_cache_stats, get_usage_stats
+from ingest_utils import commit_alerts_watermark, ALERT_WINDOW_DAYS
+from prescreen_utils import get_prescreen_stats
+from routing_utils import get_routing_stats, ANALYSIS_MODE
+from log_utils import configure_logging
+from pipeline import (
+  run_pipeline,
+  fetch_flagged_users,
+  fetch_betting_houses,
+  prefetch_reports,
+  build_stages,
+  run_batch_pipeline
+)
+
+load_dotenv()
+
+def run(args) -> int:
+  """Executa o pipeline completo e escreve uma linha JSON por usuário."""
+  started_at = time.monotonic()
+  if args.refresh_cache:
+    invalidate_query_results(user_id=args.user_id)
+  incremental = args.incremental and not args.user_id
+  flagged_users = fetch_flagged_users(user_id=args.user_id, incremental=incremental, days=args.days)
+  betting_houses = fetch_betting_houses()
+  prefetched_reports = prefetch_reports(flagged_users)
+  if args.batch:
+    if args.analysis_mode != "basic":
+      logging.warning(f"Modo de análise {args.analysis_mode} ignorado no modo batch (todas as análises usam o gpt-4o)")
+    results = run_batch_pipeline(
+      flagged_users,
+      betting_houses=betting_houses,
+      prefetched_reports=prefetched_reports,
+      key_master=os.getenv("RISK_API_KEY", ""),
+      send=not args.simulate,
+      raise_post_errors=True
+    )
+  else:
+    stages = build_stages(
+      betting_houses=betting_houses,
+      prefetched_reports=prefetched_reports,
+      key_master=os.getenv("RISK_API_KEY", ""),
+      send=not args.simulate,
+      analysis_mode=args.analysis_mode,
+      raise_post_errors=True
+    )
+    results = run_pipeline(flagged_users, stages)
+  output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+  errors = 0
+  failed = []
+  try:
+    for result in results:
+      user_data = result["item"]
+      context = result["value"] or {}
+      line = {
+        "user_id": user_data["user_id"],
+        "alert_type": user_data.get("alert_type"),
+        "alert_date": user_data.get("alert_date"),
+        "status": "error" if result["error"] is not None else "ok",
+        "resumed_from": context["ledger"]["status"] if context.get("ledger") else None,
+        "prescreen": context.get("prescreen"),
+        "user_type": context.get("user_type"),
+        "payload": context.get("export_payload"),
+        "response": context.get("response_text"),
+        "error": str(result["error"]) if result["error"] is not None else None,
+        "failed_stage": result["stage"] if result["error"] is not None else None,
+        "elapsed_seconds": round(result["elapsed"], 3)
+      }
+      if result["error"] is not None:
+        errors += 1
+        failed.append(user_data)
+      output.write(json.dumps(line, ensure_ascii=False, cls=CustomJSONEncoder) + "\n")
+      output.flush()
+  finally:
+    if output is not sys.stdout:
+      output.close()
+  if incremental and not args.simulate:
+    commit_alerts_watermark(flagged_users, failed)
+  logging.info(f"Execução concluída: {len(flagged_users)} usuários, {errors} erros, {time.monotonic() - started_at:.1f}s")
+  prescreen_stats = get_prescreen_stats()
+  if prescreen_stats["screened"]:
+    logging.info(f"Triagem: {prescreen_stats['screened']} casos, {prescreen_stats['routed_to_llm']} enviados ao LLM, {sum(prescreen_stats['auto_resolved'].values())} resolvidos automaticamente (por regra: {prescreen_stats['auto_resolved']}), {prescreen_stats['llm_calls_saved']} chamadas evitadas, positivos evidentes por regra: {prescreen_stats['hard_positives']}")
+  routing_stats = get_routing_stats()
+  for tier, stats in routing_stats["tiers"].items():
+    logging.info(f"Tier {tier} ({stats['model']}): {stats['calls']} chamadas, latência média {stats['avg_seconds']:.1f}s, {stats['prompt_tokens']} tokens de prompt ({stats['cached_tokens']} do cache de prompt), {stats['completion_tokens']} de resposta ({stats['reasoning_tokens']} de raciocínio)")
+  if routing_stats["routing"]["routed"]:
+    routing = routing_stats["routing"]
+    logging.info(f"Roteamento: {routing['routed']} casos no modelo barato, {routing['escalated']} escalados para o gpt-4o ({routing['escalation_rate']:.1%}) {routing['escalation_reasons']}, {routing['direct']} direto no gpt-4o por tamanho")
+  cache_stats = get_llm_cache_stats()
+  if cache_stats:
+    logging.info(f"Cache de respostas LLM: {cache_stats['hits']} hits, {cache_stats['misses']} misses, taxa de acerto {cache_stats['hit_rate']:.1%}")
+  for model, usage in get_usage_stats().items():
+    logging.info(f"Tokens {model}: {usage['requests']} requisições, {usage['prompt_tokens']} de prompt ({usage['cached_tokens']} do cache de prompt, {usage['cached_rate']:.1%}), {usage['completion_tokens']} de resposta ({usage['reasoning_tokens']} de raciocínio)")
+  result_cache_stats = get_result_cache_stats()
+  if result_cache_stats:
+    logging.info(f"Cache de resultados BigQuery: {result_cache_stats['hits']} hits, {result_cache_stats['misses']} misses, taxa de acerto {result_cache_stats['hit_rate']:.1%}")
+  return 1 if errors else 0
+
+def materialize(args) -> int:
+  """Materializa o feature mart (snapshot com todas as seções dos relatórios) dos usuários sinalizados."""
+  started_at = time.monotonic()
+  flagged_users = fetch_flagged_users(user_id=args.user_id, days=args.days)
+  directory = materialize_feature_mart(flagged_users)
+  logging.info(f"Materialização concluída em {time.monotonic() - started_at:.1f}s: {directory}")
+  return 0
+
+def invalidate_cache(args) -> int:
+  """Remove resultados do cache local do BigQuery (todos, de uma query ou de um usuário)."""
+  removed = invalidate_query_results(name=args.query, user_id=args.user_id)
+  logging.info(f"Invalidação do cache de resultados (query={args.query}, user_id={args.user_id}): {removed} entradas removidas")
+  return 0
+
+def main(argv=None) -> int:
+  configure_logging()
+  parser = argparse.ArgumentParser(prog="lavandowski", description="Lavandowski AML Analysis (headless)")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  run_parser = subparsers.add_parser("run", help="Analisa os usuários sinalizados e emite JSON lines")
+  run_parser.add_argument("--user-id", type=int, default=None, help="Analisa apenas este usuário (equivale a USER_ID)")
+  run_parser.add_argument("--simulate", action="store_true", help="Não envia os payloads para a API de risco")
+  run_parser.add_argument("--output", default="-", help="Arquivo JSONL de saída (padrão: stdout)")
+  run_parser.add_argument("--days", type=int, default=ALERT_WINDOW_DAYS, help="Janela de alertas em dias (ignorada com --incremental)")
+  run_parser.add_argument("--incremental", action="store_true", default=os.getenv("INCREMENTAL_INGESTION", "0") == "1", help="Analisa apenas os alertas posteriores à marca d'água da última execução")
+  run_parser.add_argument("--batch", action="store_true", default=os.getenv("OPENAI_BATCH_MODE", "0") == "1", help="Envia as análises em lote pela Batch API da OpenAI (mais barato, conclusão em até 24h)")
+  run_parser.add_argument("--analysis-mode", choices=["basic", "enhanced", "risk_score", "routed"], default=ANALYSIS_MODE, help="basic: gpt-4o; enhanced: gpt-4o com decisão final; risk_score: o3-mini; routed: modelo barato com escalonamento para o gpt-4o")
+  run_parser.add_argument("--refresh-cache", action="store_true", help="Descarta o cache local de resultados (do --user-id ou de todos) antes de executar")
+  materialize_parser = subparsers.add_parser("materialize", help="Materializa o feature mart dos usuários sinalizados (job noturno)")
+  materialize_parser.add_argument("--days", type=int, default=ALERT_WINDOW_DAYS, help="Janela de alertas em dias")
+  materialize_parser.add_argument("--user-id", type=int, default=None, help="Materializa apenas este usuário (equivale a USER_ID)")
+  invalidate_parser = subparsers.add_parser("invalidate-cache", help="Remove resultados do cache local do BigQuery")
+  invalidate_parser.add_argument("--query", default=None, help="Nome da query no catálogo (padrão: todas)")
+  invalidate_parser.add_argument("--user-id", type=int, default=None, help="Remove apenas os resultados deste usuário")
+  args = parser.parse_args(argv)
+  if args.command == "run":
+    return run(args)
+  if args.command == "materialize":
+    return materialize(args)
+  if args.command == "invalidate-cache":
+    return invalidate_cache(args)
+  return 2
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,43 @@
+import os
+import json
+import time
+import logging
+
+# Logger dos eventos estruturados do pipeline (uma linha JSON por evento)
+event_logger = logging.getLogger("lavandowski.events")
+
+def configure_logging():
+  """
+  Configura o logging raiz com o nível definido em LOG_LEVEL (DEBUG, INFO, WARNING...).
+  Payloads de depuração só são serializados quando LOG_LEVEL=DEBUG.
+  """
+  level = os.getenv("LOG_LEVEL", "INFO").upper()
+  logging.basicConfig(level=getattr(logging, level, logging.INFO))
+
+class LazyJSON:
+  """
+  Adia a serialização de um objeto para o momento da formatação da mensagem de log.
+  Usar como argumento (não em f-string): logging.debug("Payload: %s", LazyJSON(data)),
+  assim o json.dumps só é executado se o nível estiver habilitado.
+  """
+
+  __slots__ = ("data", "indent")
+
+  def __init__(self, data, indent=None):
+    self.data = data
+    self.indent = indent
+
+  def __str__(self):
+    return json.dumps(self.data, ensure_ascii=False, indent=self.indent, default=str)
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+  """
+  Emite um evento estruturado em JSON no logger lavandowski.events.
+
+  Args:
+      event (str): Nome do evento (ex.: stage_completed)
+      level (int): Nível do log
+      **fields: Campos adicionais do evento
+  """
+  if event_logger.isEnabledFor(level):
+    event_logger.log(level, "%s", LazyJSON({"event": event, "ts": round(time.time(), 3), **fields}))
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import shutil
+import datetime
+import logging
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Snapshots diários com todas as seções dos relatórios dos usuários sinalizados
+# (gerados por `python -m lavandowski materialize`). Um snapshot mais antigo que
+# FEATURE_MART_MAX_AGE_HOURS é ignorado e os relatórios voltam a ser consultados no BigQuery.
+FEATURE_MART_ENABLED = os.getenv("FEATURE_MART_ENABLED", "1") == "1"
+FEATURE_MART_PATH = os.getenv("FEATURE_MART_PATH", ".cache/feature_mart")
+FEATURE_MART_MAX_AGE_HOURS = float(os.getenv("FEATURE_MART_MAX_AGE_HOURS", "26"))
+FEATURE_MART_KEEP = max(1, int(os.getenv("FEATURE_MART_KEEP", "3")))
+
+MANIFEST_FILE = "_manifest.json"
+
+class FeatureMartSnapshot:
+  """Snapshot materializado: um Parquet por fonte (ordenado pela coluna de usuário) e um manifesto."""
+
+  def __init__(self, directory: str, manifest: dict):
+    self.directory = directory
+    self.manifest = manifest
+    self.user_ids = set(manifest["user_ids"])
+    self.merchant_ids = set(manifest["merchant_ids"])
+    self.created_at = manifest["created_at"]
+
+  def read(self, source: str) -> pa.Table:
+    """Lê a tabela de uma fonte (None se a fonte não foi materializada)."""
+    if source not in self.manifest["sources"]:
+      return None
+    return pq.read_table(os.path.join(self.directory, f"{source}.parquet"))
+
+def write_snapshot(tables: dict, user_ids: list, merchant_ids: list, sort_keys: dict, path: str = FEATURE_MART_PATH) -> str:
+  """
+  Grava um novo snapshot e o marca como o mais recente. A gravação é feita em um
+  diretório temporário renomeado no final, então um job interrompido não deixa
+  um snapshot parcial visível.
+
+  Args:
+      tables (dict): {fonte: DataFrame com o resultado em lote da fonte}
+      user_ids (list): Usuários cobertos pelo snapshot
+      merchant_ids (list): Usuários que são merchants (os demais são cardholders)
+      sort_keys (dict): {fonte: coluna de usuário usada para ordenar/agrupar os registros}
+      path (str): Diretório base dos snapshots
+
+  Returns:
+      str: Diretório do snapshot gravado
+  """
+  created_at = time.time()
+  name = datetime.datetime.fromtimestamp(created_at).strftime("%Y%m%d-%H%M%S")
+  directory = os.path.join(path, name)
+  temporary = f"{directory}.tmp"
+  shutil.rmtree(temporary, ignore_errors=True)
+  os.makedirs(temporary)
+  rows = {}
+  for source, frame in tables.items():
+    key = sort_keys.get(source)
+    if key and key in frame.columns:
+      frame = frame.sort_values(key, kind="stable")
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), os.path.join(temporary, f"{source}.parquet"))
+    rows[source] = int(len(frame))
+  manifest = {
+    "created_at": created_at,
+    "user_ids": [int(uid) for uid in user_ids],
+    "merchant_ids": [int(uid) for uid in merchant_ids],
+    "sources": rows
+  }
+  with open(os.path.join(temporary, MANIFEST_FILE), "w", encoding="utf-8") as f:
+    json.dump(manifest, f)
+  os.replace(temporary, directory)
+  for old in sorted(_snapshot_names(path))[:-FEATURE_MART_KEEP]:
+    shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+  logging.info(f"Feature mart materializado em {directory}: {len(user_ids)} usuários, {sum(rows.values())} registros")
+  return directory
+
+def _snapshot_names(path: str) -> list:
+  if not os.path.isdir(path):
+    return []
+  return [
+    entry.name for entry in os.scandir(path)
+    if entry.is_dir() and not entry.name.endswith(".tmp") and os.path.exists(os.path.join(entry.path, MANIFEST_FILE))
+  ]
+
+def latest_snapshot(path: str = FEATURE_MART_PATH, max_age_hours: float = FEATURE_MART_MAX_AGE_HOURS) -> FeatureMartSnapshot:
+  """Retorna o snapshot mais recente dentro da validade, ou None."""
+  if not FEATURE_MART_ENABLED:
+    return None
+  names = sorted(_snapshot_names(path))
+  if not names:
+    return None
+  directory = os.path.join(path, names[-1])
+  try:
+    with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+      manifest = json.load(f)
+  except (OSError, ValueError) as e:
+    logging.warning(f"Manifesto inválido no feature mart {directory}: {e}")
+    return None
+  age_hours = (time.time() - manifest["created_at"]) / 3600
+  if age_hours > max_age_hours:
+    logging.info(f"Feature mart {directory} ignorado: {age_hours:.1f}h (máximo {max_age_hours:.0f}h)")
+    return None
+  return FeatureMartSnapshot(directory, manifest)
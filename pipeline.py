@@ -0,0 +1,353 @@
+import os
+import time
+import datetime
+import logging
+import requests
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from functions import (
+  merchant_report,
+  cardholder_report,
+  batch_reports,
+  generate_prompt,
+  format_export_payload,
+  run_query
+)
+from ingest_utils import fetch_new_alerts, fetch_window_alerts, ALERT_WINDOW_DAYS
+from stats_utils import summarize_report
+from log_utils import log_event
+from state_utils import RunLedger
+from batch_utils import get_batch_responses
+from prescreen_utils import prescreen
+from routing_utils import analyze_prompt, ANALYSIS_MODE
+from gpt_utils import is_error_response, parse_risk_score
+
+load_dotenv()
+USER_ID = os.getenv("USER_ID")
+RISK_API_URL = "https://infinitepay-risk-api.services.production.cloudwalk.network/monitoring/offense_analysis"
+
+# Tamanho dos pools de cada etapa do pipeline (busca de dados, análise LLM e envio do payload)
+FETCH_WORKERS = max(1, int(os.getenv("PIPELINE_FETCH_WORKERS", "4")))
+LLM_WORKERS = max(1, int(os.getenv("PIPELINE_LLM_WORKERS", "16")))
+POST_WORKERS = max(1, int(os.getenv("PIPELINE_POST_WORKERS", "2")))
+
+# Ledger local das execuções: alertas já analisados não são reanalisados e payloads já
+# enviados não são reenviados ao retomar uma execução interrompida. RUN_LEDGER_ENABLED=0 desativa.
+run_ledger = RunLedger() if os.getenv("RUN_LEDGER_ENABLED", "1") == "1" else None
+
+def run_pipeline(items, stages):
+  """
+  Executa os itens por uma sequência de etapas, cada uma com seu próprio pool de
+  threads limitado. Assim que um item termina uma etapa ele segue para a próxima,
+  de modo que busca, análise e envio de usuários diferentes acontecem em paralelo.
+
+  Args:
+      items (list): Itens de entrada (ex.: usuários sinalizados)
+      stages (list): Lista de (nome, função, max_workers). A primeira etapa recebe o
+                     item; as seguintes recebem o retorno da etapa anterior.
+
+  Yields:
+      dict: Um resultado por item, na ordem de conclusão, com as chaves
+            index, item, value, error, stage e elapsed
+  """
+  items = list(items)
+  executors = [
+    ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pipeline-{name}")
+    for name, _, workers in stages
+  ]
+  # Limita quantos itens entram no pipeline ao mesmo tempo para não acumular
+  # resultados intermediários (relatórios, prompts) em memória
+  max_in_flight = 2 * sum(workers for _, _, workers in stages)
+  pending = {}
+  next_index = 0
+
+  def submit(index, stage_index, item, value, started_at):
+    _, func, _ = stages[stage_index]
+    future = executors[stage_index].submit(func, value)
+    pending[future] = (index, stage_index, item, started_at, time.monotonic())
+
+  def fill():
+    nonlocal next_index
+    while next_index < len(items) and len(pending) < max_in_flight:
+      submit(next_index, 0, items[next_index], items[next_index], time.monotonic())
+      next_index += 1
+
+  try:
+    fill()
+    while pending:
+      done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+      for future in done:
+        index, stage_index, item, started_at, stage_started_at = pending.pop(future)
+        stage_name = stages[stage_index][0]
+        user_id = item.get("user_id") if isinstance(item, dict) else None
+        try:
+          value = future.result()
+        except Exception as e:
+          logging.error(f"Erro na etapa {stage_name} do item {index}: {str(e)}")
+          log_event("stage_failed", logging.ERROR, stage=stage_name, index=index, user_id=user_id,
+                    seconds=round(time.monotonic() - stage_started_at, 3), error=str(e))
+          yield {
+            "index": index,
+            "item": item,
+            "value": None,
+            "error": e,
+            "stage": stage_name,
+            "elapsed": time.monotonic() - started_at
+          }
+          continue
+        log_event("stage_completed", stage=stage_name, index=index, user_id=user_id,
+                  seconds=round(time.monotonic() - stage_started_at, 3), in_flight=len(pending))
+        if stage_index + 1 < len(stages):
+          submit(index, stage_index + 1, item, value, started_at)
+        else:
+          yield {
+            "index": index,
+            "item": item,
+            "value": value,
+            "error": None,
+            "stage": stage_name,
+            "elapsed": time.monotonic() - started_at
+          }
+      fill()
+  finally:
+    for executor in executors:
+      executor.shutdown(wait=False, cancel_futures=True)
+
+def send_payload(payload, key_master):
+  """Envia o payload da análise para a API de risco e retorna o texto da resposta (HTTPError se rejeitado)."""
+  headers = {"Content-Type": "application/json", "Authorization": key_master}
+  response = requests.post(RISK_API_URL, headers=headers, json=payload)
+  response.raise_for_status()
+  return response.text
+
+def fetch_flagged_users(user_id=None, incremental=False, days=ALERT_WINDOW_DAYS):
+  """
+  Retorna os usuários sinalizados nos últimos `days` dias (ou apenas o USER_ID/user_id informado).
+  Com incremental=True, apenas os alertas posteriores à marca d'água (ver ingest_utils).
+  """
+  user_id = user_id or USER_ID
+  if user_id:
+    return [{"user_id": int(user_id), "alert_type": "Custom Alert", "business_validation": True}]
+  elif incremental:
+    return fetch_new_alerts()
+  else:
+    return fetch_window_alerts(days)
+
+def fetch_betting_houses(user_id=None):
+  """
+  Retorna uma lista de casas de apostas para o usuário específico.
+  Args:
+      user_id (str): ID do usuário (opcional)
+  Returns:
+      DataFrame: DataFrame com casas de apostas ou simulação
+  """
+  try:
+    if user_id:
+      betting_houses = run_query("betting_transactions", user_id=user_id)
+    else:
+      betting_houses = run_query("betting_houses_sample")
+    if not betting_houses.empty:
+      return betting_houses
+  except Exception as e:
+    logging.warning(f"Erro ao buscar dados de casas de apostas: {str(e)}")
+  has_betting_data = False
+  if user_id:
+    try:
+      user_id_num = int(user_id) if user_id.isdigit() else sum(ord(c) for c in user_id)
+      has_betting_data = user_id_num % 4 == 0
+    except:
+      has_betting_data = "bet" in user_id.lower() or "lavanderia" in user_id.lower()
+  if has_betting_data:
+    return pd.DataFrame([
+      {
+        "user_id": user_id,
+        "betting_house": "BetExemplo",
+        "amount": "1500.00",
+        "date": (datetime.datetime.now() - datetime.timedelta(days=5)).strftime("%Y-%m-%d")
+      },
+      {
+        "user_id": user_id,
+        "betting_house": "ApostaSim",
+        "amount": "750.00",
+        "date": (datetime.datetime.now() - datetime.timedelta(days=12)).strftime("%Y-%m-%d")
+      },
+    ])
+  return pd.DataFrame()
+
+def fetch_pep_data(user_id):
+  """Busca as transações com PEPs do usuário."""
+  return run_query("pep_data", user_id=user_id)
+
+def build_user_report(user_data, pep_data=None, prefetched_report=None):
+  """Gera (ou reaproveita) o relatório do usuário e retorna (user_type, report_data)."""
+  user_id = user_data['user_id']
+  alert_type = user_data['alert_type']
+  if prefetched_report is not None:
+    user_type, report_data = prefetched_report
+  else:
+    merchant_data = merchant_report(user_id, alert_type, pep_data=pep_data)
+    if not merchant_data['merchant_info']:
+      report_data = cardholder_report(user_id, alert_type, pep_data=pep_data)
+      user_type = "Cardholder"
+    else:
+      report_data = merchant_data
+      user_type = "Merchant"
+  report_data['user_id'] = user_id
+  return user_type, report_data
+
+def build_user_prompt(user_data, betting_houses=None, pep_data=None, prefetched_report=None):
+  """Gera (ou reaproveita) o relatório do usuário e retorna (user_type, prompt)."""
+  alert_type = user_data['alert_type']
+  features = user_data.get('features')
+  user_type, report_data = build_user_report(user_data, pep_data=pep_data, prefetched_report=prefetched_report)
+  report_data['statistical_summary'] = summarize_report(report_data)
+  prompt = generate_prompt(report_data, user_type, alert_type, betting_houses=betting_houses, pep_data=pep_data, features=features)
+  return user_type, prompt
+
+def prefetch_reports(flagged_users):
+  """
+  Gera os relatórios em lote; em caso de erro retorna {} e cada usuário é consultado individualmente.
+  Alertas que já têm análise registrada no ledger não são consultados.
+  """
+  if run_ledger is not None:
+    flagged_users = [user for user in flagged_users if run_ledger.get(user) is None]
+  try:
+    return batch_reports(flagged_users)
+  except Exception as e:
+    logging.warning(f"Erro ao gerar relatórios em lote, usando consultas individuais: {str(e)}")
+    return {}
+
+def record_analysis(user_data, user_type, analysis, export_payload):
+  """
+  Registra a análise no ledger. Mensagens de erro do LLM e respostas sem score não são
+  registradas: na retomada esses alertas são analisados de novo, em vez de a falha ser
+  reaproveitada e enviada como análise concluída.
+  """
+  if run_ledger is None:
+    return
+  if is_error_response(analysis) or not export_payload.get("conclusion") or parse_risk_score(export_payload["description"]) is None:
+    logging.warning(f"Análise do usuário {user_data['user_id']} sem resultado válido, não registrada no ledger")
+    return
+  run_ledger.record_analysis(user_data, user_type, export_payload)
+
+def build_stages(betting_houses=None, prefetched_reports=None, key_master="", send=True, analysis_mode=ANALYSIS_MODE, raise_post_errors=False):
+  """
+  Monta as etapas do pipeline de análise (fetch → llm → post) usadas tanto pelo
+  app Streamlit quanto pelo runner headless. Com o ledger ativo, alertas já analisados
+  pulam as etapas fetch e llm (o payload registrado é reutilizado) e alertas já
+  enviados não são reenviados. Casos resolvidos pela triagem determinística
+  (prescreen_utils) pulam a etapa llm.
+
+  Args:
+      betting_houses (DataFrame): Casas de apostas para o prompt
+      prefetched_reports (dict): Relatórios gerados por batch_reports
+      key_master (str): Chave de autorização da API de risco
+      send (bool): Se False, a etapa de envio do payload é omitida (simulação)
+      analysis_mode (str): Modo de análise do LLM (ver routing_utils.ANALYSIS_MODES)
+      raise_post_errors (bool): Se True, um envio rejeitado pela API de risco (HTTP 4xx/5xx)
+          é um erro da etapa post (runner headless); se False, o status e a resposta
+          são devolvidos em response_status e response_text (app Streamlit). Em ambos
+          os casos o envio não é marcado no ledger e é refeito na retomada.
+
+  Returns:
+      list: Etapas no formato esperado por run_pipeline
+  """
+  prefetched_reports = prefetched_reports or {}
+
+  def fetch_stage(user_data):
+    entry = run_ledger.get(user_data) if run_ledger is not None else None
+    if entry is not None:
+      return {"user_data": user_data, "user_type": entry["user_type"], "prompt": None, "export_payload": entry["payload"], "ledger": entry}
+    pep_data = fetch_pep_data(user_data['user_id'])
+    report = build_user_report(user_data, pep_data=pep_data, prefetched_report=prefetched_reports.get(int(user_data['user_id'])))
+    user_type, report_data = report
+    screening = prescreen(report_data, user_type, user_data['alert_type'])
+    if screening is not None:
+      export_payload = format_export_payload(user_data['user_id'], screening["description"], user_data.get("business_validation", False))
+      record_analysis(user_data, user_type, screening["description"], export_payload)
+      return {"user_data": user_data, "user_type": user_type, "prompt": None, "export_payload": export_payload, "prescreen": screening["rule"]}
+    _, prompt = build_user_prompt(user_data, betting_houses=betting_houses, pep_data=pep_data, prefetched_report=report)
+    return {"user_data": user_data, "user_type": user_type, "prompt": prompt}
+
+  def llm_stage(context):
+    if context["prompt"] is None:
+      return context
+    user_data = context["user_data"]
+    gpt_analysis = analyze_prompt(context["prompt"], analysis_mode)
+    context["export_payload"] = format_export_payload(user_data['user_id'], gpt_analysis, user_data.get("business_validation", False))
+    record_analysis(user_data, context["user_type"], gpt_analysis, context["export_payload"])
+    return context
+
+  def post_stage(context):
+    entry = context.get("ledger")
+    if entry is not None and entry["status"] == "posted":
+      logging.info(f"Payload do usuário {context['user_data']['user_id']} já enviado, envio ignorado")
+      context["response_text"] = entry["response_text"]
+      return context
+    try:
+      context["response_text"] = send_payload(context["export_payload"], key_master)
+    except requests.HTTPError as e:
+      if raise_post_errors:
+        raise
+      logging.error(f"Payload do usuário {context['user_data']['user_id']} rejeitado pela API de risco: HTTP {e.response.status_code}")
+      context["response_status"] = e.response.status_code
+      context["response_text"] = e.response.text
+      return context
+    if run_ledger is not None:
+      run_ledger.record_post(context["user_data"], context["response_text"])
+    return context
+
+  stages = [
+    ("fetch", fetch_stage, FETCH_WORKERS),
+    ("llm", llm_stage, LLM_WORKERS),
+  ]
+  if send:
+    stages.append(("post", post_stage, POST_WORKERS))
+  return stages
+
+def run_batch_pipeline(flagged_users, betting_houses=None, prefetched_reports=None, key_master="", send=True, backend=None, raise_post_errors=False):
+  """
+  Variante do pipeline para a execução noturna pela Batch API da OpenAI: os relatórios e
+  prompts de todos os usuários são gerados primeiro, as análises são enviadas em um único
+  lote (ver batch_utils) e, com as respostas mapeadas de volta aos usuários, os payloads
+  são formatados e enviados. Alertas já registrados no ledger e casos resolvidos pela
+  triagem não entram no lote.
+
+  Args:
+      flagged_users (list): Usuários sinalizados
+      betting_houses (DataFrame): Casas de apostas para o prompt
+      prefetched_reports (dict): Relatórios gerados por batch_reports
+      key_master (str): Chave de autorização da API de risco
+      send (bool): Se False, os payloads não são enviados (simulação)
+      backend: Backend da Batch API (padrão: OPENAI_BATCH_BACKEND)
+      raise_post_errors (bool): Ver build_stages
+
+  Yields:
+      dict: Um resultado por item, no mesmo formato de run_pipeline
+  """
+  stages = build_stages(betting_houses=betting_houses, prefetched_reports=prefetched_reports, key_master=key_master, send=send, raise_post_errors=raise_post_errors)
+  stages_by_name = {name: (name, func, workers) for name, func, workers in stages}
+  contexts = []
+  for result in run_pipeline(flagged_users, [stages_by_name["fetch"]]):
+    if result["error"] is not None:
+      yield result
+    else:
+      contexts.append(result)
+  prompts = {str(position): entry["value"]["prompt"] for position, entry in enumerate(contexts) if entry["value"]["prompt"] is not None}
+  started_at = time.monotonic()
+  responses = get_batch_responses(prompts, backend=backend) if prompts else {}
+  log_event("batch_completed", requests=len(prompts), seconds=round(time.monotonic() - started_at, 3))
+  for position, entry in enumerate(contexts):
+    context = entry["value"]
+    if context["prompt"] is not None:
+      user_data = context["user_data"]
+      context["export_payload"] = format_export_payload(user_data['user_id'], responses[str(position)], user_data.get("business_validation", False))
+      record_analysis(user_data, context["user_type"], responses[str(position)], context["export_payload"])
+  if not send:
+    for entry in contexts:
+      yield dict(entry, stage="llm", elapsed=entry["elapsed"] + time.monotonic() - started_at)
+    return
+  for result in run_pipeline([entry["value"] for entry in contexts], [stages_by_name["post"]]):
+    entry = contexts[result["index"]]
+    yield dict(result, index=entry["index"], item=entry["item"], elapsed=entry["elapsed"] + result["elapsed"])
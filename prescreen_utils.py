@@ -0,0 +1,151 @@
+import os
+import threading
+import logging
+
+# Triagem determinística antes do LLM: casos evidentes são resolvidos com uma descrição
+# padronizada e apenas os casos ambíguos seguem para a análise do GPT. PRESCREEN_ENABLED=0
+# envia todos os casos ao LLM.
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "1") == "1"
+
+# Caso trivial: relatório sem movimentação PIX e sem nenhum registro nas seções listadas
+# (processos, sanções, transações negadas, presídio e apostas). PRESCREEN_TRIVIAL_ALERT_TYPES
+# restringe a regra a alguns tipos de alerta, com os valores de alert_type da query
+# alerts_since (ex.: "CH Alert,Merchant_Pix Alert"); vazio aplica a todos os alertas.
+PRESCREEN_TRIVIAL_ALERT_TYPES = [
+  alert_type.strip() for alert_type in os.getenv("PRESCREEN_TRIVIAL_ALERT_TYPES", "").split(",")
+  if alert_type.strip()
+]
+PRESCREEN_TRIVIAL_EMPTY_SECTIONS = [
+  section.strip() for section in os.getenv(
+    "PRESCREEN_TRIVIAL_EMPTY_SECTIONS",
+    "pix_cash_in,pix_cash_out,lawsuit_data,sanctions_history,denied_transactions,denied_pix_transactions,bets_pix_transfers,prison_transactions"
+  ).split(",")
+  if section.strip()
+]
+PRESCREEN_TRIVIAL_SCORE = int(os.getenv("PRESCREEN_TRIVIAL_SCORE", "1"))
+
+# Positivos evidentes: "prison_transactions" (transações executadas dentro de presídio) e
+# "current_sanction" (contraparte com IsCurrentlySanctioned no Big Data Corp). Por padrão
+# (PRESCREEN_HARD_POSITIVE_ACTION=llm) esses casos seguem para o LLM e são apenas contados;
+# com PRESCREEN_HARD_POSITIVE_ACTION=auto são resolvidos como suspeitos sem análise do LLM.
+PRESCREEN_HARD_POSITIVE_RULES = [
+  rule.strip() for rule in os.getenv("PRESCREEN_HARD_POSITIVE_RULES", "prison_transactions,current_sanction").split(",")
+  if rule.strip()
+]
+PRESCREEN_HARD_POSITIVE_ACTION = os.getenv("PRESCREEN_HARD_POSITIVE_ACTION", "llm")
+PRESCREEN_HARD_POSITIVE_SCORE = int(os.getenv("PRESCREEN_HARD_POSITIVE_SCORE", "9"))
+
+_stats_lock = threading.Lock()
+_stats = {"screened": 0, "routed_to_llm": 0, "auto_resolved": {}, "hard_positives": {}}
+
+def _rows(value) -> int:
+  """Quantidade de registros de uma seção (DataFrame ou lista); 0 se ausente."""
+  try:
+    return len(value)
+  except TypeError:
+    return 0
+
+def _sanctioned_counterparties(report_data: dict) -> list:
+  """Contrapartes com sanção vigente (flag IsCurrentlySanctioned do BDC) na análise de contrapartes."""
+  analysis = report_data.get("counterparty_analysis") or {}
+  return [
+    counterparty
+    for key in ("top_cash_in_analysis", "top_cash_out_analysis")
+    for counterparty in analysis.get(key, [])
+    if any(sanction.get("type") == "Current Sanction" for sanction in counterparty.get("sanctions", []))
+  ]
+
+def _hard_positive(report_data: dict, user_type: str, alert_type: str) -> dict:
+  if "prison_transactions" in PRESCREEN_HARD_POSITIVE_RULES and _rows(report_data.get("prison_transactions")):
+    count = _rows(report_data["prison_transactions"])
+    return {
+      "rule": "prison_transactions",
+      "description": (
+        f"Triagem automática: o {user_type} possui {count} transação(ões) confirmadamente "
+        "executada(s) dentro de presídio. Caso encaminhado para Business Validation urgente, com solicitação "
+        "de comprovante de endereço e de renda.\n\n"
+        f"Risco de Lavagem de Dinheiro: {PRESCREEN_HARD_POSITIVE_SCORE}/10"
+      )
+    }
+  if "current_sanction" in PRESCREEN_HARD_POSITIVE_RULES:
+    sanctioned = _sanctioned_counterparties(report_data)
+    if sanctioned:
+      names = ", ".join(sorted({str(counterparty.get("party_name") or counterparty.get("name") or "sem nome") for counterparty in sanctioned}))
+      total = sum(float(counterparty.get("transaction_amount") or 0) for counterparty in sanctioned)
+      return {
+        "rule": "current_sanction",
+        "description": (
+          f"Triagem automática: o {user_type} transacionou R${total:,.2f} via PIX com "
+          f"contraparte(s) atualmente sancionada(s) segundo o Big Data Corp: {names}. Caso encaminhado para "
+          "Business Validation urgente, com solicitação de comprovante de endereço e de renda.\n\n"
+          f"Risco de Lavagem de Dinheiro: {PRESCREEN_HARD_POSITIVE_SCORE}/10"
+        )
+      }
+  return None
+
+def _trivial(report_data: dict, user_type: str, alert_type: str) -> dict:
+  if PRESCREEN_TRIVIAL_ALERT_TYPES and alert_type not in PRESCREEN_TRIVIAL_ALERT_TYPES:
+    return None
+  if report_data.get("total_cash_in_pix") or report_data.get("total_cash_out_pix"):
+    return None
+  if any(_rows(report_data.get(section)) for section in PRESCREEN_TRIVIAL_EMPTY_SECTIONS):
+    return None
+  return {
+    "rule": "trivial",
+    "description": (
+      f"Triagem automática: o {user_type} não possui movimentação PIX no período analisado, "
+      "nem processos judiciais, sanções, transações negadas, transações em presídio ou transferências para "
+      "casas de apostas. Não há elementos que sustentem a suspeita do alerta; caso normalizado.\n\n"
+      f"Risco de Lavagem de Dinheiro: {PRESCREEN_TRIVIAL_SCORE}/10"
+    )
+  }
+
+def prescreen(report_data: dict, user_type: str, alert_type: str) -> dict:
+  """
+  Aplica as regras determinísticas ao relatório montado por merchant_report/cardholder_report.
+
+  Args:
+      report_data (dict): Relatório do usuário
+      user_type (str): "Merchant" ou "Cardholder"
+      alert_type (str): Tipo do alerta
+
+  Returns:
+      dict: {"rule", "description"} se o caso foi resolvido pela triagem (a descrição
+            termina com o score, no formato esperado por format_export_payload), ou
+            None se o caso deve seguir para o LLM
+  """
+  if not PRESCREEN_ENABLED:
+    return None
+  hard_positive = _hard_positive(report_data, user_type, alert_type)
+  if hard_positive is not None:
+    result = hard_positive if PRESCREEN_HARD_POSITIVE_ACTION == "auto" else None
+  else:
+    result = _trivial(report_data, user_type, alert_type)
+  with _stats_lock:
+    _stats["screened"] += 1
+    if hard_positive is not None:
+      _stats["hard_positives"][hard_positive["rule"]] = _stats["hard_positives"].get(hard_positive["rule"], 0) + 1
+    if result is None:
+      _stats["routed_to_llm"] += 1
+    else:
+      _stats["auto_resolved"][result["rule"]] = _stats["auto_resolved"].get(result["rule"], 0) + 1
+  if result is not None:
+    logging.info(f"Usuário {report_data.get('user_id')} resolvido na triagem ({result['rule']}), sem chamada ao LLM")
+  elif hard_positive is not None:
+    logging.info(f"Usuário {report_data.get('user_id')} com positivo evidente na triagem ({hard_positive['rule']}), enviado ao LLM")
+  return result
+
+def get_prescreen_stats() -> dict:
+  """
+  Retorna screened, routed_to_llm, auto_resolved (por regra), hard_positives (positivos
+  evidentes encontrados, por regra, resolvidos ou não) e llm_calls_saved.
+  """
+  with _stats_lock:
+    auto_resolved = dict(_stats["auto_resolved"])
+    return {
+      "screened": _stats["screened"],
+      "routed_to_llm": _stats["routed_to_llm"],
+      "auto_resolved": auto_resolved,
+      "hard_positives": dict(_stats["hard_positives"]),
+      "llm_calls_saved": sum(auto_resolved.values())
+    }
@@ -0,0 +1,182 @@
+import os
+import csv
+import json
+import decimal
+import datetime
+import logging
+import pandas as pd
+from gpt_utils import count_tokens
+
+# Orçamento de tokens do prompt do usuário (o SYSTEM_PROMPT e a resposta ficam fora desta conta)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "90000"))
+# Número mínimo de linhas mantidas por seção antes de reduzi-la apenas ao resumo agregado
+PROMPT_MIN_ROWS = int(os.getenv("PROMPT_MIN_ROWS", "5"))
+
+# Ordem em que as seções são compactadas quando o prompt excede o orçamento
+# (primeiro as de menor prioridade). Seções fora da lista nunca são truncadas.
+COMPACTION_ORDER = [
+  "devices",
+  "contacts",
+  "products_online",
+  "denied_transactions",
+  "denied_pix_transactions",
+  "business_data",
+  "offense_history",
+  "transaction_concentration",
+  "issuing_concentration",
+  "bets_pix_transfers",
+  "prison_transactions",
+  "lawsuit_data",
+  "sanctions_history",
+  "pix_cash_out",
+  "pix_cash_in",
+  "betting_houses",
+  "pep_data",
+]
+
+# Seções que são o foco de cada tipo de alerta; só são compactadas depois de todas as outras.
+# As chaves são os valores de alert_type retornados pelas queries de alertas (alerts_since)
+ALERT_FOCUS_SECTIONS = {
+  "Betting_Houses_Alert": ["betting_houses", "bets_pix_transfers", "pix_cash_in", "pix_cash_out"],
+  "CH Alert": ["pix_cash_in", "pix_cash_out"],
+  "Merchant_Pix Alert": ["pix_cash_in", "pix_cash_out"],
+  "Pf_Merchant_Pix Alert": ["pix_cash_in", "pix_cash_out"],
+  "Pep_Pix Alert": ["pep_data", "pix_cash_in", "pix_cash_out"],
+  "Issuing Transactions Alert": ["issuing_concentration"],
+  "Goverment_Corporate_Cards_Alert": ["transaction_concentration"],
+}
+
+# Colunas de valor das seções, em ordem de preferência: ordenam as linhas ao manter apenas
+# o top-N de uma seção e são a base das estatísticas de stats_utils
+AMOUNT_COLUMNS = ["pix_amount", "total_amount", "total_approved_by_ch", "amount", "transfer_amount"]
+
+def _json_default(value):
+  if isinstance(value, decimal.Decimal):
+    return float(value)
+  if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date)):
+    return value.isoformat()
+  return str(value)
+
+def render_json(data) -> str:
+  """Serializa em JSON compacto (sem indentação)."""
+  return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+def _as_frame(rows) -> pd.DataFrame:
+  return rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+
+def _is_table(data) -> bool:
+  return isinstance(data, pd.DataFrame) or (isinstance(data, list) and all(isinstance(row, dict) for row in data))
+
+def render_table(rows) -> str:
+  """
+  Renderiza um DataFrame (ou lista de registros) como tabela TSV (cabeçalho + uma linha
+  por registro), bem mais compacta em tokens do que o JSON indentado.
+  """
+  frame = _as_frame(rows)
+  if frame.empty:
+    return "(nenhum registro)"
+  frame = frame.copy(deep=False)
+  for column in frame.select_dtypes(include=["object", "string"]).columns:
+    values = frame[column]
+    frame[column] = values.where(values.isna(), values.astype(str).str.replace(r"[\t\r\n]+", " ", regex=True))
+  return frame.to_csv(
+    sep="\t", index=False, na_rep="", float_format="%.2f", lineterminator="\n",
+    quoting=csv.QUOTE_NONE, escapechar="\\"
+  ).rstrip("\n")
+
+def _amount_column(frame: pd.DataFrame):
+  for column in AMOUNT_COLUMNS:
+    if column in frame.columns and pd.to_numeric(frame[column], errors="coerce").notna().any():
+      return column
+  return None
+
+def _top(rows, keep: int):
+  frame = _as_frame(rows).reset_index(drop=True)
+  column = _amount_column(frame)
+  if column is None:
+    return frame, frame.head(keep), None, None
+  amounts = pd.to_numeric(frame[column], errors="coerce").fillna(0.0)
+  return frame, frame.loc[amounts.nlargest(keep).index], column, amounts
+
+def top_rows(rows, keep: int) -> pd.DataFrame:
+  """Retorna as `keep` linhas de maior valor (pela primeira coluna de AMOUNT_COLUMNS presente)."""
+  return _top(rows, keep)[1]
+
+def summarize_rows(rows, keep: int) -> str:
+  """
+  Mantém as `keep` linhas de maior valor (pela primeira coluna de AMOUNT_COLUMNS presente,
+  ou na ordem original) e agrega as demais em uma linha de resumo.
+  """
+  frame, kept, column, amounts = _top(rows, keep)
+  summary = f"[{len(frame) - len(kept)} de {len(frame)} registros omitidos por limite de tamanho"
+  if column:
+    total = amounts.sum()
+    omitted_total = total - amounts.loc[kept.index].sum()
+    summary += f"; {column} somado dos omitidos: {omitted_total:,.2f}; {column} total da seção: {total:,.2f}"
+  summary += "]"
+  if kept.empty:
+    return summary
+  return f"{render_table(kept)}\n{summary}"
+
+def render_section(data) -> str:
+  """Renderiza uma seção do relatório: tabelas (DataFrame ou lista de registros) como TSV, demais valores como JSON compacto."""
+  if _is_table(data):
+    return render_table(data)
+  return render_json(data)
+
+def _compaction_order(alert_type: str) -> list:
+  focus = ALERT_FOCUS_SECTIONS.get(alert_type, [])
+  return [name for name in COMPACTION_ORDER if name not in focus] + [name for name in COMPACTION_ORDER if name in focus]
+
+def fit_sections(sections: dict, render_prompt, alert_type: str = None, budget: int = PROMPT_TOKEN_BUDGET, row_limits: dict = None) -> str:
+  """
+  Monta o prompt dentro do orçamento de tokens.
+
+  Args:
+      sections (dict): Dados de cada seção (nome -> lista de registros ou dict)
+      render_prompt (callable): Recebe {nome: texto renderizado} e devolve o prompt completo
+      alert_type (str): Tipo de alerta, usado para preservar as seções em foco
+      budget (int): Número máximo de tokens do prompt
+      row_limits (dict): Máximo de linhas por seção (nome -> N); apenas as N de maior valor
+          são renderizadas, mas os resumos da compactação somam a seção inteira
+
+  Returns:
+      str: Prompt renderizado. Se não couber nem com todas as seções reduzidas a resumo,
+           retorna a versão mais compacta possível.
+  """
+  row_limits = {
+    name: limit for name, limit in (row_limits or {}).items()
+    if _is_table(sections.get(name)) and len(sections[name]) > limit
+  }
+  rendered = {
+    name: render_table(top_rows(data, row_limits[name])) if name in row_limits else render_section(data)
+    for name, data in sections.items()
+  }
+  prompt = render_prompt(rendered)
+  excess = count_tokens(prompt) - budget
+  if excess <= 0:
+    return prompt
+  original_tokens = excess + budget
+  section_tokens = {name: count_tokens(text) for name, text in rendered.items()}
+  order = [name for name in _compaction_order(alert_type) if _is_table(sections.get(name)) and len(sections[name])]
+  kept_rows = {name: row_limits.get(name, len(sections[name])) for name in order}
+  # Primeira passada reduz até PROMPT_MIN_ROWS linhas; a segunda deixa apenas o resumo agregado
+  for min_rows in (PROMPT_MIN_ROWS, 0):
+    for name in order:
+      while excess > 0 and kept_rows[name] > min_rows:
+        kept_rows[name] = max(min_rows, kept_rows[name] // 2)
+        text = summarize_rows(sections[name], kept_rows[name])
+        tokens = count_tokens(text)
+        excess -= section_tokens[name] - tokens
+        section_tokens[name] = tokens
+        rendered[name] = text
+      if excess <= 0:
+        break
+    if excess <= 0:
+      break
+  prompt = render_prompt(rendered)
+  final_tokens = count_tokens(prompt)
+  logging.info(f"Prompt compactado de {original_tokens} para {final_tokens} tokens (orçamento {budget})")
+  if final_tokens > budget:
+    logging.warning(f"Prompt excede o orçamento mesmo após compactação: {final_tokens} > {budget} tokens")
+  return prompt
@@ -0,0 +1,622 @@
+import os
+import datetime
+from google.cloud import bigquery
+
+# Opções padrão dos jobs do catálogo (cada query pode sobrescrever com as mesmas chaves).
+# BQ_MAXIMUM_BYTES_BILLED=0 deixa os jobs sem limite de bytes faturados.
+BQ_MAXIMUM_BYTES_BILLED = int(os.getenv("BQ_MAXIMUM_BYTES_BILLED", "0")) or None
+BQ_USE_QUERY_CACHE = os.getenv("BQ_USE_QUERY_CACHE", "1") == "1"
+# Labels aplicados a todos os jobs para atribuição de custo (o nome da query é adicionado em "query")
+BQ_JOB_LABELS = {"app": os.getenv("BQ_LABEL_APP", "lavandowski")}
+
+# Validade do cache local de resultados (functions.run_query) por perfil de atualização:
+# fontes transacionais (PIX, transações, cadastro do usuário) por minutos; processos,
+# sanções, relacionamentos, contatos e dispositivos por um dia
+RESULT_TTL_TRANSACTIONAL = float(os.getenv("BQ_RESULT_CACHE_TRANSACTIONAL_MINUTES", "15")) * 60
+RESULT_TTL_DAILY = float(os.getenv("BQ_RESULT_CACHE_DAILY_HOURS", "24")) * 3600
+
+# Tipo de cada parâmetro aceito pelas queries do catálogo. Os valores são convertidos
+# para o tipo declarado, então um user_id inválido falha antes de chegar ao BigQuery.
+PARAMETER_TYPES = {
+  "user_id": "INT64",
+  "user_ids": "ARRAY<INT64>",
+  "days": "INT64",
+  "since": "TIMESTAMP",
+  "exclusion_days": "INT64",
+  "start_date": "DATE",
+  "end_date": "DATE",
+}
+
+# Catálogo de queries: nome -> {"sql", "params" e opções do job}. Colunas de user_id
+# em STRING são comparadas com CAST(@user_id AS STRING), mantendo o parâmetro sempre INT64.
+# Opções: "maximum_bytes_billed", "labels" (somados a BQ_JOB_LABELS), "use_query_cache" e
+# "result_cache_ttl" (segundos no cache local; sem a chave o resultado não é guardado).
+QUERIES = {
+  # Relatório individual (merchant_report / cardholder_report)
+  "merchant_info": {
+    "sql": "SELECT * FROM metrics_amlft.merchant_report WHERE user_id = @user_id LIMIT 1",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "cardholder_info": {
+    "sql": "SELECT * FROM metrics_amlft.cardholder_report WHERE user_id = @user_id LIMIT 1",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "merchant_issuing_concentration": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_issuing_payments_data`
+    WHERE user_id = @user_id
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "cardholder_issuing_concentration": {
+    "sql": "SELECT * EXCEPT(user_id) FROM metrics_amlft.issuing_concentration WHERE user_id = @user_id",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "pix_concentration": {
+    "sql": "SELECT * FROM metrics_amlft.pix_concentration WHERE user_id = @user_id",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "transaction_concentration": {
+    "sql": """
+    SELECT * EXCEPT(merchant_id) FROM `infinitepay-production.metrics_amlft.cardholder_concentration`
+    WHERE merchant_id = @user_id ORDER BY total_approved_by_ch DESC
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "offense_history": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis_data`
+    WHERE user_id = @user_id ORDER BY id DESC
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "products_online": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_online_store_data`
+    WHERE user_id = @user_id
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "contacts": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_phonecast_data`
+    WHERE user_id = @user_id
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "report"}
+  },
+  "devices": {
+    "sql": "SELECT * EXCEPT(user_id) FROM metrics_amlft.user_device WHERE user_id = @user_id",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "report"}
+  },
+  "lawsuit_data": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_lawsuits_data`
+    WHERE user_id = @user_id
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "report"}
+  },
+  "business_data": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_business_relationships_data`
+    WHERE user_id = @user_id
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "report"}
+  },
+  "sanctions_history": {
+    "sql": "SELECT * FROM infinitepay-production.metrics_amlft.sanctions_history WHERE user_id = @user_id",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "report"}
+  },
+  "denied_transactions": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_risk_transactions_data`
+    WHERE merchant_id = @user_id ORDER BY card_number
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "denied_pix_transactions": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_risk_pix_transfers_data`
+    WHERE debitor_user_id = CAST(@user_id AS STRING) ORDER BY str_pix_transfer_id DESC
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "prison_transactions": {
+    "sql": "SELECT * EXCEPT(user_id) FROM infinitepay-production.metrics_amlft.prison_transactions WHERE user_id = @user_id",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "bets_pix_transfers": {
+    "sql": """
+    SELECT
+      transfer_type,
+      pix_status,
+      user_id,
+      user_name,
+      gateway,
+      gateway_document_number,
+      gateway_pix_key,
+      gateway_name,
+      SUM(transfer_amount) total_amount,
+      COUNT(pix_transfer_id) count_transactions
+    FROM `infinitepay-production.metrics_amlft.bets_pix_transfers`
+    WHERE user_id = @user_id
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "pep_data": {
+    "sql": "SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_pep_transactions_data` WHERE user_id = @user_id",
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "betting_transactions": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_betting_transactions_data`
+    WHERE user_id = CAST(@user_id AS STRING)
+    """,
+    "params": ["user_id"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "report"}
+  },
+  "betting_houses_sample": {
+    "sql": "SELECT * FROM `infinitepay-production.external_sources.betting_houses_document_numbers` LIMIT 10",
+    "params": [],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "report"}
+  },
+
+  # Relatórios em lote (batch_reports): mesma fonte para todos os usuários do lote
+  "batch_merchant_info": {
+    "sql": "SELECT * FROM metrics_amlft.merchant_report WHERE user_id IN UNNEST(@user_ids)",
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_cardholder_info": {
+    "sql": "SELECT * FROM metrics_amlft.cardholder_report WHERE user_id IN UNNEST(@user_ids)",
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_merchant_issuing_concentration": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_issuing_payments_data`
+    WHERE user_id IN UNNEST(@user_ids)
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_cardholder_issuing_concentration": {
+    "sql": "SELECT * FROM metrics_amlft.issuing_concentration WHERE user_id IN UNNEST(@user_ids)",
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_pix_concentration": {
+    "sql": "SELECT * FROM metrics_amlft.pix_concentration WHERE user_id IN UNNEST(@user_ids)",
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_transaction_concentration": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.cardholder_concentration`
+    WHERE merchant_id IN UNNEST(@user_ids) ORDER BY total_approved_by_ch DESC
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_offense_history": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis_data`
+    WHERE user_id IN UNNEST(@user_ids) ORDER BY id DESC
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_products_online": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_online_store_data`
+    WHERE user_id IN UNNEST(@user_ids)
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_contacts": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_phonecast_data`
+    WHERE user_id IN UNNEST(@user_ids)
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_devices": {
+    "sql": "SELECT * FROM metrics_amlft.user_device WHERE user_id IN UNNEST(@user_ids)",
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_lawsuit_data": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_lawsuits_data`
+    WHERE user_id IN UNNEST(@user_ids)
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_business_data": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_business_relationships_data`
+    WHERE user_id IN UNNEST(@user_ids)
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_sanctions_history": {
+    "sql": "SELECT * FROM infinitepay-production.metrics_amlft.sanctions_history WHERE user_id IN UNNEST(@user_ids)",
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_DAILY,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_denied_transactions": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_risk_transactions_data`
+    WHERE merchant_id IN UNNEST(@user_ids) ORDER BY card_number
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_denied_pix_transactions": {
+    "sql": """
+    SELECT * FROM `infinitepay-production.metrics_amlft.lavandowski_risk_pix_transfers_data`
+    WHERE debitor_user_id IN (SELECT CAST(id AS STRING) FROM UNNEST(@user_ids) AS id)
+    ORDER BY str_pix_transfer_id DESC
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_prison_transactions": {
+    "sql": "SELECT * FROM infinitepay-production.metrics_amlft.prison_transactions WHERE user_id IN UNNEST(@user_ids)",
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+  "batch_bets_pix_transfers": {
+    "sql": """
+    SELECT
+      transfer_type,
+      pix_status,
+      user_id,
+      user_name,
+      gateway,
+      gateway_document_number,
+      gateway_pix_key,
+      gateway_name,
+      SUM(transfer_amount) total_amount,
+      COUNT(pix_transfer_id) count_transactions
+    FROM `infinitepay-production.metrics_amlft.bets_pix_transfers`
+    WHERE user_id IN UNNEST(@user_ids)
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+    """,
+    "params": ["user_ids"],
+    "result_cache_ttl": RESULT_TTL_TRANSACTIONAL,
+    "labels": {"component": "batch_report"}
+  },
+
+  # Dashboard do app Streamlit
+  "dashboard_stats": {
+    "sql": """
+    SELECT
+        COUNT(*) as total_analises,
+        SUM(CASE WHEN conclusion = 'suspicious' THEN 1 ELSE 0 END) as total_suspeitos,
+        AVG(risk_score) as score_medio,
+        AVG(processing_time) as tempo_medio
+    FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
+    WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
+    """,
+    "params": ["days"],
+    "labels": {"component": "dashboard"}
+  },
+  "dashboard_weekly_trend": {
+    "sql": """
+    WITH semana_atual AS (
+        SELECT COUNT(*) as total
+        FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
+        WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)
+    ),
+    semana_anterior AS (
+        SELECT COUNT(*) as total
+        FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
+        WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL 14 DAY)
+        AND DATE(created_at) < DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)
+    )
+    SELECT
+        a.total as total_atual,
+        b.total as total_anterior,
+        CASE
+            WHEN b.total > 0 THEN ROUND((a.total - b.total) / b.total * 100)
+            ELSE 0
+        END as variacao_percentual
+    FROM semana_atual a, semana_anterior b
+    """,
+    "params": [],
+    "labels": {"component": "dashboard"}
+  },
+  "dashboard_alert_types": {
+    "sql": """
+    SELECT
+        alert_type,
+        COUNT(*) as total
+    FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
+    WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
+    GROUP BY alert_type
+    ORDER BY total DESC
+    LIMIT 5
+    """,
+    "params": ["days"],
+    "labels": {"component": "dashboard"}
+  },
+  "dashboard_risk_levels": {
+    "sql": """
+    SELECT
+        CASE
+            WHEN risk_score BETWEEN 1 AND 3 THEN 'Baixo'
+            WHEN risk_score BETWEEN 4 AND 7 THEN 'Médio'
+            ELSE 'Alto'
+        END as nivel_risco,
+        COUNT(*) as total
+    FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
+    WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
+    GROUP BY nivel_risco
+    ORDER BY
+        CASE nivel_risco
+            WHEN 'Baixo' THEN 1
+            WHEN 'Médio' THEN 2
+            WHEN 'Alto' THEN 3
+        END
+    """,
+    "params": ["days"],
+    "labels": {"component": "dashboard"}
+  },
+  "dashboard_daily_trend": {
+    "sql": """
+    SELECT
+        DATE(created_at) as data,
+        COUNT(*) as total
+    FROM `infinitepay-production.metrics_amlft.lavandowski_offense_analysis`
+    WHERE DATE(created_at) >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
+    GROUP BY data
+    ORDER BY data
+    """,
+    "params": ["days"],
+    "labels": {"component": "dashboard"}
+  },
+
+  # Alertas (ingest_utils): alertas criados depois de @since (marca d'água da ingestão
+  # incremental ou início da janela de dias) e somas diárias de transações aprovadas por
+  # merchant para o conjunto de high-value users. Os filtros de data ficam direto nas colunas
+  # de particionamento (created_at e timestamp) para que só as partições da janela sejam lidas.
+  "alerts_since": {
+    "sql": """
+    WITH excluded_users AS (
+      -- quem teve offense de money_laundering nos últimos @exclusion_days dias (os
+      -- high-value users são excluídos localmente, ver ingest_utils)
+      SELECT DISTINCT a.user_id
+      FROM maindb.offense_analyses a
+      JOIN maindb.offenses o
+        ON a.offense_id = o.id
+      WHERE 
+        o.name = 'money_laundering'
+        AND (
+          (a.conclusion = 'normal'     AND a.priority IN ('low', 'mid', 'high'))
+          OR (a.conclusion = 'suspicious' AND a.priority IN ('mid', 'high'))
+          OR (a.conclusion = 'offense'    AND a.priority IN ('mid', 'high'))
+        )
+        AND a.created_at >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @exclusion_days DAY)
+        AND a.automatic_pipeline = TRUE
+    ),
+
+    traditional_alerts AS (
+      SELECT
+        an.user_id,
+        FORMAT_TIMESTAMP('%d-%m-%Y', an.created_at) AS alert_date,
+        CASE
+          WHEN an.analyst_id = 8423054  THEN 'CH Alert'
+          WHEN an.analyst_id = 8832903  THEN 'Pep_Pix Alert'
+          WHEN an.analyst_id = 15858378 THEN 'GAFI Alert'
+          WHEN an.analyst_id = 16368511 THEN 'Merchant_Pix Alert'
+          WHEN an.analyst_id = 18758930 THEN 'International_Cards_Alert'
+          WHEN an.analyst_id = 19897830 THEN 'Bank_Slips_Alert'
+          WHEN an.analyst_id = 20583019 THEN 'Goverment_Corporate_Cards_Alert'
+          WHEN an.analyst_id = 20698248 THEN 'Betting_Houses_Alert'
+          WHEN an.analyst_id = 25071066 THEN 'GAFI Alert [US]'
+          WHEN an.analyst_id = 25261377 THEN 'international_cards_alert [US]'
+          WHEN an.analyst_id = 24954170 THEN 'ted_transfers_alert'
+          WHEN an.analyst_id = 34767121 THEN 'Pf_Merchant_Pix Alert'
+          WHEN an.analyst_id = 25769012 THEN 'Issuing Transactions Alert'
+          WHEN an.analyst_id = 27951634 THEN 'Foreigners_Alert'
+          WHEN an.analyst_id = 28279057 THEN 'acquiring_jim_us_alert [US]'
+          WHEN an.analyst_id = 28320827 THEN 'aml_acquiring_prohibited_countries_jim_us_alert [US]'
+          WHEN an.analyst_id = 29865856 THEN 'international_location_attempts_alert'
+          WHEN an.analyst_id = 29842685 THEN 'aml_prison_areas_alert'
+          WHEN an.analyst_id = 30046553 THEN 'aml_pix_change_atm_alert'
+          WHEN an.analyst_id = 29840096 THEN 'aml_blocked_contacts_alert'
+          WHEN an.analyst_id = 36239197 THEN 'cnpj_merchant_pix_aml_ctf_alert'
+        END AS alert_type,
+        CAST(NULL      AS FLOAT64) AS score,
+        CAST(NULL      AS STRING ) AS features,
+        MAX(an.created_at) AS alert_created_at
+      FROM `infinitepay-production.maindb.offense_analyses` an
+      JOIN `infinitepay-production.maindb.offenses` o
+        ON an.offense_id = o.id
+      LEFT JOIN `infinitepay-production.maindb.offense_actions` act
+        ON act.offense_analysis_id = an.id
+      WHERE 
+        o.name = 'money_laundering'
+        AND an.created_at > @since
+        AND an.analyst_id IN (
+          8423054, 8832903, 15858378, 16368511, 18758930,
+          19897830, 20583019, 20698248, 25071066, 25261377,
+          24954170, 25769012, 27951634, 28279057, 28320827,
+          29865856, 29842685, 30046553, 29840096, 34767121,
+          36239197
+        )
+      GROUP BY 1, 2, 3, 4, 5
+    ),
+
+    ai_alerts AS (
+      SELECT
+        user_id,
+        FORMAT_TIMESTAMP('%d-%m-%Y', TIMESTAMP(timestamp)) AS alert_date,
+        'AI Alert'               AS alert_type,
+        CAST(score   AS FLOAT64) AS score,
+        CAST(features AS STRING ) AS features,
+        TIMESTAMP(timestamp)     AS alert_created_at
+      FROM `ai-services-sae.aml_model.predictions`
+      WHERE
+        timestamp >= DATE(@since)
+        AND TIMESTAMP(timestamp) > @since
+        AND label = 1
+    ),
+
+    all_alerts AS (
+      SELECT * FROM traditional_alerts
+      UNION ALL
+      SELECT * FROM ai_alerts
+    )
+
+    SELECT *
+    FROM all_alerts
+    WHERE user_id NOT IN (SELECT user_id FROM excluded_users)
+    ORDER BY alert_date DESC
+    """,
+    "params": ["since", "exclusion_days"],
+    "labels": {"component": "ingestion"}
+  },
+  "high_value_totals": {
+    "sql": """
+    SELECT t.merchant_id AS user_id, SUM(t.amount) AS amount
+    FROM `infinitepay-production.maindb.transactions` t
+    WHERE t.status = 'approved' AND t.created_at < TIMESTAMP(@end_date)
+    GROUP BY 1
+    """,
+    "params": ["end_date"],
+    "labels": {"component": "ingestion"}
+  },
+  "high_value_daily": {
+    "sql": """
+    SELECT t.merchant_id AS user_id, DATE(t.created_at) AS day, SUM(t.amount) AS amount
+    FROM `infinitepay-production.maindb.transactions` t
+    WHERE
+      t.status = 'approved'
+      AND t.created_at >= TIMESTAMP(@start_date)
+      AND t.created_at < TIMESTAMP(@end_date)
+    GROUP BY 1, 2
+    """,
+    "params": ["start_date", "end_date"],
+    "labels": {"component": "ingestion"}
+  },
+}
+
+def normalize_params(name: str, params: dict) -> dict:
+  """
+  Valida e converte os parâmetros de uma query do catálogo para os tipos declarados
+  em PARAMETER_TYPES (ex.: user_id="123" -> 123). Parâmetros não declarados são ignorados.
+
+  Raises:
+      KeyError: Query desconhecida ou parâmetro não informado
+      ValueError: Valor que não pode ser convertido para o tipo declarado
+  """
+  spec = QUERIES[name]
+  missing = [param for param in spec["params"] if param not in params]
+  if missing:
+    raise KeyError(f"Parâmetros ausentes para a query {name}: {', '.join(missing)}")
+  return {param: _convert(PARAMETER_TYPES[param], params[param]) for param in spec["params"]}
+
+def _convert(parameter_type: str, value):
+  if parameter_type.startswith("ARRAY<"):
+    return [_convert(parameter_type[len("ARRAY<"):-1], item) for item in value]
+  if parameter_type == "TIMESTAMP":
+    value = value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(str(value))
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+  if parameter_type == "DATE":
+    if isinstance(value, datetime.datetime):
+      return value.date()
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value))
+  return int(value)
+
+def _query_parameter(name: str, value):
+  parameter_type = PARAMETER_TYPES[name]
+  if parameter_type.startswith("ARRAY<"):
+    return bigquery.ArrayQueryParameter(name, parameter_type[len("ARRAY<"):-1], value)
+  return bigquery.ScalarQueryParameter(name, parameter_type, value)
+
+def prepare_query(name: str, **params):
+  """
+  Monta uma query do catálogo com seus parâmetros e opções de job.
+
+  Args:
+      name (str): Nome da query em QUERIES
+      **params: Valores dos parâmetros declarados (ex.: user_id=123, user_ids=[1, 2])
+
+  Returns:
+      tuple: (sql, QueryJobConfig), prontos para client.query(sql, job_config=...)
+
+  Raises:
+      KeyError: Query desconhecida ou parâmetro não informado
+      ValueError: Valor de parâmetro que não pode ser convertido para o tipo declarado
+  """
+  spec = QUERIES[name]
+  params = normalize_params(name, params)
+  maximum_bytes_billed = spec.get("maximum_bytes_billed", BQ_MAXIMUM_BYTES_BILLED)
+  job_config = bigquery.QueryJobConfig(
+    query_parameters=[_query_parameter(param, value) for param, value in params.items()],
+    labels={**BQ_JOB_LABELS, **spec.get("labels", {}), "query": name},
+    use_query_cache=spec.get("use_query_cache", BQ_USE_QUERY_CACHE)
+  )
+  if maximum_bytes_billed:
+    job_config.maximum_bytes_billed = maximum_bytes_billed
+  return spec["sql"], job_config
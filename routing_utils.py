@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+import logging
+from gpt_utils import get_chatgpt_response, get_analysis_and_decision, count_tokens, parse_risk_score, is_error_response
+from log_utils import log_event
+
+# Modos de análise (opção "Tipo de Análise" do app ou --analysis-mode do runner):
+# - basic: uma chamada ao gpt-4o (comportamento original do pipeline)
+# - enhanced: análise do gpt-4o com decisão final (get_analysis_and_decision)
+# - risk_score: análise e pontuação de risco em uma chamada ao o3-mini
+# - routed: modelo mais barato primeiro; escala para o gpt-4o só se o score cair na faixa
+#   de incerteza, se não houver score ou se o prompt for grande demais para o modelo barato
+ANALYSIS_MODES = {
+  "Básica (GPT-4)": "basic",
+  "Aprimorada (GPT-4 + o3-mini)": "enhanced",
+  "Com Pontuação de Risco (o3-mini)": "risk_score",
+  "Roteada (GPT-4o mini + GPT-4o)": "routed",
+}
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "basic")
+
+ROUTING_STRONG_MODEL = "gpt-4o-2024-11-20"
+RISK_SCORE_MODEL = "o3-mini-2025-01-31"
+ROUTING_CHEAP_MODEL = os.getenv("ROUTING_CHEAP_MODEL", "gpt-4o-mini-2024-07-18")
+# Faixa de scores (inclusive) em que a resposta do modelo barato é refeita pelo gpt-4o
+ROUTING_ESCALATION_MIN_SCORE = int(os.getenv("ROUTING_ESCALATION_MIN_SCORE", "5"))
+ROUTING_ESCALATION_MAX_SCORE = int(os.getenv("ROUTING_ESCALATION_MAX_SCORE", "8"))
+# Prompts acima deste tamanho (tokens) vão direto para o gpt-4o
+ROUTING_MAX_CHEAP_PROMPT_TOKENS = int(os.getenv("ROUTING_MAX_CHEAP_PROMPT_TOKENS", "20000"))
+
+_stats_lock = threading.Lock()
+_tier_stats = {}
+_routing_stats = {"routed": 0, "direct": 0, "escalated": 0, "escalation_reasons": {}}
+
+def _timed_call(tier: str, call, model: str) -> str:
+  """
+  Executa call(usage_totals) e acumula a latência e os tokens do tier, somando o usage
+  real das respostas da API (respostas servidas pelo cache de LLM não consomem tokens).
+  """
+  usage = {}
+  started_at = time.monotonic()
+  response = call(usage)
+  seconds = time.monotonic() - started_at
+  with _stats_lock:
+    stats = _tier_stats.setdefault(tier, {
+      "model": model, "calls": 0, "seconds": 0.0,
+      "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "reasoning_tokens": 0
+    })
+    stats["calls"] += 1
+    stats["seconds"] += seconds
+    for name, value in usage.items():
+      stats[name] += value
+  log_event("llm_tier_completed", tier=tier, model=model, seconds=round(seconds, 3), **usage)
+  return response
+
+def _escalation_reason(response: str):
+  if is_error_response(response):
+    return "error"
+  score = parse_risk_score(response)
+  if score is None:
+    return "no_score"
+  if ROUTING_ESCALATION_MIN_SCORE <= score <= ROUTING_ESCALATION_MAX_SCORE:
+    return "uncertain_score"
+  return None
+
+def route_analysis(prompt: str) -> str:
+  """
+  Análise roteada: o modelo barato (ROUTING_CHEAP_MODEL) responde primeiro e a resposta
+  é mantida se o score estiver fora da faixa de incerteza; caso contrário, o caso é
+  refeito pelo gpt-4o. Prompts maiores que ROUTING_MAX_CHEAP_PROMPT_TOKENS vão direto
+  para o gpt-4o.
+  """
+  prompt_tokens = count_tokens(prompt, ROUTING_CHEAP_MODEL)
+  if prompt_tokens > ROUTING_MAX_CHEAP_PROMPT_TOKENS:
+    with _stats_lock:
+      _routing_stats["direct"] += 1
+    log_event("llm_routed", tier="strong", reason="prompt_size", prompt_tokens=prompt_tokens)
+    return _timed_call("strong", lambda usage: get_chatgpt_response(prompt, model=ROUTING_STRONG_MODEL, usage_totals=usage), ROUTING_STRONG_MODEL)
+  response = _timed_call("cheap", lambda usage: get_chatgpt_response(prompt, model=ROUTING_CHEAP_MODEL, usage_totals=usage), ROUTING_CHEAP_MODEL)
+  reason = _escalation_reason(response)
+  with _stats_lock:
+    _routing_stats["routed"] += 1
+    if reason is not None:
+      _routing_stats["escalated"] += 1
+      _routing_stats["escalation_reasons"][reason] = _routing_stats["escalation_reasons"].get(reason, 0) + 1
+  if reason is None:
+    return response
+  log_event("llm_escalated", reason=reason, cheap_score=parse_risk_score(response), prompt_tokens=prompt_tokens)
+  return _timed_call("strong", lambda usage: get_chatgpt_response(prompt, model=ROUTING_STRONG_MODEL, usage_totals=usage), ROUTING_STRONG_MODEL)
+
+def analyze_prompt(prompt: str, mode: str = ANALYSIS_MODE) -> str:
+  """
+  Retorna a análise do prompt conforme o modo (basic, enhanced, risk_score ou routed).
+
+  Args:
+      prompt (str): Prompt gerado por generate_prompt
+      mode (str): Modo de análise (chave ou valor de ANALYSIS_MODES)
+
+  Returns:
+      str: Análise (terminando com o score de risco) ou mensagem de erro customizada
+  """
+  mode = ANALYSIS_MODES.get(mode, mode)
+  if mode == "routed":
+    return route_analysis(prompt)
+  if mode == "enhanced":
+    return _timed_call("enhanced", lambda usage: get_analysis_and_decision(prompt, usage_totals=usage), ROUTING_STRONG_MODEL)
+  if mode == "risk_score":
+    return _timed_call("risk_score", lambda usage: get_chatgpt_response(prompt, model=RISK_SCORE_MODEL, usage_totals=usage), RISK_SCORE_MODEL)
+  if mode != "basic":
+    logging.warning(f"Modo de análise desconhecido '{mode}', usando basic")
+  return _timed_call("strong", lambda usage: get_chatgpt_response(prompt, model=ROUTING_STRONG_MODEL, usage_totals=usage), ROUTING_STRONG_MODEL)
+
+def get_routing_stats() -> dict:
+  """
+  Retorna as métricas por tier (model, calls, seconds, avg_seconds, prompt_tokens,
+  cached_tokens, completion_tokens, reasoning_tokens) e do roteamento (routed, direct, escalated, escalation_rate e
+  escalation_reasons).
+  """
+  with _stats_lock:
+    tiers = {
+      tier: dict(stats, avg_seconds=stats["seconds"] / stats["calls"] if stats["calls"] else 0.0)
+      for tier, stats in _tier_stats.items()
+    }
+    routing = dict(_routing_stats, escalation_reasons=dict(_routing_stats["escalation_reasons"]))
+  routing["escalation_rate"] = routing["escalated"] / routing["routed"] if routing["routed"] else 0.0
+  return {"tiers": tiers, "routing": routing}
@@ -0,0 +1,145 @@
+import os
+import json
+import hashlib
+import time
+import sqlite3
+import threading
+
+# Estado persistente entre execuções (marcas d'água da ingestão incremental etc.)
+STATE_PATH = os.getenv("STATE_PATH", ".cache/state.sqlite")
+# Por quantos dias o ledger de execuções guarda os alertas já analisados/enviados
+RUN_LEDGER_RETENTION_DAYS = float(os.getenv("RUN_LEDGER_RETENTION_DAYS", "30"))
+
+class StateStore:
+  """
+  Armazena valores serializáveis em JSON por chave, sem expiração, em SQLite.
+  Ao contrário do SQLiteCache, o conteúdo é estado da aplicação e não pode ser
+  descartado (ex.: a marca d'água do último alerta processado).
+  """
+
+  def __init__(self, path: str = STATE_PATH):
+    self.path = path
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("""
+      CREATE TABLE IF NOT EXISTS state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at REAL NOT NULL
+      )
+    """)
+    self._conn.commit()
+
+  def get(self, key: str, default=None):
+    with self._lock:
+      row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+  def set(self, key: str, value):
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO state (key, value, updated_at) VALUES (?, ?, ?)",
+        (key, json.dumps(value, default=str), time.time())
+      )
+      self._conn.commit()
+
+  def delete(self, key: str):
+    with self._lock:
+      self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+      self._conn.commit()
+
+class RunLedger:
+  """
+  Ledger das execuções do pipeline: registra, por alerta (user_id, alert_date, alert_type),
+  a etapa concluída ("analyzed" ou "posted"), o payload gerado e seu hash. Permite retomar
+  uma execução interrompida sem refazer análises já pagas e sem reenviar payloads à API de risco.
+  Alertas sem alert_date (ex.: análise manual de um USER_ID) não são registrados.
+  """
+
+  def __init__(self, path: str = STATE_PATH, retention_days: float = RUN_LEDGER_RETENTION_DAYS):
+    self.path = path
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("""
+      CREATE TABLE IF NOT EXISTS run_ledger (
+        user_id INTEGER NOT NULL,
+        alert_date TEXT NOT NULL,
+        alert_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        user_type TEXT,
+        payload TEXT,
+        payload_hash TEXT,
+        response_text TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (user_id, alert_date, alert_type)
+      )
+    """)
+    self._conn.execute("DELETE FROM run_ledger WHERE updated_at < ?", (time.time() - retention_days * 86400,))
+    self._conn.commit()
+
+  @staticmethod
+  def key(user_data: dict):
+    """Chave do alerta no ledger, ou None se o alerta não tem data."""
+    if not user_data.get("alert_date"):
+      return None
+    return (int(user_data["user_id"]), str(user_data["alert_date"]), str(user_data.get("alert_type") or ""))
+
+  def get(self, user_data: dict) -> dict:
+    """Retorna o registro do alerta (status, user_type, payload, payload_hash, response_text) ou None."""
+    key = self.key(user_data)
+    if key is None:
+      return None
+    with self._lock:
+      row = self._conn.execute(
+        "SELECT status, user_type, payload, payload_hash, response_text FROM run_ledger WHERE user_id = ? AND alert_date = ? AND alert_type = ?",
+        key
+      ).fetchone()
+    if row is None:
+      return None
+    return {
+      "status": row[0],
+      "user_type": row[1],
+      "payload": json.loads(row[2]) if row[2] else None,
+      "payload_hash": row[3],
+      "response_text": row[4]
+    }
+
+  def record_analysis(self, user_data: dict, user_type: str, payload: dict):
+    """Registra o payload gerado pela análise (etapa "analyzed")."""
+    key = self.key(user_data)
+    if key is None:
+      return
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    with self._lock:
+      self._conn.execute(
+        """
+        INSERT INTO run_ledger (user_id, alert_date, alert_type, status, user_type, payload, payload_hash, updated_at)
+        VALUES (?, ?, ?, 'analyzed', ?, ?, ?, ?)
+        ON CONFLICT (user_id, alert_date, alert_type) DO UPDATE SET
+          status = 'analyzed', user_type = excluded.user_type, payload = excluded.payload,
+          payload_hash = excluded.payload_hash, updated_at = excluded.updated_at
+        WHERE run_ledger.status != 'posted'
+        """,
+        (*key, user_type, serialized, hashlib.sha256(serialized.encode("utf-8")).hexdigest(), time.time())
+      )
+      self._conn.commit()
+
+  def record_post(self, user_data: dict, response_text: str):
+    """Marca o payload do alerta como enviado à API de risco (etapa "posted")."""
+    key = self.key(user_data)
+    if key is None:
+      return
+    with self._lock:
+      self._conn.execute(
+        "UPDATE run_ledger SET status = 'posted', response_text = ?, updated_at = ? WHERE user_id = ? AND alert_date = ? AND alert_type = ?",
+        (response_text, time.time(), *key)
+      )
+      self._conn.commit()
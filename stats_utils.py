@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import pandas as pd
+from prompt_utils import AMOUNT_COLUMNS
+
+# Quantidade de linhas de cada seção resumida que ainda vai para o prompt (maiores valores)
+STATS_TOP_K = int(os.getenv("STATS_TOP_K", "10"))
+# Valores múltiplos deste número são considerados "redondos"
+ROUND_AMOUNT_BASE = float(os.getenv("ROUND_AMOUNT_BASE", "100"))
+
+# Seções do relatório cujas linhas brutas são substituídas pelo resumo + top-K no prompt,
+# com a coluna de valor e a coluna de nome (contraparte/portador/estabelecimento) de cada uma
+SUMMARIZED_SECTIONS = {
+  "pix_cash_in": ("pix_amount", "party"),
+  "pix_cash_out": ("pix_amount", "party"),
+  "transaction_concentration": ("total_approved_by_ch", None),
+  "issuing_concentration": ("total_amount", "merchant_name"),
+  "denied_transactions": (None, None),
+}
+
+NAME_COLUMNS = ["party", "cardholder_name", "card_holder_name", "holder_name", "merchant_name", "name"]
+
+def _pick_column(df: pd.DataFrame, preferred: str, candidates: list):
+  if preferred and preferred in df.columns:
+    return preferred
+  return next((column for column in candidates if column in df.columns), None)
+
+def _ratio(numerator: float, denominator: float) -> float:
+  return round(float(numerator) / float(denominator), 4) if denominator else 0.0
+
+def repeated_surnames(names: pd.Series, top_k: int = 5) -> dict:
+  """
+  Conta sobrenomes (último nome) compartilhados por nomes distintos, indicativo de
+  concentração em uma mesma família.
+  """
+  names = names.dropna().astype(str).str.strip().str.upper().drop_duplicates()
+  parts = names.str.split()
+  surnames = parts[parts.str.len() > 1].str[-1]
+  counts = surnames.value_counts()
+  repeated = counts[counts > 1]
+  return {
+    "distinct_names": int(len(names)),
+    "names_with_repeated_surname": int(repeated.sum()),
+    "top_repeated_surnames": {surname: int(count) for surname, count in repeated.head(top_k).items()}
+  }
+
+def concentration_stats(rows, amount_column: str = None, name_column: str = None, top_k: int = STATS_TOP_K) -> dict:
+  """
+  Calcula estatísticas de concentração dos registros de uma seção.
+
+  Args:
+      rows (DataFrame | list): Registros da seção
+      amount_column (str): Coluna de valor (detectada em AMOUNT_COLUMNS se omitida)
+      name_column (str): Coluna de nome (detectada em NAME_COLUMNS se omitida)
+      top_k (int): Tamanho do top-K usado na participação acumulada
+
+  Returns:
+      dict: records, total, mean, max, hhi (0 a 10000), participação do top 1/3/K,
+            razão de valores redondos e de horários atípicos e repetição de sobrenomes
+  """
+  df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+  stats = {"records": int(len(df))}
+  if df.empty:
+    return stats
+  amount_column = _pick_column(df, amount_column, AMOUNT_COLUMNS)
+  name_column = _pick_column(df, name_column, NAME_COLUMNS)
+  if amount_column:
+    amounts = pd.to_numeric(df[amount_column], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    total = amounts.sum()
+    ordered = np.sort(amounts)[::-1]
+    shares = amounts / total if total > 0 else np.zeros_like(amounts)
+    stats.update({
+      "amount_column": amount_column,
+      "total": round(total, 2),
+      "mean": round(amounts.mean(), 2),
+      "max": round(ordered[0], 2),
+      "hhi": round(float((shares ** 2).sum()) * 10000, 1),
+      "top1_share": _ratio(ordered[:1].sum(), total),
+      "top3_share": _ratio(ordered[:3].sum(), total),
+      f"top{top_k}_share": _ratio(ordered[:top_k].sum(), total),
+      "round_amount_ratio": _ratio(np.count_nonzero((amounts > 0) & (np.mod(amounts, ROUND_AMOUNT_BASE) == 0)), len(amounts))
+    })
+    atypical_column = f"{amount_column}_atypical_hours"
+    if atypical_column in df.columns:
+      atypical = pd.to_numeric(df[atypical_column], errors="coerce").fillna(0.0).sum()
+      stats["atypical_hours_total"] = round(float(atypical), 2)
+      stats["atypical_hours_ratio"] = _ratio(atypical, total)
+  if name_column:
+    stats["name_column"] = name_column
+    stats["surnames"] = repeated_surnames(df[name_column])
+  return stats
+
+def summarize_report(report_data: dict) -> dict:
+  """
+  Etapa de extração de features entre o relatório e o prompt: resume as seções
+  volumosas (PIX, concentração de portadores, issuing e transações negadas) em
+  totais e índices calculados sobre todos os registros.
+
+  Args:
+      report_data (dict): Relatório gerado por merchant_report/cardholder_report
+
+  Returns:
+      dict: Estatísticas por seção, mais a relação entre Cash Out e Cash In PIX
+  """
+  summary = {}
+  for section, (amount_column, name_column) in SUMMARIZED_SECTIONS.items():
+    rows = report_data.get(section)
+    if rows is not None and len(rows):
+      summary[section] = concentration_stats(rows, amount_column, name_column)
+  cash_in_total = summary.get("pix_cash_in", {}).get("total", 0.0)
+  cash_out_total = summary.get("pix_cash_out", {}).get("total", 0.0)
+  if cash_in_total or cash_out_total:
+    summary["pix_cash_out_to_cash_in_ratio"] = _ratio(cash_out_total, cash_in_total)
+  return summary
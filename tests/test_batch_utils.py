@@ -0,0 +1,27 @@
+import json
+from batch_utils import LocalBatchBackend, get_batch_responses, parse_batch_output
+
+def output_line(custom_id, content=None, status_code=200, error=None):
+  body = {"choices": [{"message": {"content": content}}], "model": "gpt-4o-2024-11-20", "usage": {"prompt_tokens": 10, "completion_tokens": 2}}
+  if status_code != 200:
+    body = {"error": {"message": "Rate limit"}}
+  return json.dumps({"custom_id": custom_id, "response": None if error else {"status_code": status_code, "body": body}, "error": error})
+
+def test_parse_batch_output_separates_failures():
+  text = "\n".join([
+    output_line("1", "  Risco de Lavagem de Dinheiro: 3/10  "),
+    output_line("2", status_code=429),
+    output_line("3", error={"code": "context_length_exceeded", "message": "too long"}),
+    ""
+  ])
+  results, failed = parse_batch_output(text)
+  assert results["1"] == "Risco de Lavagem de Dinheiro: 3/10"
+  assert failed == {"2", "3"}
+  assert results["2"].startswith("An error occurred")
+  assert results["3"].startswith("Opa! Não consigo tankar")
+
+def test_get_batch_responses_with_local_backend(tmp_path, monkeypatch):
+  monkeypatch.setattr("batch_utils.OPENAI_BATCH_DIR", str(tmp_path))
+  backend = LocalBatchBackend(str(tmp_path), responder=lambda body: f"resposta para {body['messages'][1]['content']}")
+  responses = get_batch_responses({"a": "caso a", "b": "caso b"}, backend=backend)
+  assert responses == {"a": "resposta para caso a", "b": "resposta para caso b"}
@@ -0,0 +1,60 @@
+import os
+import pytest
+import pyarrow as pa
+from cache_utils import SQLiteCache, ParquetCache
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+  return SQLiteCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60)
+
+def test_sqlite_cache_roundtrip_and_stats(sqlite_cache):
+  assert sqlite_cache.get("a") is None
+  sqlite_cache.set("a", {"analysis": "texto", "score": 3})
+  assert sqlite_cache.get("a") == {"analysis": "texto", "score": 3}
+  stats = sqlite_cache.stats()
+  assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+def test_sqlite_cache_expired_entry_is_a_miss(sqlite_cache):
+  sqlite_cache.set("a", "valor", ttl_seconds=-1)
+  assert sqlite_cache.get("a") is None
+  assert sqlite_cache.stats()["entries"] == 0
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path):
+  cache = SQLiteCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, max_bytes=25)
+  for key in ("a", "b", "c"):
+    cache.set(key, "x" * 8)
+  cache.get("a")
+  with cache._lock:
+    cache._evict()
+  assert cache.get("b") is None
+  assert cache.get("a") == "x" * 8
+  assert cache.get("c") == "x" * 8
+
+def test_sqlite_cache_persists_across_instances(tmp_path):
+  path = str(tmp_path / "cache.sqlite")
+  SQLiteCache(path, ttl_seconds=60).set("a", [1, 2])
+  assert SQLiteCache(path, ttl_seconds=60).get("a") == [1, 2]
+
+def test_parquet_cache_ttl(tmp_path):
+  cache = ParquetCache(str(tmp_path))
+  table = pa.table({"user_id": [1, 2], "amount": [10.0, 20.0]})
+  cache.set("pix_cash_in", {"user_id": 1}, table)
+  assert cache.get("pix_cash_in", {"user_id": 1}, ttl_seconds=60).equals(table)
+  path = cache._path("pix_cash_in", {"user_id": 1})
+  os.utime(path, (0, 0))
+  assert cache.get("pix_cash_in", {"user_id": 1}, ttl_seconds=60) is None
+  assert cache.stats()["hits"] == 1
+
+def test_parquet_cache_invalidate_user_keeps_other_users(tmp_path):
+  cache = ParquetCache(str(tmp_path))
+  table = pa.table({"user_id": [1]})
+  for name in ("pix_cash_in", "lawsuit_data"):
+    for user_id in (1, 2):
+      cache.set(name, {"user_id": user_id}, table)
+  cache.set("batch_pix_cash_in", {"user_ids": [1, 2]}, table)
+  assert cache.invalidate(params={"user_id": 1}) == 2
+  assert cache.get("pix_cash_in", {"user_id": 2}, ttl_seconds=60) is not None
+  # Lotes são gravados pelo hash dos user_ids, então só saem removendo a query inteira
+  assert cache.get("batch_pix_cash_in", {"user_ids": [1, 2]}, ttl_seconds=60) is not None
+  assert cache.invalidate("batch_pix_cash_in") == 1
+  assert cache.invalidate() == 2
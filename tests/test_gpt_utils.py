@@ -0,0 +1,61 @@
+import json
+import pytest
+import gpt_utils
+
+STRUCTURED = json.dumps({
+  "analysis": "Movimentação compatível com o perfil.\n\nRisco de Lavagem de Dinheiro: 3/10",
+  "risk_score": 3,
+  "alineas": [],
+  "decision": "Caso normalizado com score 3/10.\nSem alíneas identificadas."
+})
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+  """Substitui get_chatgpt_response por respostas fixas, por modelo e formato."""
+  calls = []
+  answers = {}
+
+  def get_chatgpt_response(prompt, model="gpt-4o-2024-11-20", response_format=None, usage_totals=None):
+    kind = "structured" if response_format else model
+    calls.append(kind)
+    return answers[kind]
+
+  monkeypatch.setattr(gpt_utils, "get_chatgpt_response", get_chatgpt_response)
+  monkeypatch.setattr(gpt_utils, "LLM_STRUCTURED_OUTPUT", True)
+  return calls, answers
+
+def test_structured_response_in_single_call(fake_llm):
+  calls, answers = fake_llm
+  answers["structured"] = STRUCTURED
+  result = gpt_utils.get_analysis_and_decision("dados do caso")
+  assert calls == ["structured"]
+  assert result.endswith("Decisão Final:\nCaso normalizado com score 3/10.\nSem alíneas identificadas.")
+
+@pytest.mark.parametrize("error", [
+  "An error occurred: Connection error.",
+  "Opa! Não consigo tankar este caso, pois há muitas transações. Chame um analista humano - ou reptiliano - para resolver",
+])
+def test_api_error_is_returned_without_fallback(fake_llm, error):
+  calls, answers = fake_llm
+  answers["structured"] = error
+  assert gpt_utils.get_analysis_and_decision("dados do caso") == error
+  assert calls == ["structured"]
+
+def test_invalid_schema_falls_back_to_three_calls(fake_llm):
+  calls, answers = fake_llm
+  answers["structured"] = "{não é json"
+  answers["gpt-4o-2024-11-20"] = "Análise.\n\nRisco de Lavagem de Dinheiro: 7/10"
+  answers["o3-mini-2025-01-31"] = "Decisão em duas linhas."
+  result = gpt_utils.get_analysis_and_decision("dados do caso")
+  assert calls == ["structured", "gpt-4o-2024-11-20", "o3-mini-2025-01-31"]
+  assert result.endswith("Decisão Final:\nDecisão em duas linhas.")
+
+@pytest.mark.parametrize("text, score", [
+  ("Risco de Lavagem de Dinheiro: 7/10", 7),
+  ("**Risco de lavagem de dinheiro: 10/10**", 10),
+  ("Classificação de risco: 4 de 10", 4),
+  ("Score: 2/10", 2),
+  ("Sem classificação", None),
+])
+def test_parse_risk_score(text, score):
+  assert gpt_utils.parse_risk_score(text) == score
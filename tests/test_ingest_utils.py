@@ -0,0 +1,52 @@
+import datetime
+import pandas as pd
+import pytest
+import ingest_utils
+from state_utils import StateStore
+
+UTC = datetime.timezone.utc
+START = datetime.datetime(2025, 6, 1, tzinfo=UTC)
+
+def alert(user_id, minutes, alert_date="01-06-2025"):
+  return {
+    "user_id": user_id,
+    "alert_date": alert_date,
+    "alert_type": "CH Alert",
+    "score": None,
+    "features": None,
+    "alert_created_at": pd.Timestamp(START + datetime.timedelta(minutes=minutes)),
+    "business_validation": False
+  }
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+  store = StateStore(str(tmp_path / "state.sqlite"))
+  store.set(ingest_utils.ALERTS_WATERMARK_KEY, START.isoformat())
+  monkeypatch.setattr(ingest_utils, "state", store)
+  return store
+
+def test_watermark_advances_to_last_alert(state):
+  alerts = [alert(1, 10), alert(2, 30), alert(3, 20)]
+  ingest_utils.commit_alerts_watermark(alerts)
+  assert ingest_utils.get_alerts_watermark() == START + datetime.timedelta(minutes=30)
+
+def test_watermark_stops_just_before_first_failed_alert(state):
+  alerts = [alert(1, 10), alert(2, 20), alert(3, 30), alert(4, 40)]
+  ingest_utils.commit_alerts_watermark(alerts, failed=[alerts[3], alerts[1]])
+  watermark = ingest_utils.get_alerts_watermark()
+  assert watermark == START + datetime.timedelta(minutes=20) - datetime.timedelta(microseconds=1)
+  assert alerts[0]["alert_created_at"] <= watermark < alerts[1]["alert_created_at"]
+
+def test_watermark_never_moves_back(state):
+  ingest_utils.commit_alerts_watermark([alert(1, 30)])
+  ingest_utils.commit_alerts_watermark([alert(2, 10)], failed=[alert(2, 10)])
+  assert ingest_utils.get_alerts_watermark() == START + datetime.timedelta(minutes=30)
+
+def test_window_keeps_query_order_and_incremental_sorts_by_creation(state, monkeypatch):
+  rows = pd.DataFrame([alert(1, 20, "02-06-2025"), alert(2, 30, "01-06-2025"), alert(3, 10, "01-06-2025")])
+  monkeypatch.setattr(ingest_utils, "run_query", lambda name, **params: rows)
+  monkeypatch.setattr(ingest_utils, "high_value_users", lambda: {3})
+  assert [a["user_id"] for a in ingest_utils.fetch_window_alerts(2)] == [1, 2]
+  assert [a["user_id"] for a in ingest_utils.fetch_new_alerts()] == [1, 2]
+  monkeypatch.setattr(ingest_utils, "high_value_users", lambda: set())
+  assert [a["user_id"] for a in ingest_utils.fetch_new_alerts()] == [3, 1, 2]
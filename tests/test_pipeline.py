@@ -0,0 +1,119 @@
+import pandas as pd
+import pytest
+import requests
+import functions
+import pipeline
+from state_utils import RunLedger
+
+MERCHANT_ID = 7
+
+def merchant_alert(user_id=MERCHANT_ID):
+  return {"user_id": user_id, "alert_date": "01-06-2025", "alert_type": "Merchant_Pix Alert", "features": None, "business_validation": False}
+
+@pytest.fixture
+def fake_bigquery(monkeypatch):
+  """Substitui functions.run_query: a query em lote de merchant_info falha e as individuais respondem."""
+  queries = []
+
+  def run_query(name, refresh=False, **params):
+    queries.append(name)
+    if name == "batch_merchant_info":
+      raise RuntimeError("403 Quota exceeded")
+    if name == "merchant_info" and params.get("user_id") == MERCHANT_ID:
+      return pd.DataFrame([{"user_id": MERCHANT_ID, "name": "LOJA TESTE"}])
+    return pd.DataFrame()
+
+  monkeypatch.setattr(functions, "run_query", run_query)
+  return queries
+
+def test_failed_batch_source_propagates(fake_bigquery):
+  with pytest.raises(RuntimeError):
+    functions.batch_reports([merchant_alert()])
+
+def test_failed_batch_merchant_info_falls_back_to_individual_queries(fake_bigquery, monkeypatch):
+  monkeypatch.setattr(pipeline, "run_ledger", None)
+  prefetched = pipeline.prefetch_reports([merchant_alert()])
+  assert prefetched == {}
+  user_type, report = pipeline.build_user_report(merchant_alert(), prefetched_report=prefetched.get(MERCHANT_ID))
+  assert user_type == "Merchant"
+  assert report["merchant_info"]["name"] == "LOJA TESTE"
+  assert "cardholder_info" not in fake_bigquery
+
+ALERT = {"user_id": 42, "alert_date": "01-06-2025", "alert_type": "CH Alert", "features": None, "business_validation": False}
+ANALYSIS = "Sem indícios de lavagem.\n\nRisco de Lavagem de Dinheiro: 3/10"
+
+@pytest.fixture
+def offline_stages(tmp_path, monkeypatch):
+  """Etapas do pipeline com ledger temporário, relatório fixo e LLM/API de risco substituídos."""
+  calls = {"llm": 0, "post": 0}
+  answers = []
+  monkeypatch.setattr(pipeline, "run_ledger", RunLedger(str(tmp_path / "state.sqlite")))
+  monkeypatch.setattr(pipeline, "fetch_pep_data", lambda user_id: pd.DataFrame())
+  monkeypatch.setattr(pipeline, "build_user_report", lambda user_data, **kwargs: ("Cardholder", {"user_id": user_data["user_id"]}))
+  monkeypatch.setattr(pipeline, "prescreen", lambda report_data, user_type, alert_type: None)
+  monkeypatch.setattr(pipeline, "build_user_prompt", lambda user_data, **kwargs: ("Cardholder", "dados do caso"))
+
+  def analyze_prompt(prompt, mode):
+    calls["llm"] += 1
+    return answers.pop(0)
+
+  def send_payload(payload, key_master):
+    calls["post"] += 1
+    return '{"status": "ok"}'
+
+  monkeypatch.setattr(pipeline, "analyze_prompt", analyze_prompt)
+  monkeypatch.setattr(pipeline, "send_payload", send_payload)
+  return calls, answers
+
+def run(alerts, **kwargs):
+  return list(pipeline.run_pipeline(alerts, pipeline.build_stages(**kwargs)))
+
+@pytest.mark.parametrize("failure", [
+  "An error occurred: Connection error.",
+  "Opa! Não consigo tankar este caso, pois há muitas transações. Chame um analista humano - ou reptiliano - para resolver",
+  "Resposta sem classificação de risco.",
+])
+def test_resume_reanalyzes_alert_after_failed_llm_stage(offline_stages, failure):
+  calls, answers = offline_stages
+  answers.extend([failure, ANALYSIS])
+  run([ALERT], send=False)
+  assert pipeline.run_ledger.get(ALERT) is None
+  [result] = run([ALERT])
+  assert calls["llm"] == 2
+  assert result["value"]["export_payload"]["conclusion"] == "normal"
+  assert pipeline.run_ledger.get(ALERT)["status"] == "posted"
+
+def test_resume_reuses_analysis_and_skips_posted_alert(offline_stages):
+  calls, answers = offline_stages
+  answers.append(ANALYSIS)
+  run([ALERT], send=False)
+  [result] = run([ALERT])
+  assert (calls["llm"], calls["post"]) == (1, 1)
+  assert result["value"]["ledger"]["status"] == "analyzed"
+  [result] = run([ALERT])
+  assert (calls["llm"], calls["post"]) == (1, 1)
+  assert result["value"]["response_text"] == '{"status": "ok"}'
+
+def rejected_post(payload, key_master):
+  response = requests.Response()
+  response.status_code = 401
+  response._content = b'{"error": "unauthorized"}'
+  response.raise_for_status()
+
+def test_rejected_post_is_returned_to_the_app(offline_stages, monkeypatch):
+  _, answers = offline_stages
+  answers.append(ANALYSIS)
+  monkeypatch.setattr(pipeline, "send_payload", rejected_post)
+  [result] = run([ALERT])
+  assert result["error"] is None
+  assert result["value"]["response_status"] == 401
+  assert result["value"]["response_text"] == '{"error": "unauthorized"}'
+  assert pipeline.run_ledger.get(ALERT)["status"] == "analyzed"
+
+def test_rejected_post_fails_the_headless_run(offline_stages, monkeypatch):
+  _, answers = offline_stages
+  answers.append(ANALYSIS)
+  monkeypatch.setattr(pipeline, "send_payload", rejected_post)
+  [result] = run([ALERT], raise_post_errors=True)
+  assert isinstance(result["error"], requests.HTTPError)
+  assert result["stage"] == "post"
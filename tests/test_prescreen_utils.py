@@ -0,0 +1,81 @@
+import datetime
+import pandas as pd
+import pytest
+import prescreen_utils
+from prescreen_utils import prescreen
+
+SECTIONS = [
+  "issuing_concentration", "pix_cash_in", "pix_cash_out", "offense_history", "contacts", "devices",
+  "lawsuit_data", "denied_transactions", "business_data", "prison_transactions", "sanctions_history",
+  "denied_pix_transactions", "bets_pix_transfers"
+]
+
+def make_report(**overrides):
+  report = {
+    "user_id": 42,
+    "cardholder_info": {"name": "FULANO"},
+    "total_cash_in_pix": 0.0,
+    "total_cash_out_pix": 0.0,
+    "total_cash_in_pix_atypical_hours": 0.0,
+    "total_cash_out_pix_atypical_hours": 0.0,
+    "counterparty_analysis": {"top_cash_in_analysis": [], "top_cash_out_analysis": []},
+    **{section: pd.DataFrame() for section in SECTIONS}
+  }
+  report.update(overrides)
+  return report
+
+# Linha no formato retornado pela query alerts_since (ver ingest_utils.fetch_alerts)
+ALERT = {
+  "user_id": 42,
+  "alert_date": "01-06-2025",
+  "alert_type": "CH Alert",
+  "score": None,
+  "features": None,
+  "alert_created_at": datetime.datetime(2025, 6, 1, 12, tzinfo=datetime.timezone.utc),
+  "business_validation": False
+}
+
+SANCTIONED = {
+  "top_cash_in_analysis": [{"party_name": "CICLANO", "transaction_amount": 500.0, "sanctions": [{"type": "Current Sanction"}]}],
+  "top_cash_out_analysis": []
+}
+
+def test_trivial_case_with_real_alert_type_is_resolved():
+  result = prescreen(make_report(), "Cardholder", ALERT["alert_type"])
+  assert result["rule"] == "trivial"
+  assert result["description"].endswith(f"Risco de Lavagem de Dinheiro: {prescreen_utils.PRESCREEN_TRIVIAL_SCORE}/10")
+
+@pytest.mark.parametrize("overrides", [
+  {"total_cash_in_pix": 10.0},
+  {"lawsuit_data": pd.DataFrame([{"process": 1}])},
+  {"sanctions_history": pd.DataFrame([{"type": "x"}])},
+  {"denied_pix_transactions": pd.DataFrame([{"risk_check": "x"}])},
+  {"bets_pix_transfers": pd.DataFrame([{"amount": 1.0}])},
+])
+def test_any_signal_routes_to_llm(overrides):
+  assert prescreen(make_report(**overrides), "Cardholder", ALERT["alert_type"]) is None
+
+def test_trivial_alert_type_filter(monkeypatch):
+  monkeypatch.setattr(prescreen_utils, "PRESCREEN_TRIVIAL_ALERT_TYPES", ["Merchant_Pix Alert"])
+  assert prescreen(make_report(), "Cardholder", ALERT["alert_type"]) is None
+  assert prescreen(make_report(), "Cardholder", "Merchant_Pix Alert")["rule"] == "trivial"
+
+@pytest.mark.parametrize("overrides, rule", [
+  ({"prison_transactions": pd.DataFrame([{"status": "approved"}])}, "prison_transactions"),
+  ({"counterparty_analysis": SANCTIONED}, "current_sanction"),
+])
+def test_hard_positives_go_to_llm_by_default(overrides, rule):
+  before = prescreen_utils.get_prescreen_stats()["hard_positives"].get(rule, 0)
+  assert prescreen(make_report(**overrides), "Cardholder", ALERT["alert_type"]) is None
+  assert prescreen_utils.get_prescreen_stats()["hard_positives"][rule] == before + 1
+
+def test_hard_positive_auto_resolution_is_opt_in(monkeypatch):
+  monkeypatch.setattr(prescreen_utils, "PRESCREEN_HARD_POSITIVE_ACTION", "auto")
+  result = prescreen(make_report(counterparty_analysis=SANCTIONED), "Cardholder", ALERT["alert_type"])
+  assert result["rule"] == "current_sanction"
+  assert "CICLANO" in result["description"]
+  assert result["description"].endswith(f"Risco de Lavagem de Dinheiro: {prescreen_utils.PRESCREEN_HARD_POSITIVE_SCORE}/10")
+
+def test_disabled(monkeypatch):
+  monkeypatch.setattr(prescreen_utils, "PRESCREEN_ENABLED", False)
+  assert prescreen(make_report(), "Cardholder", ALERT["alert_type"]) is None
@@ -0,0 +1,50 @@
+import pandas as pd
+from gpt_utils import count_tokens
+from prompt_utils import COMPACTION_ORDER, _compaction_order, fit_sections, render_table, summarize_rows, top_rows
+
+def pix_rows(count: int) -> pd.DataFrame:
+  return pd.DataFrame({"party": [f"PARTE {i}" for i in range(count)], "pix_amount": [float(i + 1) * 100 for i in range(count)]})
+
+def render_prompt(rendered: dict) -> str:
+  return "\n\n".join(f"{name}:\n{text}" for name, text in rendered.items())
+
+def test_top_rows_keeps_largest_amounts():
+  assert top_rows(pix_rows(10), 3)["pix_amount"].tolist() == [1000.0, 900.0, 800.0]
+
+def test_summarize_rows_totals_cover_whole_section():
+  summary = summarize_rows(pix_rows(10), 2).splitlines()[-1]
+  assert "8 de 10 registros omitidos" in summary
+  assert "pix_amount somado dos omitidos: 3,600.00" in summary
+  assert "pix_amount total da seção: 5,500.00" in summary
+
+def test_fit_sections_within_budget_is_unchanged():
+  prompt = fit_sections({"pix_cash_in": pix_rows(3)}, render_prompt, budget=10000)
+  assert prompt.count("PARTE") == 3
+  assert "omitidos" not in prompt
+
+def test_fit_sections_row_limits_render_top_rows():
+  prompt = fit_sections({"pix_cash_in": pix_rows(30)}, render_prompt, budget=10000, row_limits={"pix_cash_in": 5})
+  assert prompt.count("PARTE") == 5
+  assert "PARTE 29" in prompt and "PARTE 0\t" not in prompt
+
+def test_fit_sections_compaction_summarizes_full_section():
+  sections = {"pix_cash_in": pix_rows(200), "user_info": {"name": "FULANO"}}
+  prompt = fit_sections(sections, render_prompt, budget=200, row_limits={"pix_cash_in": 50})
+  assert "FULANO" in prompt
+  assert "de 200 registros omitidos" in prompt
+  assert f"pix_amount total da seção: {pix_rows(200)['pix_amount'].sum():,.2f}" in prompt
+
+def test_compaction_order_protects_focus_sections_of_real_alert_types():
+  order = _compaction_order("Goverment_Corporate_Cards_Alert")
+  assert order[-1] == "transaction_concentration"
+  assert _compaction_order("CH Alert")[-2:] == ["pix_cash_out", "pix_cash_in"]
+  assert _compaction_order("Custom Alert") == COMPACTION_ORDER
+
+def test_fit_sections_compacts_focus_section_last():
+  rows = [{"merchant": f"LOJA {i}", "total_approved_by_ch": float(i)} for i in range(60)]
+  lawsuits = [{"process": f"PROCESSO {i}", "amount": float(i)} for i in range(60)]
+  sections = {"transaction_concentration": rows, "lawsuit_data": lawsuits}
+  budget = count_tokens(render_prompt({"transaction_concentration": render_table(rows), "lawsuit_data": ""})) + 100
+  prompt = fit_sections(sections, render_prompt, alert_type="Goverment_Corporate_Cards_Alert", budget=budget)
+  assert prompt.count("LOJA") == 60
+  assert "de 60 registros omitidos" in prompt
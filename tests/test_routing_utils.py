@@ -0,0 +1,78 @@
+import pytest
+import routing_utils
+from gpt_utils import usage_counts
+
+USAGE = {
+  "prompt_tokens": 1200,
+  "completion_tokens": 300,
+  "prompt_tokens_details": {"cached_tokens": 1024},
+  "completion_tokens_details": {"reasoning_tokens": 0}
+}
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+  """Substitui get_chatgpt_response: o modelo barato responde com o score configurado."""
+  monkeypatch.setattr(routing_utils, "_tier_stats", {})
+  monkeypatch.setattr(routing_utils, "_routing_stats", {"routed": 0, "direct": 0, "escalated": 0, "escalation_reasons": {}})
+  calls = []
+  answers = {routing_utils.ROUTING_STRONG_MODEL: "Análise do gpt-4o.\n\nRisco de Lavagem de Dinheiro: 7/10"}
+
+  def get_chatgpt_response(prompt, model, response_format=None, usage_totals=None):
+    calls.append(model)
+    if usage_totals is not None:
+      for name, value in usage_counts(USAGE).items():
+        usage_totals[name] = usage_totals.get(name, 0) + value
+    return answers[model]
+
+  monkeypatch.setattr(routing_utils, "get_chatgpt_response", get_chatgpt_response)
+  return calls, answers
+
+@pytest.mark.parametrize("cheap_answer, escalated, reason", [
+  ("Sem indícios.\n\nRisco de Lavagem de Dinheiro: 2/10", False, None),
+  ("Caso evidente.\n\nRisco de Lavagem de Dinheiro: 10/10", False, None),
+  ("Risco de Lavagem de Dinheiro: 4/10", False, None),
+  ("Risco de Lavagem de Dinheiro: 5/10", True, "uncertain_score"),
+  ("Risco de Lavagem de Dinheiro: 8/10", True, "uncertain_score"),
+  ("Risco de Lavagem de Dinheiro: 9/10", False, None),
+  ("Análise sem score.", True, "no_score"),
+  ("An error occurred: timeout", True, "error"),
+])
+def test_escalation_bands(fake_llm, cheap_answer, escalated, reason):
+  calls, answers = fake_llm
+  answers[routing_utils.ROUTING_CHEAP_MODEL] = cheap_answer
+  response = routing_utils.analyze_prompt("dados do caso", mode="routed")
+  stats = routing_utils.get_routing_stats()["routing"]
+  if escalated:
+    assert calls == [routing_utils.ROUTING_CHEAP_MODEL, routing_utils.ROUTING_STRONG_MODEL]
+    assert response == answers[routing_utils.ROUTING_STRONG_MODEL]
+    assert stats["escalation_reasons"] == {reason: 1}
+  else:
+    assert calls == [routing_utils.ROUTING_CHEAP_MODEL]
+    assert response == cheap_answer
+    assert stats["escalated"] == 0
+  assert stats["routed"] == 1
+
+def test_large_prompt_goes_straight_to_strong_model(fake_llm, monkeypatch):
+  calls, _ = fake_llm
+  monkeypatch.setattr(routing_utils, "ROUTING_MAX_CHEAP_PROMPT_TOKENS", 5)
+  routing_utils.analyze_prompt("dados do caso " * 20, mode="routed")
+  assert calls == [routing_utils.ROUTING_STRONG_MODEL]
+  assert routing_utils.get_routing_stats()["routing"]["direct"] == 1
+
+def test_tier_stats_use_api_usage(fake_llm):
+  calls, answers = fake_llm
+  answers[routing_utils.ROUTING_CHEAP_MODEL] = "Risco de Lavagem de Dinheiro: 6/10"
+  routing_utils.analyze_prompt("dados do caso", mode="Roteada (GPT-4o mini + GPT-4o)")
+  tiers = routing_utils.get_routing_stats()["tiers"]
+  for tier in ("cheap", "strong"):
+    assert tiers[tier]["calls"] == 1
+    assert tiers[tier]["prompt_tokens"] == 1200
+    assert tiers[tier]["cached_tokens"] == 1024
+    assert tiers[tier]["completion_tokens"] == 300
+
+def test_risk_score_mode_uses_o3_mini(fake_llm):
+  calls, answers = fake_llm
+  answers[routing_utils.RISK_SCORE_MODEL] = "Risco de Lavagem de Dinheiro: 6/10"
+  assert routing_utils.analyze_prompt("dados do caso", mode="Com Pontuação de Risco (o3-mini)") == "Risco de Lavagem de Dinheiro: 6/10"
+  assert calls == [routing_utils.RISK_SCORE_MODEL]
+  assert list(routing_utils.ANALYSIS_MODES)[2] == "Com Pontuação de Risco (o3-mini)"
@@ -0,0 +1,52 @@
+import pytest
+from state_utils import StateStore, RunLedger
+
+ALERT = {"user_id": 42, "alert_date": "01-06-2025", "alert_type": "CH Alert", "business_validation": False}
+PAYLOAD = {"user_id": 42, "description": "Risco de Lavagem de Dinheiro: 3/10", "conclusion": "normal"}
+
+@pytest.fixture
+def ledger(tmp_path):
+  return RunLedger(str(tmp_path / "state.sqlite"))
+
+def test_state_store_roundtrip(tmp_path):
+  path = str(tmp_path / "state.sqlite")
+  StateStore(path).set("alerts_watermark", "2025-06-01T12:00:00+00:00")
+  store = StateStore(path)
+  assert store.get("alerts_watermark") == "2025-06-01T12:00:00+00:00"
+  store.delete("alerts_watermark")
+  assert store.get("alerts_watermark", "vazio") == "vazio"
+
+def test_ledger_records_analysis_and_post(ledger):
+  assert ledger.get(ALERT) is None
+  ledger.record_analysis(ALERT, "Cardholder", PAYLOAD)
+  entry = ledger.get(ALERT)
+  assert (entry["status"], entry["user_type"], entry["payload"]) == ("analyzed", "Cardholder", PAYLOAD)
+  ledger.record_post(ALERT, "ok")
+  entry = ledger.get(ALERT)
+  assert (entry["status"], entry["response_text"]) == ("posted", "ok")
+
+def test_ledger_does_not_overwrite_posted_alert(ledger):
+  ledger.record_analysis(ALERT, "Cardholder", PAYLOAD)
+  ledger.record_post(ALERT, "ok")
+  ledger.record_analysis(ALERT, "Cardholder", dict(PAYLOAD, conclusion="suspicious"))
+  entry = ledger.get(ALERT)
+  assert entry["status"] == "posted"
+  assert entry["payload"] == PAYLOAD
+
+def test_ledger_key_is_per_alert(ledger):
+  ledger.record_analysis(ALERT, "Cardholder", PAYLOAD)
+  assert ledger.get(dict(ALERT, user_id="42"))["payload"] == PAYLOAD
+  assert ledger.get(dict(ALERT, alert_type="Merchant_Pix Alert")) is None
+  assert ledger.get(dict(ALERT, alert_date="02-06-2025")) is None
+
+def test_ledger_ignores_alerts_without_date(ledger):
+  manual = {"user_id": 42, "alert_date": None, "alert_type": "CH Alert"}
+  ledger.record_analysis(manual, "Cardholder", PAYLOAD)
+  assert RunLedger.key(manual) is None
+  assert ledger.get(manual) is None
+
+def test_ledger_retention(tmp_path):
+  path = str(tmp_path / "state.sqlite")
+  RunLedger(path).record_analysis(ALERT, "Cardholder", PAYLOAD)
+  assert RunLedger(path, retention_days=30).get(ALERT) is not None
+  assert RunLedger(path, retention_days=-1).get(ALERT) is None
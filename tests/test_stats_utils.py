@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+from stats_utils import concentration_stats, repeated_surnames
+
+def test_concentration_stats():
+  rows = pd.DataFrame({
+    "party": ["JOAO SILVA", "MARIA SILVA", "PEDRO SOUZA", "ANA LIMA"],
+    "pix_amount": [500.0, 250.0, 150.0, 100.0],
+    "pix_amount_atypical_hours": [100.0, 0.0, 0.0, 0.0]
+  })
+  stats = concentration_stats(rows, top_k=2)
+  assert stats["records"] == 4
+  assert stats["amount_column"] == "pix_amount"
+  assert stats["total"] == 1000.0
+  assert stats["max"] == 500.0
+  assert stats["hhi"] == pytest.approx(3450.0)
+  assert stats["top1_share"] == 0.5
+  assert stats["top2_share"] == 0.75
+  assert stats["round_amount_ratio"] == 0.5
+  assert stats["atypical_hours_ratio"] == 0.1
+  assert stats["surnames"]["names_with_repeated_surname"] == 2
+
+def test_concentration_stats_empty():
+  assert concentration_stats([]) == {"records": 0}
+
+def test_repeated_surnames_ignores_duplicates_and_single_names():
+  surnames = repeated_surnames(pd.Series(["Joao Silva", "JOAO SILVA", "Maria Silva", "Cher", None]))
+  assert surnames["distinct_names"] == 3
+  assert surnames["names_with_repeated_surname"] == 2